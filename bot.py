@@ -1,15 +1,39 @@
 import discord
 from discord.ext import commands
 import asyncio
+import argparse
+import csv
+import gzip
+import io
+import math
 import random
 import sqlite3
 import os
-from datetime import datetime, timedelta
-from typing import Tuple, Dict, List # Added for type hints in games class
-from flask import Flask
-from threading import Thread
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+import bisect
+import functools
+import heapq
+import itertools
+import json
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager, redirect_stdout
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+from typing import Tuple, Dict, List, Callable, Any, Optional, Iterator, Iterable, Hashable, Protocol # Added for type hints in games class
+from aiohttp import web
 from discord.ext.commands import CheckFailure
 
+try:
+    import numpy as np  # Only needed by the RTP simulator
+except ImportError:
+    np = None
+
 
 # --- Configuration (from config.py) ---
 """
@@ -22,8 +46,34 @@ INITIAL_BALANCE = 0
 MIN_BET = 50
 MAX_BET =5000
 
+# Bulk play
+MAX_BULK_ROUNDS = 100   # Most rounds a single command may play (e.g. .slots 50 x100)
+
 # Cooldown times (in seconds)
 GAMBLING_COOLDOWN = 3   # 3 seconds between gambling commands
+COOLDOWN_POLICIES = {   # Per-command defaults, guilds can override at runtime
+    "flip": GAMBLING_COOLDOWN,
+    "dice": GAMBLING_COOLDOWN,
+    "slots": GAMBLING_COOLDOWN
+}
+COOLDOWN_SNAPSHOT_INTERVAL = 10   # Seconds between batched cooldown snapshots to disk
+COOLDOWN_SWEEP_INTERVAL = 300     # Seconds between deletions of expired cooldown rows
+
+# RTP simulator defaults
+SIMULATION_ROUNDS = 10_000_000    # Rounds per game
+SIMULATION_CHUNK = 1_000_000      # Rounds drawn per NumPy batch (bounds memory per worker)
+SIMULATION_BET = 100              # Bet size used for payouts (payouts are truncated to whole coins)
+
+# Load benchmark defaults
+BENCHMARK_MIX = {                 # Relative frequency of each command
+    "flip": 25,
+    "dice": 20,
+    "slots": 30,
+    "balance": 10,
+    "stats": 10,
+    "leaderboard": 5
+}
+BENCHMARK_RESULTS_FILE = "benchmark_results.json"
 
 # Game multipliers and odds
 COIN_FLIP_MULTIPLIER = 1.5
@@ -43,196 +93,3585 @@ SLOTS_SYMBOLS = {
     "💎": 10,
     "7️⃣": 3
 }
+SLOTS_JACKPOT_SYMBOL = "7️⃣"
+SLOTS_REELS = 3                   # Symbols on a payline
+SLOTS_ROWS = 1                    # Visible rows per reel
+SLOTS_PAYLINES = [(0, 0, 0)]      # Row read from each reel, per payline; the bet is split evenly across lines
+
+# Random number generation
+RNG_MODE = "system"               # "system": buffered CSPRNG draws; "seeded": deterministic per-guild streams for replay
+RNG_SEED = 0                      # Base seed for "seeded" mode
+RNG_BLOCK_SIZE = 4096             # Draws generated per buffer block
+RNG_PREFETCH_BLOCKS = 4           # Blocks kept ready by the background refill thread
+
+# Health and metrics HTTP server
+HTTP_HOST = "0.0.0.0"
+HTTP_PORT = int(os.getenv("PORT", "8080"))
+READY_DB_TIMEOUT = 2.0            # Seconds /readyz waits for a write lock before reporting not ready
+
+# Outbound message dispatch
+DISPATCH_RATE = 5                 # Messages per channel per DISPATCH_PER seconds (Discord's channel send limit)
+DISPATCH_PER = 5.0
+DISPATCH_COALESCE_MAX = 10        # Game results merged into one embed when a channel is backed up
+DISPATCH_DRAIN_TIMEOUT = 10.0     # Seconds shutdown waits for queued messages
+
+# Latency instrumentation
+PERF_WINDOW_MINUTES = 60          # History kept for the perf command, in one-minute slices
+SLOW_QUERY_THRESHOLD = 0.1        # Database calls slower than this (seconds) are logged with their SQL
+SLOW_QUERY_LOG_SIZE = 50          # Recent slow calls kept for the perf command
 
 # Database file
 DATABASE_FILE = "gambling_bot.db"
 
+# Guild partitioning and sharding
+DB_PARTITIONS = int(os.getenv("DB_PARTITIONS", "1"))  # SQLite files guilds are spread over (1 = DATABASE_FILE only)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None  # None lets discord.py decide
+SHARD_IDS = [int(i) for i in os.getenv("SHARD_IDS").split(",")] if os.getenv("SHARD_IDS") else None  # Shards run by this process
+MEMBERS_INTENT = os.getenv("MEMBERS_INTENT", "0") == "1"  # Privileged, also enable "Server Members Intent" in the Developer Portal (giverole needs it)
+
+# Storage engine
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "sqlite")  # "sqlite" (partitioned files) or "memory" (single process)
+MEMORY_CHECKPOINT_FILE = os.getenv("MEMORY_CHECKPOINT_FILE", DATABASE_FILE) or None  # Memory engine's SQLite checkpoint, empty for none
+MEMORY_CHECKPOINT_INTERVAL = 60   # Seconds between memory engine checkpoints and cleanups
+
+# Bulk admin operations
+BULK_CHUNK_SIZE = 500             # Users written per transaction
+BULK_PROGRESS_INTERVAL = 2.0      # Min seconds between progress message edits
+
+# Guild data export
+EXPORT_FETCH_SIZE = 5000          # Rows pulled from SQLite per fetchmany
+EXPORT_PART_SIZE = 7 * 1024 * 1024  # Compressed bytes per output file, under Discord's upload limit
+
+# Schema migrations
+MIGRATE_INDEXES_ONLINE = True     # Build new indexes in the background after startup rather than before it
+
+# Per-guild settings
+GUILD_CONFIG_REFRESH_INTERVAL = 30  # Seconds between checks for settings changed by another process
+
+# Online backups
+BACKUP_DIR = "backups"            # Where database snapshots are written
+BACKUP_INTERVAL = 6 * 3600        # Seconds between scheduled backups, 0 disables them
+BACKUP_KEEP = 7                   # Snapshots kept per database file, the oldest are deleted first
+BACKUP_STEP_PAGES = 256           # Pages copied per backup step
+BACKUP_STEP_SLEEP = 0.005         # Seconds between steps, leaving disk time to the bot's own writes
+
+# Database connection tuning
+DB_READER_POOL_SIZE = 4           # Reader connections (and reader threads)
+DB_STATEMENT_CACHE_SIZE = 128     # Prepared statements cached per connection
+DB_BUSY_TIMEOUT = 5.0             # Seconds to wait on a locked database
+DB_CACHE_SIZE_KB = 16384          # Page cache per connection (KiB)
+DB_MMAP_SIZE = 128 * 1024 * 1024  # Memory-mapped I/O window (bytes)
+
+# Write-behind settlement queue
+SETTLEMENT_WRITE_BEHIND = True    # Coalesce game settlements into group commits
+SETTLEMENT_FLUSH_INTERVAL = 0.005 # Durability window: max seconds a settlement waits for commit
+SETTLEMENT_FLUSH_BATCH = 500      # Flush early once this many operations are pending
+SETTLEMENT_MAX_PENDING = 5000     # Callers wait for a flush beyond this many pending operations
+
+# In-process user row cache
+USER_CACHE_SIZE = 50000           # Max cached (user_id, guild_id) rows, least recently used evicted first
+USER_CACHE_TTL = 300              # Seconds before a cached row is re-read from disk
+
+# Leaderboards
+LEADERBOARD_SIZE = 10             # Players shown by the leaderboard command
+LEADERBOARD_TRACKED = 50          # Players kept in memory per guild, slack for players dropping out
+RANKING_GUILDS_CACHED = 100       # Guilds whose full ranking is kept in memory for rank and page lookups
+RANKING_LOAD_CHUNK = 5000         # Rows per keyset page when loading a guild's ranking
+
+# User name resolution
+NAME_CACHE_SIZE = 10000           # Resolved names kept in memory
+NAME_CACHE_TTL = 3600             # Seconds a resolved name is trusted
+NAME_FETCH_CONCURRENCY = 5        # Max parallel user fetches from the Discord API
+
+
+# --- Metrics ---
+"""
+Prometheus-format metrics for the Discord gambling bot
+"""
+def _format_metric_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float('inf'), float('-inf')):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _collect(name: str, collect: Callable[[], Any]) -> Dict[tuple, float]:
+    """Values from a scrape-time callback, which returns a number or {label_values: number}"""
+    try:
+        collected = collect()
+    except Exception as e:
+        print(f"Metric {name} failed to collect: {e}")
+        return {}
+    return collected if isinstance(collected, dict) else {(): collected}
+
+
+class Counter:
+    """A value that only goes up, incremented with inc() or read at scrape time by collect()"""
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 collect: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.collect = collect  # Reads totals some component already keeps; they must never decrease
+        self._values: Dict[tuple, float] = {}
+    
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def render(self) -> List[str]:
+        values = _collect(self.name, self.collect) if self.collect is not None else self._values
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_metric_value(value)}")
+        return lines
+
+
+class Gauge:
+    """A settable value, or one computed at scrape time by collect()"""
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 collect: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.collect = collect  # Returns a number, or {label_values: number} for labelled gauges
+        self._values: Dict[tuple, float] = {}
+    
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+    
+    def render(self) -> List[str]:
+        values = _collect(self.name, self.collect) if self.collect is not None else self._values
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for label_values, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_metric_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram"""
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, List[float]] = {}  # bucket counts..., +Inf count, sum
+    
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labels + ("le",)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = _format_labels(bucket_labels, label_values + (_format_metric_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_metric_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format"""
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+    
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                collect: Optional[Callable[[], Any]] = None) -> Counter:
+        return self._register(Counter(name, help_text, labels, collect))
+    
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+              collect: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, labels, collect))
+    
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class LatencyTracker:
+    """
+    Fixed-bucket latency histograms per operation, kept in one-minute slices
+    so percentiles can be reported for any recent window. Only touched from
+    the event loop thread.
+    """
+    BUCKETS = tuple(0.0001 * 1.5 ** i for i in range(34))  # 0.1 ms .. ~90 s
+    
+    def __init__(self, window_minutes: int = PERF_WINDOW_MINUTES):
+        self.window_minutes = window_minutes
+        self._slices: "OrderedDict[int, Dict[str, List[float]]]" = OrderedDict()
+    
+    def record(self, name: str, seconds: float):
+        minute = int(time.monotonic() // 60)
+        current = self._slices.get(minute)
+        if current is None:
+            current = self._slices[minute] = {}
+            while self._slices and next(iter(self._slices)) <= minute - self.window_minutes:
+                self._slices.popitem(last=False)
+        
+        series = current.get(name)
+        if series is None:
+            # Bucket counts, overflow count, then count, total and max
+            series = current[name] = [0] * (len(self.BUCKETS) + 1) + [0, 0.0, 0.0]
+        series[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        series[-3] += 1
+        series[-2] += seconds
+        if seconds > series[-1]:
+            series[-1] = seconds
+    
+    def _percentile(self, counts: List[int], total: int, q: float) -> float:
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.BUCKETS[index - 1] if index > 0 else 0.0
+                upper = self.BUCKETS[index] if index < len(self.BUCKETS) else self.BUCKETS[-1] * 1.5
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+    
+    def summary(self, minutes: int) -> List[Dict[str, Any]]:
+        """Per-operation stats over the last N minutes, slowest total time first"""
+        oldest = int(time.monotonic() // 60) - minutes + 1
+        merged: Dict[str, List[float]] = {}
+        for minute, series_by_name in self._slices.items():
+            if minute < oldest:
+                continue
+            for name, series in series_by_name.items():
+                target = merged.get(name)
+                if target is None:
+                    merged[name] = list(series)
+                    continue
+                for i in range(len(series) - 1):
+                    target[i] += series[i]
+                target[-1] = max(target[-1], series[-1])
+        
+        rows = []
+        for name, series in merged.items():
+            counts, count = series[:-3], int(series[-3])
+            rows.append({
+                'name': name,
+                'count': count,
+                'total': series[-2],
+                'mean': series[-2] / count,
+                'max': series[-1],
+                'p50': min(self._percentile(counts, count, 0.50), series[-1]),
+                'p95': min(self._percentile(counts, count, 0.95), series[-1]),
+                'p99': min(self._percentile(counts, count, 0.99), series[-1])
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+
+def instrument_methods(prefix: str):
+    """Class decorator: time every public coroutine method into the latency tracker"""
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not asyncio.iscoroutinefunction(method):
+                continue
+            
+            def wrap(method, label):
+                @functools.wraps(method)
+                async def timed(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await method(*args, **kwargs)
+                    finally:
+                        latency.record(label, time.perf_counter() - started)
+                return timed
+            setattr(cls, name, wrap(method, f"{prefix}.{name}"))
+        return cls
+    return decorate
+
+
+metrics = MetricsRegistry()
+latency = LatencyTracker()
+slow_queries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)  # (wall time, seconds, description), appended from DB threads
+COMMANDS_TOTAL = metrics.counter("casino_commands_total", "Commands handled, by command and outcome", ("command", "status"))
+COMMAND_SECONDS = metrics.histogram("casino_command_seconds", "Command handler latency", ("command",))
+DB_QUERY_SECONDS = metrics.histogram("casino_db_query_seconds", "Database call latency as seen by callers", ("kind",))
+
+
+# --- Connection Pool ---
+"""
+Persistent SQLite connections for the Discord gambling bot
+"""
+class ConnectionPool:
+    """
+    One long-lived writer connection and a small pool of reader connections.
+    Every call runs on a dedicated executor thread, so the event loop never
+    blocks on disk. Writes are serialized on a single thread; reads run in
+    parallel against the WAL snapshot.
+    """
+    def __init__(self, db_file: str, readers: int = DB_READER_POOL_SIZE):
+        self.db_file = db_file
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._closed = False
+        self.pending_writes = 0
+        self.pending_reads = 0
+    
+    def _connect(self, writer: bool) -> sqlite3.Connection:
+        """Open a connection with tuned pragmas"""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE
+        )
+        if writer:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if not writer:
+            conn.execute('PRAGMA query_only = ON')
+        
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _connection(self, writer: bool) -> sqlite3.Connection:
+        """Get the connection owned by the current executor thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect(writer)
+            self._local.conn = conn
+        return conn
+    
+    def _run_write(self, fn: Callable, args: tuple):
+        conn = self._connection(writer=True)
+        started = time.perf_counter()
+        try:
+            with conn:  # Commits on success, rolls back on error
+                return fn(conn, *args)
+        finally:
+            self._check_slow("write", fn, args, time.perf_counter() - started)
+    
+    def _run_read(self, fn: Callable, args: tuple):
+        conn = self._connection(writer=False)
+        started = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._check_slow("read", fn, args, time.perf_counter() - started)
+    
+    @staticmethod
+    def _check_slow(kind: str, fn: Callable, args: tuple, elapsed: float):
+        if elapsed < SLOW_QUERY_THRESHOLD:
+            return
+        if fn in (ConnectionPool._execute, ConnectionPool._fetchone, ConnectionPool._fetchall):
+            sql, params = args
+            description = f"{' '.join(sql.split())} params={params!r}"
+        else:
+            description = f"{getattr(fn, '__qualname__', repr(fn))} args={args!r}"
+        if len(description) > 500:
+            description = description[:497] + "..."
+        slow_queries.append((datetime.now(timezone.utc), elapsed, description))
+        print(f"Slow {kind} ({elapsed * 1000:.1f} ms): {description}")
+    
+    async def write(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(conn, *args) in a single transaction on the writer thread"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.pending_writes += 1
+        try:
+            return await loop.run_in_executor(self._writer, self._run_write, fn, args)
+        finally:
+            self.pending_writes -= 1
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, "write")
+    
+    async def read(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(conn, *args) on a reader thread"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.pending_reads += 1
+        try:
+            return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+        finally:
+            self.pending_reads -= 1
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, "read")
+    
+    def write_sync(self, fn: Callable[..., Any], *args) -> Any:
+        """Blocking variant of write() for use outside the event loop"""
+        return self._writer.submit(self._run_write, fn, args).result()
+    
+    @staticmethod
+    def _execute(conn: sqlite3.Connection, sql: str, params: tuple) -> int:
+        return conn.execute(sql, params).rowcount
+    
+    @staticmethod
+    def _fetchone(conn: sqlite3.Connection, sql: str, params: tuple):
+        return conn.execute(sql, params).fetchone()
+    
+    @staticmethod
+    def _fetchall(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+        return conn.execute(sql, params).fetchall()
+    
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Execute a single write statement, return the affected row count"""
+        return await self.write(self._execute, sql, params)
+    
+    async def fetchone(self, sql: str, params: tuple = ()):
+        """Fetch a single row"""
+        return await self.read(self._fetchone, sql, params)
+    
+    async def fetchall(self, sql: str, params: tuple = ()) -> list:
+        """Fetch all rows"""
+        return await self.read(self._fetchall, sql, params)
+    
+    def close(self):
+        """Drain pending work and close every connection"""
+        if self._closed:
+            return
+        self._closed = True
+        
+        try:
+            self._writer.submit(lambda: self._connection(writer=True).execute('PRAGMA optimize')).result()
+        except sqlite3.Error as e:
+            print(f"PRAGMA optimize failed: {e}")
+        
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+# --- Game Ledger ---
+"""
+Append-only record of settled games with incrementally maintained rollups
+"""
+class GameLedger:
+    """
+    Every settlement appends one ledger row (a bulk play is one row covering
+    all its rounds). In the same transaction the rows are folded into
+    per-user/per-game totals plus hourly and daily buckets, so statistics
+    never have to scan the ledger.
+    """
+    GAMES = {"flip": 1, "dice": 2, "slots": 3}
+    NAMES = {code: name for name, code in GAMES.items()}
+    ROLLUPS = (("game_stats", None), ("game_stats_hourly", 3600), ("game_stats_daily", 86400))
+    
+    @classmethod
+    def entry(cls, user_id: int, guild_id: int, game: str, rounds: int, wins: int,
+              bet: int, payout: int, timestamp: Optional[float] = None) -> tuple:
+        """Ledger row for one settlement; bet and payout are totals over all rounds"""
+        return (user_id, guild_id, cls.GAMES[game], rounds, wins, bet, payout,
+                int(time.time() if timestamp is None else timestamp))
+    
+    @staticmethod
+    def create_tables(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS game_ledger (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                guild_id INTEGER NOT NULL,
+                game INTEGER NOT NULL,
+                rounds INTEGER NOT NULL,
+                wins INTEGER NOT NULL,
+                bet INTEGER NOT NULL,
+                payout INTEGER NOT NULL,
+                ts INTEGER NOT NULL
+            )
+        ''')
+        for table, bucket_seconds in GameLedger.ROLLUPS:
+            bucket = "bucket INTEGER NOT NULL," if bucket_seconds else ""
+            key = "user_id, guild_id, bucket, game" if bucket_seconds else "user_id, guild_id, game"
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    {bucket}
+                    game INTEGER NOT NULL,
+                    rounds INTEGER NOT NULL,
+                    wins INTEGER NOT NULL,
+                    wagered INTEGER NOT NULL,
+                    paid_out INTEGER NOT NULL,
+                    PRIMARY KEY ({key})
+                ) WITHOUT ROWID
+            ''')
+    
+    @staticmethod
+    def write(conn: sqlite3.Connection, entries: List[tuple]):
+        """Append entries and fold them into the rollups, inside the caller's transaction"""
+        if not entries:
+            return
+        conn.executemany(
+            '''INSERT INTO game_ledger (user_id, guild_id, game, rounds, wins, bet, payout, ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            entries
+        )
+        
+        for table, bucket_seconds in GameLedger.ROLLUPS:
+            # Pre-aggregate so each rollup row is upserted once per batch
+            sums: Dict[tuple, List[int]] = {}
+            for user_id, guild_id, game, rounds, wins, bet, payout, ts in entries:
+                key = (user_id, guild_id, ts - ts % bucket_seconds, game) if bucket_seconds else (user_id, guild_id, game)
+                total = sums.get(key)
+                if total is None:
+                    sums[key] = [rounds, wins, bet, payout]
+                else:
+                    total[0] += rounds
+                    total[1] += wins
+                    total[2] += bet
+                    total[3] += payout
+            
+            columns = "user_id, guild_id, bucket, game" if bucket_seconds else "user_id, guild_id, game"
+            conn.executemany(
+                f'''INSERT INTO {table} ({columns}, rounds, wins, wagered, paid_out)
+                   VALUES ({", ".join("?" * (len(columns.split(",")) + 4))})
+                   ON CONFLICT ({columns}) DO UPDATE SET
+                   rounds = rounds + excluded.rounds,
+                   wins = wins + excluded.wins,
+                   wagered = wagered + excluded.wagered,
+                   paid_out = paid_out + excluded.paid_out''',
+                [key + tuple(total) for key, total in sums.items()]
+            )
+    
+    @staticmethod
+    def fetch_summary(conn: sqlite3.Connection, user_id: int, guild_id: int,
+                      now: Optional[float] = None) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        Per-game totals and recent windows for a user, read from the rollups only
+        Windows are bucket aligned: the current hour, the last 24 hourly buckets and the last 7 days
+        """
+        now = int(time.time() if now is None else now)
+        hour = now - now % 3600
+        day = now - now % 86400
+        
+        def collect(rows) -> Dict[str, Dict[str, int]]:
+            return {
+                GameLedger.NAMES.get(game, str(game)): {'rounds': rounds, 'wins': wins,
+                                                        'wagered': wagered, 'paid_out': paid_out}
+                for game, rounds, wins, wagered, paid_out in rows
+            }
+        
+        columns = "game, SUM(rounds), SUM(wins), SUM(wagered), SUM(paid_out)"
+        games = collect(conn.execute(
+            'SELECT game, rounds, wins, wagered, paid_out FROM game_stats WHERE user_id = ? AND guild_id = ?',
+            (user_id, guild_id)
+        ))
+        windows = {}
+        for window, table, since in (("hour", "game_stats_hourly", hour),
+                                     ("day", "game_stats_hourly", hour - 23 * 3600),
+                                     ("week", "game_stats_daily", day - 6 * 86400)):
+            windows[window] = collect(conn.execute(
+                f'SELECT {columns} FROM {table} WHERE user_id = ? AND guild_id = ? AND bucket >= ? GROUP BY game',
+                (user_id, guild_id, since)
+            ))
+        return {'games': games, 'windows': windows}
+
+
+# --- Settlement Queue ---
+"""
+Write-behind settlement pipeline for the Discord gambling bot
+"""
+class UserRow:
+    """Balance and statistics of one user, also used for pending deltas"""
+    __slots__ = ('balance', 'total_winnings', 'total_losses', 'games_played')
+    
+    def __init__(self, balance: int = 0, total_winnings: int = 0, total_losses: int = 0, games_played: int = 0):
+        self.balance = balance
+        self.total_winnings = total_winnings
+        self.total_losses = total_losses
+        self.games_played = games_played
+    
+    def add(self, balance: int, winnings: int, losses: int, games: int):
+        self.balance += balance
+        self.total_winnings += winnings
+        self.total_losses += losses
+        self.games_played += games
+    
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'balance': self.balance,
+            'total_winnings': self.total_winnings,
+            'total_losses': self.total_losses,
+            'games_played': self.games_played
+        }
+    
+    @staticmethod
+    def fetch(conn: sqlite3.Connection, user_id: int, guild_id: int):
+        """Read the raw row for a user, or None"""
+        return conn.execute(
+            '''SELECT balance, total_winnings, total_losses, games_played 
+               FROM users WHERE user_id = ? AND guild_id = ?''',
+            (user_id, guild_id)
+        ).fetchone()
+
+
+class SettlementQueue:
+    """
+    Coalesces balance/stat deltas per (user_id, guild_id) and commits them in one
+    transaction every flush_interval seconds or batch_size operations.
+    
+    While a user has uncommitted deltas the queue holds their projected row, which
+    is the source of truth for balance checks and reads. Projections are dropped
+    once everything for the user is committed.
+    """
+    def __init__(self, pool: ConnectionPool, flush_interval: float = SETTLEMENT_FLUSH_INTERVAL,
+                 batch_size: int = SETTLEMENT_FLUSH_BATCH, max_pending: int = SETTLEMENT_MAX_PENDING,
+                 listener: Optional[Callable[[Tuple[int, int], UserRow], None]] = None,
+                 cache: Optional["UserCache"] = None):
+        self.pool = pool
+        self.listener = listener  # Called with every projected row change
+        self.cache = cache  # Write-through row cache projections are seeded from
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        
+        self._projected: Dict[Tuple[int, int], UserRow] = {}
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._pending: Dict[Tuple[int, int], UserRow] = {}
+        self._pending_ops = 0
+        self._ledger: List[tuple] = []
+        self._inflight: Dict[Tuple[int, int], int] = {}
+        
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._has_room: Optional[asyncio.Event] = None
+        self._loads_open: Optional[asyncio.Event] = None
+        self._load_holds = 0
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    @property
+    def depth(self) -> int:
+        """Number of operations waiting for commit"""
+        return self._pending_ops
+    
+    def _ensure_started(self):
+        if self._task is None:
+            self._flush_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._has_room = asyncio.Event()
+            self._has_room.set()
+            self._loads_open = asyncio.Event()
+            self._loads_open.set()
+            self._task = asyncio.create_task(self._flush_loop())
+    
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Settlement flush failed, retrying: {e}")
+                await asyncio.sleep(max(self.flush_interval, 0.1))
+    
+    def peek(self, user_id: int, guild_id: int) -> Optional[UserRow]:
+        """Projected row for a user with uncommitted deltas, if any"""
+        return self._projected.get((user_id, guild_id))
+    
+    def tracks(self, user_id: int, guild_id: int) -> bool:
+        """Whether a user has a projection, or one is being loaded"""
+        key = (user_id, guild_id)
+        return key in self._projected or key in self._loading
+    
+    @asynccontextmanager
+    async def hold_loads(self):
+        """
+        Delay new projection loads while rows are written outside the queue, so no
+        projection can be built from a snapshot taken before that write commits.
+        Existing projections keep working.
+        """
+        self._ensure_started()
+        self._load_holds += 1
+        self._loads_open.clear()
+        try:
+            yield
+        finally:
+            self._load_holds -= 1
+            if not self._load_holds:
+                self._loads_open.set()
+    
+    async def _projection(self, key: Tuple[int, int]) -> UserRow:
+        row = self._projected.get(key)
+        if row is not None:
+            return row
+        
+        # Single-flight load: concurrent callers for the same user share one read,
+        # so nobody can build a projection from a pre-commit snapshot
+        loader = self._loading.get(key)
+        if loader is None:
+            if not self._loads_open.is_set():
+                await self._loads_open.wait()
+                return await self._projection(key)
+            # The cache sees every committed and projected change, so a warm row needs no read
+            cached = self.cache.peek(key) if self.cache is not None else None
+            if cached is not None:
+                row = self._projected[key] = UserRow(cached.balance, cached.total_winnings,
+                                                     cached.total_losses, cached.games_played)
+                return row
+            loader = asyncio.ensure_future(self.pool.read(UserRow.fetch, *key))
+            self._loading[key] = loader
+            loader.add_done_callback(lambda _: self._loading.pop(key, None))
+        values = await loader
+        
+        row = self._projected.get(key)
+        if row is None:
+            row = UserRow(*values) if values else UserRow(INITIAL_BALANCE)
+            self._projected[key] = row
+        return row
+    
+    def _release(self, key: Tuple[int, int]):
+        if key not in self._pending and key not in self._inflight:
+            self._projected.pop(key, None)
+    
+    async def apply(self, user_id: int, guild_id: int, balance: int = 0, winnings: int = 0,
+                    losses: int = 0, games: int = 0, required: Optional[int] = None,
+                    absolute: Optional[int] = None, entry: Optional[tuple] = None) -> Optional[int]:
+        """
+        Queue a delta for a user. If required is given the delta is only applied
+        when the projected balance is at least that much; absolute replaces the
+        balance delta with whatever brings the balance to that value.
+        A ledger entry, if given, is committed in the same transaction as the delta.
+        Returns the projected balance, or None if the guard failed.
+        """
+        self._ensure_started()
+        while self._pending_ops >= self.max_pending and not self._closed:
+            # Backpressure: wait for the flusher to take the current batch
+            self._batch_full.set()
+            self._has_room.clear()
+            await self._has_room.wait()
+        
+        key = (user_id, guild_id)
+        row = await self._projection(key)
+        
+        if required is not None and row.balance < required:
+            self._release(key)
+            return None
+        
+        if absolute is not None:
+            balance = absolute - row.balance
+        row.add(balance, winnings, losses, games)
+        delta = self._pending.get(key)
+        if delta is None:
+            delta = self._pending[key] = UserRow()
+        delta.add(balance, winnings, losses, games)
+        if entry is not None:
+            self._ledger.append(entry)
+        if self.listener is not None:
+            self.listener(key, row)
+        
+        self._pending_ops += 1
+        self._wakeup.set()
+        if self._pending_ops >= self.batch_size:
+            self._batch_full.set()
+        
+        new_balance = row.balance
+        if self._closed:
+            # The flusher is gone, commit straight away
+            await self.flush()
+        return new_balance
+    
+    async def set_balance(self, user_id: int, guild_id: int, new_balance: int) -> int:
+        """Queue an absolute balance change"""
+        return await self.apply(user_id, guild_id, absolute=new_balance)
+    
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, batch: Dict[Tuple[int, int], UserRow], entries: List[tuple]):
+        conn.executemany(
+            f'''INSERT INTO users (user_id, guild_id, balance, total_winnings, total_losses, games_played)
+               VALUES (?, ?, {INITIAL_BALANCE} + ?, ?, ?, ?)
+               ON CONFLICT (user_id, guild_id) DO UPDATE SET
+               balance = balance + ?,
+               total_winnings = total_winnings + ?,
+               total_losses = total_losses + ?,
+               games_played = games_played + ?''',
+            [
+                (user_id, guild_id,
+                 d.balance, d.total_winnings, d.total_losses, d.games_played,
+                 d.balance, d.total_winnings, d.total_losses, d.games_played)
+                for (user_id, guild_id), d in batch.items()
+            ]
+        )
+        GameLedger.write(conn, entries)
+    
+    async def flush(self):
+        """Commit every pending delta in one transaction"""
+        if self._task is None:
+            return
+        
+        async with self._flush_lock:
+            if not self._pending:
+                self._wakeup.clear()
+                return
+            
+            batch, self._pending = self._pending, {}
+            entries, self._ledger = self._ledger, []
+            ops, self._pending_ops = self._pending_ops, 0
+            self._wakeup.clear()
+            self._batch_full.clear()
+            self._has_room.set()
+            for key in batch:
+                self._inflight[key] = self._inflight.get(key, 0) + 1
+            
+            try:
+                await self.pool.write(self._write_batch, batch, entries)
+            except Exception:
+                # Put the batch back so nothing is lost; the projections already include it
+                self._ledger[:0] = entries
+                for key, delta in batch.items():
+                    pending = self._pending.get(key)
+                    if pending is None:
+                        self._pending[key] = delta
+                    else:
+                        pending.add(delta.balance, delta.total_winnings, delta.total_losses, delta.games_played)
+                self._pending_ops += ops
+                self._wakeup.set()
+                raise
+            finally:
+                for key in batch:
+                    remaining = self._inflight[key] - 1
+                    if remaining:
+                        self._inflight[key] = remaining
+                    else:
+                        del self._inflight[key]
+                    self._release(key)
+    
+    async def close(self):
+        """Stop the flusher and commit everything still pending"""
+        if self._task is None or self._closed:
+            return
+        self._closed = True
+        self._has_room.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+
+
+# --- User Cache ---
+"""
+Write-through cache of user rows for the Discord gambling bot
+"""
+class CachedUser(UserRow):
+    __slots__ = ('expires_at',)
+
+
+class UserCache:
+    """
+    Bounded LRU cache of user rows keyed by (user_id, guild_id), with a TTL so
+    rows are periodically re-read from disk. Writers push new values through
+    put(); admin operations invalidate() instead.
+    """
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, int], CachedUser]" = OrderedDict()
+        self._loads: Dict[Tuple[int, int], int] = {}
+        self._load_seq = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def get(self, key: Tuple[int, int]) -> Optional[CachedUser]:
+        """Return the cached row, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def peek(self, key: Tuple[int, int]) -> Optional[CachedUser]:
+        """Return the cached row without counting a lookup or refreshing its LRU position"""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            return None
+        return entry
+    
+    def put(self, key: Tuple[int, int], row: UserRow):
+        """Store the latest values for a user"""
+        self._loads.pop(key, None)  # Any read in flight is now stale
+        self._store(key, row.balance, row.total_winnings, row.total_losses, row.games_played)
+    
+    def _store(self, key: Tuple[int, int], balance: int, winnings: int, losses: int, games: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = CachedUser()
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._entries.move_to_end(key)
+        
+        entry.balance = balance
+        entry.total_winnings = winnings
+        entry.total_losses = losses
+        entry.games_played = games
+        entry.expires_at = time.monotonic() + self.ttl
+    
+    def invalidate(self, key: Tuple[int, int]):
+        """Drop a user's row so the next read goes to disk"""
+        self._loads.pop(key, None)
+        self._entries.pop(key, None)
+    
+    def clear(self):
+        self._loads.clear()
+        self._entries.clear()
+    
+    def begin_load(self, key: Tuple[int, int]) -> int:
+        """Mark a disk read as started; returns a token for finish_load()"""
+        self._load_seq += 1
+        self._loads[key] = self._load_seq
+        return self._load_seq
+    
+    def finish_load(self, key: Tuple[int, int], token: int, values: Optional[tuple]):
+        """Cache a row read from disk, unless it was written or invalidated meanwhile"""
+        if self._loads.get(key) != token:
+            return
+        del self._loads[key]
+        if values is not None:
+            self._store(key, *values)
+
+
+# --- Leaderboards ---
+"""
+Incrementally maintained per-guild leaderboards for the Discord gambling bot
+"""
+class GuildLeaderboard:
+    """
+    In-memory top-K of one guild, ordered by balance (descending) then user_id.
+    Every player not tracked ranks below the last tracked player, so balance
+    changes can be applied without touching the database. When too many
+    tracked players drop out the board is marked stale and reloaded.
+    """
+    def __init__(self, capacity: int = LEADERBOARD_TRACKED, visible: int = LEADERBOARD_SIZE):
+        self.capacity = capacity
+        self.visible = visible
+        self.version = 0     # Bumped whenever the visible top changes
+        self.stale = True
+        self.truncated = False  # True if the guild has players beyond the tracked ones
+        self._balances: Dict[int, int] = {}
+        self._order: List[Tuple[int, int]] = []  # (-balance, user_id), ascending
+    
+    def load(self, rows: List[Tuple[int, int]]):
+        """Replace the board with rows from disk, best first"""
+        previous = self._order[:self.visible]
+        self._order = [(-balance, user_id) for user_id, balance in rows[:self.capacity]]
+        self._order.sort()
+        self._balances = {user_id: balance for user_id, balance in rows[:self.capacity]}
+        self.truncated = len(rows) >= self.capacity
+        self.stale = False
+        if self._order[:self.visible] != previous:
+            self.version += 1
+    
+    def update(self, user_id: int, balance: int):
+        """Apply a balance change"""
+        old = self._balances.get(user_id)
+        if old == balance:
+            return
+        
+        touched_top = False
+        if old is not None:
+            index = bisect.bisect_left(self._order, (-old, user_id))
+            del self._order[index]
+            del self._balances[user_id]
+            touched_top = index < self.visible
+        
+        entry = (-balance, user_id)
+        if not self.truncated or (self._order and entry < self._order[-1]):
+            index = bisect.bisect_left(self._order, entry)
+            self._order.insert(index, entry)
+            self._balances[user_id] = balance
+            touched_top = touched_top or index < self.visible
+            if len(self._order) > self.capacity:
+                dropped = self._order.pop()
+                del self._balances[dropped[1]]
+                self.truncated = True
+        
+        if self.truncated and len(self._order) < self.visible:
+            # Someone we don't track may now belong in the visible top
+            self.stale = True
+        if touched_top:
+            self.version += 1
+    
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """Best players as (user_id, balance) rows"""
+        return [(user_id, -neg_balance) for neg_balance, user_id in self._order[:limit]]
+
+
+class TreapNode:
+    __slots__ = ('key', 'priority', 'left', 'right', 'size')
+    
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.left: Optional["TreapNode"] = None
+        self.right: Optional["TreapNode"] = None
+        self.size = 1
+
+
+class OrderStatisticTree:
+    """
+    Treap over unique, comparable keys with subtree sizes, so insert, remove,
+    rank-of-key and key-at-position all take O(log n) expected time
+    """
+    def __init__(self):
+        self._root: Optional[TreapNode] = None
+    
+    def __len__(self) -> int:
+        return self._root.size if self._root else 0
+    
+    @staticmethod
+    def _size(node: Optional[TreapNode]) -> int:
+        return node.size if node else 0
+    
+    def _split(self, node: Optional[TreapNode], key) -> Tuple[Optional[TreapNode], Optional[TreapNode]]:
+        """Split into keys < key and keys >= key"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = self._split(node.right, key)
+            node.size = 1 + self._size(node.left) + self._size(node.right)
+            return node, right
+        left, node.left = self._split(node.left, key)
+        node.size = 1 + self._size(node.left) + self._size(node.right)
+        return left, node
+    
+    def _merge(self, left: Optional[TreapNode], right: Optional[TreapNode]) -> Optional[TreapNode]:
+        """Join two treaps where every key in left is smaller than every key in right"""
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.size = 1 + self._size(left.left) + self._size(left.right)
+            return left
+        right.left = self._merge(left, right.left)
+        right.size = 1 + self._size(right.left) + self._size(right.right)
+        return right
+    
+    def insert(self, key):
+        left, right = self._split(self._root, key)
+        self._root = self._merge(self._merge(left, TreapNode(key)), right)
+    
+    def remove(self, key):
+        """Remove a key that is in the tree"""
+        parent, node = None, self._root
+        path = []
+        while node is not None and node.key != key:
+            path.append(node)
+            parent, node = node, (node.left if key < node.key else node.right)
+        if node is None:
+            raise KeyError(key)
+        
+        replacement = self._merge(node.left, node.right)
+        if parent is None:
+            self._root = replacement
+        elif parent.left is node:
+            parent.left = replacement
+        else:
+            parent.right = replacement
+        for ancestor in path:
+            ancestor.size -= 1
+    
+    def rank(self, key) -> int:
+        """Number of keys smaller than key"""
+        count, node = 0, self._root
+        while node is not None:
+            if node.key < key:
+                count += self._size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+    
+    def slice(self, start: int, count: int) -> list:
+        """Up to count keys in order, starting at position start"""
+        # Walk down to the start position, remembering the nodes still to visit in order
+        stack, node = [], self._root
+        while node is not None:
+            left_size = self._size(node.left)
+            if start < left_size:
+                stack.append(node)
+                node = node.left
+            elif start == left_size:
+                stack.append(node)
+                break
+            else:
+                start -= left_size + 1
+                node = node.right
+        
+        keys = []
+        while stack and len(keys) < count:
+            node = stack.pop()
+            keys.append(node.key)
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+        return keys
+
+
+class GuildRanking:
+    """
+    Every player of one guild ordered by balance (descending) then user_id.
+    Answers a player's exact rank and any leaderboard page in O(log n).
+    """
+    def __init__(self):
+        self._balances: Dict[int, int] = {}
+        self._tree = OrderStatisticTree()
+    
+    def __len__(self) -> int:
+        return len(self._balances)
+    
+    def update(self, user_id: int, balance: int):
+        old = self._balances.get(user_id)
+        if old == balance:
+            return
+        if old is not None:
+            self._tree.remove((-old, user_id))
+        self._tree.insert((-balance, user_id))
+        self._balances[user_id] = balance
+    
+    def rank(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """1-based position and balance of a player, None if unranked"""
+        balance = self._balances.get(user_id)
+        if balance is None:
+            return None
+        return self._tree.rank((-balance, user_id)) + 1, balance
+    
+    def page(self, start: int, count: int) -> List[Tuple[int, int]]:
+        """(user_id, balance) rows from 0-based position start"""
+        return [(user_id, -neg_balance) for neg_balance, user_id in self._tree.slice(start, count)]
+
+
+# --- Cooldown Engine ---
+"""
+In-memory cooldowns with persistent snapshots for the Discord gambling bot
+"""
+class CooldownEngine:
+    """
+    Cooldowns live in memory as monotonic deadlines keyed by
+    (user_id, guild_id, command), so a check is a single dict lookup. A heap
+    orders deadlines for expiry. Changed cooldowns are written to the
+    cooldowns table in periodic batches, loaded back on startup, and expired
+    rows are swept from disk. Without a pool nothing is persisted and the
+    owner calls expire() itself.
+    """
+    def __init__(self, pool: Optional[ConnectionPool], policies: Dict[str, float] = COOLDOWN_POLICIES):
+        self.pool = pool
+        self.policies = dict(policies)
+        self._guild_policies: Dict[int, Dict[str, float]] = {}
+        self._deadlines: Dict[Tuple[int, int, str], float] = {}
+        self._expiry: List[Tuple[float, Tuple[int, int, str]]] = []
+        self._dirty: set = set()
+        self._tasks: List[asyncio.Task] = []
+    
+    def policy(self, guild_id: int, command: str) -> float:
+        """Cooldown length in seconds for a command in a guild"""
+        guild_policies = self._guild_policies.get(guild_id)
+        if guild_policies and command in guild_policies:
+            return guild_policies[command]
+        return self.policies.get(command, GAMBLING_COOLDOWN)
+    
+    def set_policy(self, guild_id: int, command: str, seconds: Optional[float]):
+        """Override a command's cooldown for one guild, None restores the default"""
+        guild_policies = self._guild_policies.setdefault(guild_id, {})
+        if seconds is None:
+            guild_policies.pop(command, None)
+        else:
+            guild_policies[command] = seconds
+    
+    def remaining(self, user_id: int, guild_id: int, command: str) -> float:
+        """Seconds left on a cooldown, 0 if none"""
+        deadline = self._deadlines.get((user_id, guild_id, command))
+        if deadline is None:
+            return 0.0
+        return max(0.0, deadline - time.monotonic())
+    
+    def start_cooldown(self, user_id: int, guild_id: int, command: str, seconds: float):
+        """Put a user on cooldown for a command"""
+        key = (user_id, guild_id, command)
+        deadline = time.monotonic() + seconds
+        self._deadlines[key] = deadline
+        heapq.heappush(self._expiry, (deadline, key))
+        self._dirty.add(key)
+    
+    def acquire(self, user_id: int, guild_id: int, command: str, seconds: Optional[float] = None) -> float:
+        """
+        Start a cooldown unless one is active
+        Returns the seconds remaining on the active cooldown, or 0 if it was started
+        """
+        remaining = self.remaining(user_id, guild_id, command)
+        if remaining > 0:
+            return remaining
+        if seconds is None:
+            seconds = self.policy(guild_id, command)
+        if seconds > 0:
+            self.start_cooldown(user_id, guild_id, command, seconds)
+        return 0.0
+    
+    def expire(self) -> int:
+        """Drop deadlines that have passed, returns how many were removed"""
+        now = time.monotonic()
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            deadline, key = heapq.heappop(self._expiry)
+            # A newer cooldown may have replaced this heap entry
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                self._dirty.discard(key)
+                removed += 1
+        return removed
+    
+    @staticmethod
+    def _wall_clock(seconds_from_now: float) -> str:
+        moment = datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now)
+        return moment.isoformat(timespec='microseconds')
+    
+    async def load(self):
+        """Restore unexpired cooldowns saved by a previous run"""
+        rows = await self.pool.fetchall(
+            'SELECT user_id, guild_id, command, expires_at FROM cooldowns WHERE expires_at > ?',
+            (self._wall_clock(0),)
+        )
+        now_wall = datetime.now(timezone.utc)
+        for user_id, guild_id, command, expires_at in rows:
+            try:
+                remaining = (datetime.fromisoformat(expires_at) - now_wall).total_seconds()
+            except ValueError:
+                continue
+            if remaining > 0 and (user_id, guild_id, command) not in self._deadlines:
+                self.start_cooldown(user_id, guild_id, command, remaining)
+        self._dirty.clear()
+    
+    async def snapshot(self):
+        """Write every cooldown changed since the last snapshot in one transaction"""
+        self.expire()
+        if not self._dirty:
+            return
+        
+        now = time.monotonic()
+        rows = []
+        for key in self._dirty:
+            deadline = self._deadlines.get(key)
+            if deadline is not None:
+                rows.append((*key, self._wall_clock(deadline - now)))
+        self._dirty = set()
+        
+        if rows:
+            await self.pool.write(lambda conn: conn.executemany(
+                '''INSERT OR REPLACE INTO cooldowns (user_id, guild_id, command, expires_at) 
+                   VALUES (?, ?, ?, ?)''',
+                rows
+            ))
+    
+    async def sweep(self) -> int:
+        """Delete expired cooldown rows, returns how many were removed"""
+        return await self.pool.execute(
+            'DELETE FROM cooldowns WHERE expires_at <= ?',
+            (self._wall_clock(0),)
+        )
+    
+    async def _every(self, interval: float, job: Callable):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except Exception as e:
+                print(f"Cooldown {job.__name__} failed: {e}")
+    
+    async def start(self):
+        """Load saved cooldowns and start the snapshot and sweep tasks"""
+        if self._tasks:
+            return
+        await self.load()
+        await self.sweep()
+        self._tasks = [
+            asyncio.create_task(self._every(COOLDOWN_SNAPSHOT_INTERVAL, self.snapshot)),
+            asyncio.create_task(self._every(COOLDOWN_SWEEP_INTERVAL, self.sweep))
+        ]
+    
+    async def close(self):
+        """Stop background tasks and take a final snapshot"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.snapshot()
+
+
+# --- Guild Settings ---
+"""
+Per-guild runtime configuration for the Discord gambling bot
+"""
+class GuildSettings:
+    """
+    One guild's effective configuration: the module defaults with the guild's
+    overrides applied. Instances are never modified, every change builds a new
+    one with a newer version, so values derived from a guild's settings can be
+    cached against settings.version.
+    """
+    # name: (type, default, minimum, maximum)
+    FIELDS: Dict[str, Tuple[type, Any, float, float]] = {
+        "min_bet": (int, MIN_BET, 1, 10**12),
+        "max_bet": (int, MAX_BET, 1, 10**12),
+        **{f"{command}_cooldown": (float, seconds, 0, 3600) for command, seconds in COOLDOWN_POLICIES.items()},
+        "flip_multiplier": (float, COIN_FLIP_MULTIPLIER, 0, 100),
+        "dice_multiplier": (float, DICE_WIN_MULTIPLIER, 0, 100),
+        "slots_jackpot": (float, SLOTS_MULTIPLIERS["jackpot"], 0, 100),
+        "slots_triple": (float, SLOTS_MULTIPLIERS["triple"], 0, 100),
+        "slots_double": (float, SLOTS_MULTIPLIERS["double"], 0, 100)
+    }
+    __slots__ = ('version', 'overrides', *FIELDS)
+    
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None, version: int = 0):
+        self.version = version
+        self.overrides = {name: value for name, value in (overrides or {}).items() if name in self.FIELDS}
+        for name, (kind, default, _, _) in self.FIELDS.items():
+            setattr(self, name, kind(self.overrides.get(name, default)))
+        if self.min_bet > self.max_bet:
+            raise ValueError(f"min_bet ({self.min_bet}) can't be above max_bet ({self.max_bet})")
+    
+    @classmethod
+    def parse(cls, name: str, raw: str):
+        """Convert and range-check a value typed by an admin, raises ValueError"""
+        if name not in cls.FIELDS:
+            raise ValueError(f"Unknown setting `{name}`, choose from: {', '.join(cls.FIELDS)}")
+        kind, _, minimum, maximum = cls.FIELDS[name]
+        try:
+            value = kind(raw)
+        except ValueError:
+            raise ValueError(f"`{name}` must be {'a whole number' if kind is int else 'a number'}") from None
+        if not minimum <= value <= maximum:
+            raise ValueError(f"`{name}` must be between {minimum:g} and {maximum:g}")
+        return value
+    
+    def cooldown(self, command: str) -> Optional[float]:
+        return getattr(self, f"{command}_cooldown", None)
+    
+    @property
+    def slots_multipliers(self) -> Dict[str, float]:
+        return {"jackpot": self.slots_jackpot, "triple": self.slots_triple, "double": self.slots_double}
+
+
+DEFAULT_GUILD_SETTINGS = GuildSettings()
+
+
+class GuildConfig:
+    """
+    Every configured guild's settings held in memory, so the hot path reads
+    them with a dict lookup and no database hit. Each setting is one row in
+    guild_settings stamped with a version one past the highest in the table;
+    refresh() polls for versions newer than the last it saw, picking up
+    changes written by another process. Cooldown overrides are pushed into
+    the CooldownEngine's per-guild policies. Without a pool settings only
+    live in memory.
+    """
+    def __init__(self, pool: Optional[ConnectionPool], cooldowns: CooldownEngine):
+        self.pool = pool
+        self.cooldowns = cooldowns
+        self._settings: Dict[int, GuildSettings] = {}
+        self._seen_version = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def create_tables(conn: sqlite3.Connection):
+        # One row per overridden setting, a NULL value restores the default
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS guild_settings (
+                guild_id INTEGER,
+                name TEXT,
+                value NUMERIC,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (guild_id, name)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_guild_settings_version ON guild_settings (version)')
+    
+    def get(self, guild_id: int) -> GuildSettings:
+        return self._settings.get(guild_id, DEFAULT_GUILD_SETTINGS)
+    
+    def _apply(self, guild_id: int, overrides: Dict[str, Any], version: int):
+        current = self._settings.get(guild_id)
+        if current is not None and current.version >= version:
+            return
+        try:
+            settings = GuildSettings(overrides, version)
+        except (TypeError, ValueError) as e:
+            print(f"Ignoring invalid settings for guild {guild_id}: {e}")
+            return
+        self._settings[guild_id] = settings
+        for command in COOLDOWN_POLICIES:
+            name = f"{command}_cooldown"
+            self.cooldowns.set_policy(guild_id, command, settings.cooldown(command) if name in settings.overrides else None)
+    
+    @staticmethod
+    def _read_guild(conn: sqlite3.Connection, guild_id: int) -> Tuple[Dict[str, Any], int]:
+        rows = conn.execute('SELECT name, value, version FROM guild_settings WHERE guild_id = ?', (guild_id,)).fetchall()
+        overrides = {name: value for name, value, _ in rows if value is not None}
+        return overrides, max((version for _, _, version in rows), default=0)
+    
+    async def refresh(self) -> int:
+        """Reload guilds with settings written since the last refresh, returns how many"""
+        if self.pool is None:
+            return 0
+        
+        def read(conn: sqlite3.Connection):
+            changed = conn.execute(
+                'SELECT DISTINCT guild_id FROM guild_settings WHERE version > ?', (self._seen_version,)
+            ).fetchall()
+            latest = conn.execute('SELECT COALESCE(MAX(version), 0) FROM guild_settings').fetchone()[0]
+            return {guild_id: self._read_guild(conn, guild_id) for guild_id, in changed}, latest
+        
+        guilds, latest = await self.pool.read(read)
+        for guild_id, (overrides, version) in guilds.items():
+            self._apply(guild_id, overrides, version)
+        self._seen_version = max(self._seen_version, latest)
+        return len(guilds)
+    
+    @staticmethod
+    def _merged(overrides: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Overrides with changes applied, raises ValueError if the result is invalid"""
+        merged = dict(overrides)
+        for name, value in changes.items():
+            if value is None:
+                merged.pop(name, None)
+            else:
+                merged[name] = value
+        GuildSettings(merged)
+        return merged
+    
+    async def update(self, guild_id: int, changes: Dict[str, Any]) -> GuildSettings:
+        """
+        Set settings for a guild, a None value restores the default
+        Raises ValueError, leaving everything unchanged, if the result would be invalid
+        """
+        for name in changes:
+            if name not in GuildSettings.FIELDS:
+                raise ValueError(f"Unknown setting `{name}`, choose from: {', '.join(GuildSettings.FIELDS)}")
+        
+        if self.pool is None:
+            self._seen_version += 1
+            self._apply(guild_id, self._merged(self.get(guild_id).overrides, changes), self._seen_version)
+            return self.get(guild_id)
+        
+        def write(conn: sqlite3.Connection):
+            overrides, _ = self._read_guild(conn, guild_id)
+            self._merged(overrides, changes)  # Raises before anything is written
+            
+            version = conn.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM guild_settings').fetchone()[0]
+            conn.executemany(
+                '''INSERT INTO guild_settings (guild_id, name, value, version) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (guild_id, name) DO UPDATE SET value = excluded.value, version = excluded.version''',
+                [(guild_id, name, value, version) for name, value in changes.items()]
+            )
+            # Re-read so rows written elsewhere since the last refresh are included
+            return self._read_guild(conn, guild_id)
+        
+        overrides, version = await self.pool.write(write)
+        self._apply(guild_id, overrides, version)
+        return self.get(guild_id)
+    
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(GUILD_CONFIG_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Guild settings refresh failed: {e}")
+    
+    async def start(self):
+        """Load every guild's settings and start polling for changes"""
+        if self._task is not None or self.pool is None:
+            return
+        await self.refresh()
+        self._task = asyncio.create_task(self._poll())
+    
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# --- Keyed Locks ---
+"""
+Per-user locks so the same user's commands run one at a time
+"""
+class KeyedLocks:
+    """
+    asyncio locks keyed by e.g. (user_id, guild_id). Locks are created on
+    first use and only weakly referenced here, so a lock disappears as soon
+    as no coroutine holds or waits on it; idle users cost nothing.
+    """
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[Hashable, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+    
+    def __call__(self, key: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+    
+    @asynccontextmanager
+    async def hold(self, keys: Iterable[Hashable]):
+        """Hold several locks at once, taken in sorted order so two holders can't deadlock"""
+        async with AsyncExitStack() as stack:
+            for key in sorted(set(keys)):
+                await stack.enter_async_context(self(key))
+            yield
+
+
+# --- Schema Migrations ---
+"""
+Versioned schema changes for the Discord gambling bot database
+"""
+def _create_base_tables(conn: sqlite3.Connection):
+    # Users table for economy data
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER,
+            guild_id INTEGER,
+            balance INTEGER DEFAULT {INITIAL_BALANCE},
+            total_winnings INTEGER DEFAULT 0,
+            total_losses INTEGER DEFAULT 0,
+            games_played INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    ''')
+    
+    # Cooldowns table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cooldowns (
+            user_id INTEGER,
+            guild_id INTEGER,
+            command TEXT,
+            expires_at TEXT,
+            PRIMARY KEY (user_id, guild_id, command)
+        )
+    ''')
+
+
+class Migration:
+    """
+    One schema change. apply() must be idempotent: when an online step is
+    deferred, the steps after it run now and again once it has been built.
+    """
+    __slots__ = ('version', 'description', 'apply', 'online', 'table')
+    
+    def __init__(self, version: int, description: str, apply: Callable[[sqlite3.Connection], None],
+                 online: bool = False, table: Optional[str] = None):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.online = online  # Index builds that may run after startup
+        self.table = table    # Table an online step scans, for size reporting
+    
+    @staticmethod
+    def index(version: int, description: str, sql: str, table: str) -> "Migration":
+        return Migration(version, description, lambda conn: conn.execute(sql), online=True, table=table)
+
+
+MIGRATIONS = [
+    Migration(1, "Create users and cooldowns tables", _create_base_tables),
+    Migration.index(2, "Index users by guild and balance for leaderboards",
+                    'CREATE INDEX IF NOT EXISTS idx_users_guild_balance ON users (guild_id, balance DESC, user_id)',
+                    "users"),
+    Migration(3, "Create game ledger and rollup tables", GameLedger.create_tables),
+    Migration.index(4, "Index game ledger by guild for exports",
+                    'CREATE INDEX IF NOT EXISTS idx_game_ledger_guild ON game_ledger (guild_id, id)',
+                    "game_ledger"),
+    Migration(5, "Create per-guild settings table", GuildConfig.create_tables)
+]
+
+
+class SchemaMigrator:
+    """
+    Applies MIGRATIONS in order, each in its own transaction together with the
+    PRAGMA user_version bump, and times every step. user_version only moves
+    past steps that have actually run, so deferred index builds are picked up
+    by the next run.
+    """
+    def __init__(self, migrations: List[Migration] = MIGRATIONS):
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self.deferred: List[Migration] = []
+    
+    @property
+    def latest(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+    
+    @staticmethod
+    def current_version(conn: sqlite3.Connection) -> int:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def pending(self, conn: sqlite3.Connection) -> List[Migration]:
+        version = self.current_version(conn)
+        return [migration for migration in self.migrations if migration.version > version]
+    
+    @staticmethod
+    def _table_rows(conn: sqlite3.Connection, table: Optional[str]) -> Optional[int]:
+        if table is None or not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone():
+            return None
+        return conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    
+    def run(self, conn: sqlite3.Connection, dry_run: bool = False,
+            skip_online: bool = False) -> List[Tuple[Migration, str, float]]:
+        """
+        Apply pending migrations. With skip_online, index builds are deferred
+        (listed in self.deferred) and user_version stops just before the first one.
+        Returns (migration, status, seconds) for every pending step.
+        """
+        results = []
+        self.deferred = []
+        for migration in self.pending(conn):
+            if dry_run:
+                results.append((migration, "pending", 0.0))
+                continue
+            if skip_online and migration.online:
+                self.deferred.append(migration)
+                results.append((migration, "deferred", 0.0))
+                continue
+            
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                migration.apply(conn)
+                if not self.deferred:
+                    conn.execute(f'PRAGMA user_version = {migration.version}')
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            elapsed = time.perf_counter() - started
+            results.append((migration, "applied", elapsed))
+            print(f"Migration {migration.version} ({migration.description}) applied in {elapsed:.2f}s")
+        return results
+    
+    def describe(self, conn: sqlite3.Connection) -> List[str]:
+        """Human readable status of every pending migration"""
+        lines = []
+        for migration in self.pending(conn):
+            line = f"{migration.version:>4}  {migration.description}"
+            if migration.online:
+                rows = self._table_rows(conn, migration.table)
+                line += " [index build" + (f", {rows:,} rows in {migration.table}]" if rows is not None else "]")
+            lines.append(line)
+        return lines
+
+
+def run_migrate_cli(argv: List[str]) -> int:
+    """CLI: python bot.py migrate [--dry-run] [--db-file FILE] [--partitions N]"""
+    parser = argparse.ArgumentParser(prog="bot.py migrate",
+                                     description="Apply pending schema migrations, including index builds")
+    parser.add_argument("--dry-run", action="store_true", help="list pending migrations without applying them")
+    parser.add_argument("--db-file", default=DATABASE_FILE)
+    parser.add_argument("--partitions", type=int, default=DB_PARTITIONS)
+    args = parser.parse_args(argv)
+    
+    migrator = SchemaMigrator()
+    for index in range(args.partitions):
+        path = StorageRouter.partition_file(args.db_file, index, args.partitions)
+        if not os.path.exists(path):
+            print(f"{path}: missing, skipped")
+            continue
+        # A dry run only reads, so it can't change the file even by accident
+        target = f"file:{path}?mode=ro" if args.dry_run else path
+        conn = sqlite3.connect(target, uri=args.dry_run, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+        try:
+            version = migrator.current_version(conn)
+            print(f"{path}: schema version {version}, latest {migrator.latest}")
+            for line in migrator.describe(conn):
+                print(line)
+            if args.dry_run:
+                continue
+            started = time.perf_counter()
+            results = migrator.run(conn)
+            print(f"{path}: {len(results)} migration(s) applied in {time.perf_counter() - started:.2f}s")
+        except sqlite3.Error as e:
+            print(f"{path}: migration failed: {e}")
+            return 1
+        finally:
+            conn.close()
+    return 0
+
+
+# --- Database Operations (from database.py) ---
+"""
+Database operations for the Discord gambling bot
+"""
+@instrument_methods("db")
+class Database:
+    def __init__(self, db_file: str = DATABASE_FILE):
+        self.db_file = db_file
+        self.pool = ConnectionPool(db_file)
+        self.cache = UserCache()
+        self.leaderboards: Dict[int, GuildLeaderboard] = {}
+        self._leaderboard_loads: Dict[int, asyncio.Future] = {}
+        self._leaderboard_buffers: Dict[int, Dict[int, int]] = {}
+        self.rankings: "OrderedDict[int, GuildRanking]" = OrderedDict()
+        self._ranking_loads: Dict[int, asyncio.Future] = {}
+        self._ranking_buffers: Dict[int, Dict[int, int]] = {}
+        self.settlements = (SettlementQueue(self.pool, listener=self._row_changed, cache=self.cache)
+                            if SETTLEMENT_WRITE_BEHIND else None)
+        self.cooldowns = CooldownEngine(self.pool)
+        self.guild_config = GuildConfig(self.pool, self.cooldowns)
+        self.user_locks = KeyedLocks()
+        self.backups = BackupManager(db_file)
+        self._migration_task: Optional[asyncio.Task] = None
+        self._backup_task: Optional[asyncio.Task] = None
+        self.init_database()
+    
+    def user_lock(self, user_id: int, guild_id: int) -> asyncio.Lock:
+        """Lock every balance-changing command takes for its user"""
+        return self.user_locks((user_id, guild_id))
+    
+    def init_database(self):
+        """Bring the schema up to date; index builds may be left for start()"""
+        self.migrator = SchemaMigrator()
+        self.pool.write_sync(self.migrator.run, False, MIGRATE_INDEXES_ONLINE)
+    
+    def close(self):
+        """Close all database connections"""
+        self.pool.close()
+    
+    async def start(self):
+        """Start background work that needs the event loop"""
+        await self.cooldowns.start()
+        await self.guild_config.start()
+        if self.migrator.deferred:
+            self._migration_task = asyncio.create_task(self._run_deferred_migrations())
+        if BACKUP_INTERVAL > 0:
+            self._backup_task = asyncio.create_task(self._scheduled_backups())
+    
+    async def _run_deferred_migrations(self):
+        """
+        Build deferred indexes on the writer thread. SQLite can't build an index
+        concurrently with writes, but readers keep going under WAL and queued
+        writes (settlements buffer meanwhile) run as soon as each build commits.
+        """
+        try:
+            await self.pool.write(self.migrator.run)
+        except Exception as e:
+            print(f"Background migration failed, will retry on next start: {e}")
+    
+    async def backup(self) -> Dict[str, Any]:
+        """Commit pending settlements, then take a verified online snapshot"""
+        if self.settlements is not None:
+            await self.settlements.flush()
+        return await self.backups.backup()
+    
+    async def _scheduled_backups(self):
+        while True:
+            await asyncio.sleep(BACKUP_INTERVAL)
+            try:
+                result = await self.backup()
+                print(f"Backed up {self.db_file} to {result['path']} in {result['seconds']:.1f}s")
+            except Exception as e:
+                print(f"Scheduled backup of {self.db_file} failed: {e}")
+    
+    async def shutdown(self):
+        """Flush pending settlements and cooldowns, then close all connections"""
+        if self._backup_task is not None:
+            self._backup_task.cancel()  # A snapshot already copying finishes on its own connections
+        if self._migration_task is not None:
+            self._migration_task.cancel()  # An index build in progress still finishes before the pool closes
+        await self.guild_config.close()
+        await self.cooldowns.close()
+        if self.settlements is not None:
+            await self.settlements.close()
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+    
+    def _row_changed(self, key: Tuple[int, int], row: UserRow):
+        """Write-through hook for every settled or projected row change"""
+        self.cache.put(key, row)
+        self._balance_changed(key, row.balance)
+    
+    def _balance_changed(self, key: Tuple[int, int], balance: int):
+        user_id, guild_id = key
+        board = self.leaderboards.get(guild_id)
+        if board is not None and not board.stale:
+            board.update(user_id, balance)
+        buffer = self._leaderboard_buffers.get(guild_id)
+        if buffer is not None:
+            buffer[user_id] = balance
+        ranking = self.rankings.get(guild_id)
+        if ranking is not None:
+            ranking.update(user_id, balance)
+        buffer = self._ranking_buffers.get(guild_id)
+        if buffer is not None:
+            buffer[user_id] = balance
+    
+    async def check_writable(self) -> bool:
+        """True if the database can take the write lock right now"""
+        def take_write_lock(conn: sqlite3.Connection):
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            await asyncio.wait_for(self.pool.write(take_write_lock), timeout=READY_DB_TIMEOUT)
+            return True
+        except (asyncio.TimeoutError, sqlite3.Error, RuntimeError):
+            return False
+    
+    async def _get_row(self, user_id: int, guild_id: int) -> Optional[UserRow]:
+        """Resolve a user row from pending settlements, the cache, then disk"""
+        key = (user_id, guild_id)
+        if self.settlements is not None:
+            pending = self.settlements.peek(user_id, guild_id)
+            if pending is not None:
+                return pending
+        
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        token = self.cache.begin_load(key)
+        values = None
+        try:
+            values = await self.pool.read(UserRow.fetch, user_id, guild_id)
+        finally:
+            self.cache.finish_load(key, token, values)
+        return UserRow(*values) if values else None
+    
+    async def get_user_balance(self, user_id: int, guild_id: int) -> int:
+        """Get user's current balance"""
+        row = await self._get_row(user_id, guild_id)
+        
+        if row:
+            return row.balance
+        else:
+            # Create new user with initial balance
+            await self.create_user(user_id, guild_id)
+            return INITIAL_BALANCE
+    
+    async def create_user(self, user_id: int, guild_id: int):
+        """Create a new user in the database"""
+        created = await self.pool.execute(
+            '''INSERT OR IGNORE INTO users (user_id, guild_id, balance) 
+               VALUES (?, ?, ?)''',
+            (user_id, guild_id, INITIAL_BALANCE)
+        )
+        if created:
+            self._balance_changed((user_id, guild_id), INITIAL_BALANCE)
+    
+    async def update_balance(self, user_id: int, guild_id: int, new_balance: int):
+        """Update user's balance"""
+        if self.settlements is not None:
+            await self.settlements.set_balance(user_id, guild_id, new_balance)
+            await self.settlements.flush()
+        else:
+            await self.pool.execute(
+                '''INSERT INTO users (user_id, guild_id, balance) VALUES (?, ?, ?)
+                   ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = excluded.balance''',
+                (user_id, guild_id, new_balance)
+            )
+        self.cache.invalidate((user_id, guild_id))
+        self._balance_changed((user_id, guild_id), new_balance)
+    
+    async def add_to_balance(self, user_id: int, guild_id: int, amount: int):
+        """Add amount to user's balance"""
+        if self.settlements is not None:
+            new_balance = await self.settlements.apply(user_id, guild_id, balance=amount)
+            await self.settlements.flush()
+        else:
+            new_balance = await self.pool.write(self._add_to_balance, user_id, guild_id, amount)
+        self.cache.invalidate((user_id, guild_id))
+        self._balance_changed((user_id, guild_id), new_balance)
+        return new_balance
+    
+    @staticmethod
+    def _add_to_balance(conn: sqlite3.Connection, user_id: int, guild_id: int, amount: int) -> int:
+        conn.execute(
+            'INSERT OR IGNORE INTO users (user_id, guild_id, balance) VALUES (?, ?, ?)',
+            (user_id, guild_id, INITIAL_BALANCE)
+        )
+        row = conn.execute(
+            '''UPDATE users SET balance = balance + ? 
+               WHERE user_id = ? AND guild_id = ? 
+               RETURNING balance''',
+            (amount, user_id, guild_id)
+        ).fetchone()
+        return row[0]
+    
+    async def bulk_add_to_balance(self, guild_id: int, user_ids: List[int], amount: int,
+                                  progress: Optional[Callable[[int, int], Any]] = None) -> int:
+        """Add amount to many users' balances, creating missing users. Returns the users updated"""
+        return await self._bulk_update(guild_id, user_ids, amount, None, progress)
+    
+    async def reset_guild(self, guild_id: int, progress: Optional[Callable[[int, int], Any]] = None) -> int:
+        """Set every user of a guild back to the initial balance. Returns the users reset"""
+        if self.settlements is not None:
+            await self.settlements.flush()
+        user_ids = await self.pool.read(lambda conn: [
+            row[0] for row in conn.execute('SELECT user_id FROM users WHERE guild_id = ?', (guild_id,))
+        ])
+        return await self._bulk_update(guild_id, user_ids, None, INITIAL_BALANCE, progress)
+    
+    async def _bulk_update(self, guild_id: int, user_ids: List[int], amount: Optional[int],
+                           absolute: Optional[int], progress: Optional[Callable[[int, int], Any]]) -> int:
+        """
+        Apply the same balance change to many users in chunked transactions.
+        Each chunk is one set-based statement; the event loop keeps serving
+        commands while the writer thread commits it. Users with uncommitted
+        settlements are routed through the settlement queue instead so their
+        projections stay exact.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        done = 0
+        for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+            chunk = user_ids[start:start + BULK_CHUNK_SIZE]
+            async with self.user_locks.hold((user_id, guild_id) for user_id in chunk):
+                if self.settlements is None:
+                    rows = await self.pool.write(self._bulk_write, guild_id, chunk, amount, absolute)
+                else:
+                    async with self.settlements.hold_loads():
+                        direct = []
+                        for user_id in chunk:
+                            if self.settlements.tracks(user_id, guild_id):
+                                await self.settlements.apply(user_id, guild_id, balance=amount or 0,
+                                                             absolute=absolute)
+                            else:
+                                direct.append(user_id)
+                        rows = await self.pool.write(self._bulk_write, guild_id, direct, amount, absolute)
+                
+                for user_id, *values in rows:
+                    self._row_changed((user_id, guild_id), UserRow(*values))
+            done += len(chunk)
+            if progress is not None:
+                await progress(done, len(user_ids))
+        
+        if self.settlements is not None:
+            await self.settlements.flush()
+        return done
+    
+    @staticmethod
+    def _bulk_write(conn: sqlite3.Connection, guild_id: int, user_ids: List[int],
+                    amount: Optional[int], absolute: Optional[int]) -> List[tuple]:
+        if not user_ids:
+            return []
+        returning = 'RETURNING user_id, balance, total_winnings, total_losses, games_played'
+        if absolute is not None:
+            return conn.execute(
+                f'''UPDATE users SET balance = ?
+                   WHERE guild_id = ? AND user_id IN (SELECT value FROM json_each(?))
+                   {returning}''',
+                (absolute, guild_id, json.dumps(user_ids))
+            ).fetchall()
+        # "WHERE true" keeps the upsert's ON CONFLICT from parsing as part of the SELECT
+        return conn.execute(
+            f'''INSERT INTO users (user_id, guild_id, balance)
+               SELECT value, ?, ? FROM json_each(?) WHERE true
+               ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = balance + ?
+               {returning}''',
+            (guild_id, INITIAL_BALANCE + amount, json.dumps(user_ids), amount)
+        ).fetchall()
+    
+    async def subtract_from_balance(self, user_id: int, guild_id: int, amount: int) -> bool:
+        """Subtract amount from user's balance, return False if insufficient funds"""
+        if self.settlements is not None:
+            new_balance = await self.settlements.apply(user_id, guild_id, balance=-amount, required=amount)
+            return new_balance is not None
+        
+        row = await self.pool.write(lambda conn: conn.execute(
+            '''UPDATE users SET balance = balance - ? 
+               WHERE user_id = ? AND guild_id = ? AND balance >= ?
+               RETURNING balance, total_winnings, total_losses, games_played''',
+            (amount, user_id, guild_id, amount)
+        ).fetchone())
+        if row is None:
+            return False
+        self._row_changed((user_id, guild_id), UserRow(*row))
+        return True
+    
+    async def settle_bet(self, user_id: int, guild_id: int, bet: int, payout: int, games: int = 1,
+                         winnings: Optional[int] = None, losses: Optional[int] = None,
+                         game: Optional[str] = None, wins: Optional[int] = None) -> Optional[int]:
+        """
+        Settle finished games in one transaction: debit the bet, credit the payout
+        and update statistics. Returns the new balance, or None if the user can't
+        cover the bet.
+        For several rounds at once pass the total bet and payout, the number of
+        games, the per-round winnings/losses sums and the number of rounds won.
+        Settlements naming a game are also recorded in the game ledger.
+        """
+        net = payout - bet
+        if winnings is None:
+            winnings = max(net, 0)
+        if losses is None:
+            losses = max(-net, 0)
+        if wins is None:
+            wins = int(net > 0)
+        entry = GameLedger.entry(user_id, guild_id, game, games, wins, bet, payout) if game else None
+        if self.settlements is not None:
+            return await self.settlements.apply(
+                user_id, guild_id, balance=net,
+                winnings=winnings, losses=losses, games=games, required=bet, entry=entry
+            )
+        
+        row = await self.pool.write(self._settle_bet, user_id, guild_id, bet, net, winnings, losses, games, entry)
+        if row is None:
+            return None
+        self._row_changed((user_id, guild_id), UserRow(*row))
+        return row[0]
+    
+    @staticmethod
+    def _settle_bet(conn: sqlite3.Connection, user_id: int, guild_id: int, bet: int, net: int,
+                    winnings: int, losses: int, games: int, entry: Optional[tuple] = None):
+        conn.execute(
+            'INSERT OR IGNORE INTO users (user_id, guild_id, balance) VALUES (?, ?, ?)',
+            (user_id, guild_id, INITIAL_BALANCE)
+        )
+        # The balance guard makes the funds check and the debit a single atomic step
+        row = conn.execute(
+            '''UPDATE users SET 
+               balance = balance + ?,
+               total_winnings = total_winnings + ?,
+               total_losses = total_losses + ?,
+               games_played = games_played + ?
+               WHERE user_id = ? AND guild_id = ? AND balance >= ?
+               RETURNING balance, total_winnings, total_losses, games_played''',
+            (net, winnings, losses, games, user_id, guild_id, bet)
+        ).fetchone()
+        if row is not None and entry is not None:
+            GameLedger.write(conn, [entry])
+        return row
+    
+    async def update_stats(self, user_id: int, guild_id: int, winnings: int = 0, losses: int = 0):
+        """Update user's gambling statistics"""
+        if self.settlements is not None:
+            await self.settlements.apply(user_id, guild_id, winnings=winnings, losses=losses, games=1)
+            return
+        
+        row = await self.pool.write(lambda conn: conn.execute(
+            '''UPDATE users SET 
+               total_winnings = total_winnings + ?,
+               total_losses = total_losses + ?,
+               games_played = games_played + 1
+               WHERE user_id = ? AND guild_id = ?
+               RETURNING balance, total_winnings, total_losses, games_played''',
+            (winnings, losses, user_id, guild_id)
+        ).fetchone())
+        if row is not None:
+            self._row_changed((user_id, guild_id), UserRow(*row))
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 10):
+        """Get top users by balance for a guild"""
+        if limit <= LEADERBOARD_TRACKED:
+            board = await self._load_leaderboard(guild_id)
+            return board.top(limit)
+        
+        if self.settlements is not None:
+            await self.settlements.flush()
+        return await self._fetch_leaderboard(guild_id, limit)
+    
+    def leaderboard_version(self, guild_id: int) -> int:
+        """Changes whenever the visible top of a guild's leaderboard changes"""
+        board = self.leaderboards.get(guild_id)
+        return board.version if board is not None else 0
+    
+    async def _fetch_leaderboard(self, guild_id: int, limit: int):
+        return await self.pool.fetchall(
+            '''SELECT user_id, balance FROM users 
+               WHERE guild_id = ? 
+               ORDER BY balance DESC, user_id 
+               LIMIT ?''',
+            (guild_id, limit)
+        )
+    
+    async def _load_leaderboard(self, guild_id: int) -> GuildLeaderboard:
+        board = self.leaderboards.get(guild_id)
+        if board is not None and not board.stale:
+            return board
+        
+        loader = self._leaderboard_loads.get(guild_id)
+        if loader is None:
+            # Balance changes that land while we read are buffered and replayed on top
+            self._leaderboard_buffers[guild_id] = {}
+            loader = asyncio.ensure_future(self._reload_leaderboard(guild_id))
+            self._leaderboard_loads[guild_id] = loader
+            loader.add_done_callback(lambda _: self._leaderboard_loads.pop(guild_id, None))
+        return await loader
+    
+    async def _reload_leaderboard(self, guild_id: int) -> GuildLeaderboard:
+        try:
+            if self.settlements is not None:
+                await self.settlements.flush()
+            rows = await self._fetch_leaderboard(guild_id, LEADERBOARD_TRACKED)
+        finally:
+            buffer = self._leaderboard_buffers.pop(guild_id, {})
+        
+        board = self.leaderboards.get(guild_id)
+        if board is None:
+            board = self.leaderboards[guild_id] = GuildLeaderboard()
+        board.load(rows)
+        for user_id, balance in buffer.items():
+            board.update(user_id, balance)
+        return board
+    
+    async def get_rank(self, user_id: int, guild_id: int) -> Tuple[Optional[Tuple[int, int]], int]:
+        """A player's (rank, balance), or None if unranked, and the number of ranked players"""
+        ranking = await self._load_ranking(guild_id)
+        return ranking.rank(user_id), len(ranking)
+    
+    async def get_leaderboard_page(self, guild_id: int, page: int,
+                                   page_size: int = LEADERBOARD_SIZE) -> Tuple[List[Tuple[int, int]], int]:
+        """One leaderboard page (1-based) as (user_id, balance) rows, and the number of ranked players"""
+        ranking = await self._load_ranking(guild_id)
+        return ranking.page((page - 1) * page_size, page_size), len(ranking)
+    
+    async def _load_ranking(self, guild_id: int) -> GuildRanking:
+        ranking = self.rankings.get(guild_id)
+        if ranking is not None:
+            self.rankings.move_to_end(guild_id)
+            return ranking
+        
+        loader = self._ranking_loads.get(guild_id)
+        if loader is None:
+            self._ranking_buffers[guild_id] = {}
+            loader = asyncio.ensure_future(self._build_ranking(guild_id))
+            self._ranking_loads[guild_id] = loader
+            loader.add_done_callback(lambda _: self._ranking_loads.pop(guild_id, None))
+        return await loader
+    
+    async def _build_ranking(self, guild_id: int) -> GuildRanking:
+        """
+        Read the whole guild in balance order with keyset pagination on
+        idx_users_guild_balance, one short read per chunk and never an OFFSET.
+        Changes landing meanwhile are buffered and replayed on top.
+        """
+        ranking = GuildRanking()
+        try:
+            if self.settlements is not None:
+                await self.settlements.flush()
+            cursor = None
+            while True:
+                rows = await self.pool.read(self._fetch_ranking_chunk, guild_id, cursor, RANKING_LOAD_CHUNK)
+                for user_id, balance in rows:
+                    ranking.update(user_id, balance)
+                if len(rows) < RANKING_LOAD_CHUNK:
+                    break
+                cursor = (rows[-1][1], rows[-1][0])
+        finally:
+            buffer = self._ranking_buffers.pop(guild_id, {})
+        
+        for user_id, balance in buffer.items():
+            ranking.update(user_id, balance)
+        self.rankings[guild_id] = ranking
+        if len(self.rankings) > RANKING_GUILDS_CACHED:
+            self.rankings.popitem(last=False)
+        return ranking
+    
+    @staticmethod
+    def _fetch_ranking_chunk(conn: sqlite3.Connection, guild_id: int, cursor: Optional[Tuple[int, int]],
+                             limit: int) -> List[Tuple[int, int]]:
+        if cursor is None:
+            return conn.execute(
+                '''SELECT user_id, balance FROM users WHERE guild_id = ?
+                   ORDER BY balance DESC, user_id LIMIT ?''',
+                (guild_id, limit)
+            ).fetchall()
+        balance, user_id = cursor
+        return conn.execute(
+            '''SELECT user_id, balance FROM users
+               WHERE guild_id = ? AND (balance < ? OR (balance = ? AND user_id > ?))
+               ORDER BY balance DESC, user_id LIMIT ?''',
+            (guild_id, balance, balance, user_id, limit)
+        ).fetchall()
+    
+    def settings(self, guild_id: int) -> GuildSettings:
+        """A guild's current settings, served from memory"""
+        return self.guild_config.get(guild_id)
+    
+    async def update_settings(self, guild_id: int, changes: Dict[str, Any]) -> GuildSettings:
+        """Change a guild's settings, None values restore defaults; raises ValueError if invalid"""
+        return await self.guild_config.update(guild_id, changes)
+    
+    async def check_cooldown(self, user_id: int, guild_id: int, command: str) -> float:
+        """Get the seconds remaining on a user's cooldown, 0 if none"""
+        return self.cooldowns.remaining(user_id, guild_id, command)
+    
+    async def set_cooldown(self, user_id: int, guild_id: int, command: str, seconds: float):
+        """Put a user on cooldown for a command"""
+        self.cooldowns.start_cooldown(user_id, guild_id, command, seconds)
+    
+    async def acquire_cooldown(self, user_id: int, guild_id: int, command: str,
+                               seconds: Optional[float] = None) -> float:
+        """
+        Check and start a cooldown in one step
+        Returns the seconds remaining if the user is already on cooldown, 0 otherwise
+        """
+        return self.cooldowns.acquire(user_id, guild_id, command, seconds)
+    
+    async def get_user_stats(self, user_id: int, guild_id: int):
+        """Get user's complete statistics"""
+        row = await self._get_row(user_id, guild_id)
+        
+        if row:
+            return row.as_dict()
+        return None
+    
+    async def get_game_stats(self, user_id: int, guild_id: int):
+        """Per-game totals and recent activity windows from the ledger rollups"""
+        return await self.pool.read(GameLedger.fetch_summary, user_id, guild_id)
+    
+    
+
+# --- Storage Router ---
+"""
+Spreads guilds over several SQLite files so shard processes don't share a writer
+"""
+class StorageRouter:
+    """
+    Routes every call to the Database owning the guild's partition.
+    Guilds map to partitions the way Discord maps them to shards,
+    (guild_id >> 22) % partitions, so when the partition count is a multiple
+    of the shard count each shard process only ever opens its own files.
+    """
+    def __init__(self, partitions: int = DB_PARTITIONS, shard_ids: Optional[List[int]] = SHARD_IDS,
+                 shard_count: Optional[int] = SHARD_COUNT, db_file: str = DATABASE_FILE):
+        if partitions < 1:
+            raise ValueError("partitions must be at least 1")
+        if shard_ids is not None:
+            if not shard_count:
+                raise ValueError("SHARD_IDS needs SHARD_COUNT")
+            if partitions % shard_count:
+                raise ValueError(f"{partitions} partitions can't be split evenly over {shard_count} shards")
+        self.partitions = partitions
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.db_file = db_file
+        self.databases: Dict[int, Database] = {
+            index: Database(self.partition_file(db_file, index, partitions))
+            for index in range(partitions) if self.owns(index)
+        }
+    
+    @staticmethod
+    def partition_file(db_file: str, index: int, partitions: int) -> str:
+        """File holding one partition; a single partition keeps the original file name"""
+        if partitions == 1:
+            return db_file
+        stem, ext = os.path.splitext(db_file)
+        return f"{stem}.{index}-of-{partitions}{ext}"
+    
+    @staticmethod
+    def partition_of(guild_id: int, partitions: int) -> int:
+        """Same formula discord.py uses for shard assignment"""
+        return (guild_id >> 22) % partitions
+    
+    def owns(self, index: int) -> bool:
+        """Whether this process serves a partition"""
+        return self.shard_ids is None or index % self.shard_count in self.shard_ids
+    
+    async def backup(self) -> List[Dict[str, Any]]:
+        """Snapshot every partition this process owns, one at a time"""
+        return [await database.backup() for database in self.databases.values()]
+    
+    async def export_guild(self, guild_id: int, directory: str, fmt: str = "ndjson",
+                           part_size: int = EXPORT_PART_SIZE) -> Dict[str, List[str]]:
+        """Commit pending settlements, then stream the guild's data to files in a worker thread"""
+        database = self.for_guild(guild_id)
+        if database.settlements is not None:
+            await database.settlements.flush()
+        exporter = GuildExporter(database.db_file, guild_id, fmt, part_size)
+        return await asyncio.get_running_loop().run_in_executor(None, exporter.export, directory)
+    
+    def for_guild(self, guild_id: int) -> Database:
+        index = self.partition_of(guild_id, self.partitions)
+        database = self.databases.get(index)
+        if database is None:
+            raise LookupError(f"Guild {guild_id} is in partition {index}, which shards {self.shard_ids} don't own")
+        return database
+    
+    def close(self):
+        for database in self.databases.values():
+            database.close()
+    
+    async def start(self):
+        await asyncio.gather(*(database.start() for database in self.databases.values()))
+    
+    async def shutdown(self):
+        await asyncio.gather(*(database.shutdown() for database in self.databases.values()))
+    
+    async def check_writable(self) -> bool:
+        results = await asyncio.gather(*(database.check_writable() for database in self.databases.values()))
+        return all(results)
+    
+    async def get_user_balance(self, user_id: int, guild_id: int) -> int:
+        return await self.for_guild(guild_id).get_user_balance(user_id, guild_id)
+    
+    async def create_user(self, user_id: int, guild_id: int):
+        return await self.for_guild(guild_id).create_user(user_id, guild_id)
+    
+    async def update_balance(self, user_id: int, guild_id: int, new_balance: int):
+        return await self.for_guild(guild_id).update_balance(user_id, guild_id, new_balance)
+    
+    async def add_to_balance(self, user_id: int, guild_id: int, amount: int):
+        return await self.for_guild(guild_id).add_to_balance(user_id, guild_id, amount)
+    
+    async def subtract_from_balance(self, user_id: int, guild_id: int, amount: int) -> bool:
+        return await self.for_guild(guild_id).subtract_from_balance(user_id, guild_id, amount)
+    
+    def user_lock(self, user_id: int, guild_id: int) -> asyncio.Lock:
+        return self.for_guild(guild_id).user_lock(user_id, guild_id)
+    
+    async def bulk_add_to_balance(self, guild_id: int, user_ids: List[int], amount: int,
+                                  progress: Optional[Callable[[int, int], Any]] = None) -> int:
+        return await self.for_guild(guild_id).bulk_add_to_balance(guild_id, user_ids, amount, progress)
+    
+    async def reset_guild(self, guild_id: int, progress: Optional[Callable[[int, int], Any]] = None) -> int:
+        return await self.for_guild(guild_id).reset_guild(guild_id, progress)
+    
+    async def settle_bet(self, user_id: int, guild_id: int, *args, **kwargs) -> Optional[int]:
+        return await self.for_guild(guild_id).settle_bet(user_id, guild_id, *args, **kwargs)
+    
+    async def update_stats(self, user_id: int, guild_id: int, winnings: int = 0, losses: int = 0):
+        return await self.for_guild(guild_id).update_stats(user_id, guild_id, winnings, losses)
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 10):
+        return await self.for_guild(guild_id).get_leaderboard(guild_id, limit)
+    
+    def leaderboard_version(self, guild_id: int) -> int:
+        return self.for_guild(guild_id).leaderboard_version(guild_id)
+    
+    async def get_rank(self, user_id: int, guild_id: int) -> Tuple[Optional[Tuple[int, int]], int]:
+        return await self.for_guild(guild_id).get_rank(user_id, guild_id)
+    
+    async def get_leaderboard_page(self, guild_id: int, page: int,
+                                   page_size: int = LEADERBOARD_SIZE) -> Tuple[List[Tuple[int, int]], int]:
+        return await self.for_guild(guild_id).get_leaderboard_page(guild_id, page, page_size)
+    
+    def settings(self, guild_id: int) -> GuildSettings:
+        return self.for_guild(guild_id).settings(guild_id)
+    
+    async def update_settings(self, guild_id: int, changes: Dict[str, Any]) -> GuildSettings:
+        return await self.for_guild(guild_id).update_settings(guild_id, changes)
+    
+    async def check_cooldown(self, user_id: int, guild_id: int, command: str) -> float:
+        return await self.for_guild(guild_id).check_cooldown(user_id, guild_id, command)
+    
+    async def set_cooldown(self, user_id: int, guild_id: int, command: str, seconds: float):
+        return await self.for_guild(guild_id).set_cooldown(user_id, guild_id, command, seconds)
+    
+    async def acquire_cooldown(self, user_id: int, guild_id: int, command: str,
+                               seconds: Optional[float] = None) -> float:
+        return await self.for_guild(guild_id).acquire_cooldown(user_id, guild_id, command, seconds)
+    
+    async def get_user_stats(self, user_id: int, guild_id: int):
+        return await self.for_guild(guild_id).get_user_stats(user_id, guild_id)
+    
+    async def get_game_stats(self, user_id: int, guild_id: int):
+        return await self.for_guild(guild_id).get_game_stats(user_id, guild_id)
+
+
+def _guild_tables(conn: sqlite3.Connection) -> List[Tuple[str, List[str]]]:
+    """
+    Tables with a guild_id column, with the column names to copy
+    INTEGER PRIMARY KEY ids are left out so rows from several files don't collide
+    """
+    tables = []
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+        info = conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+        pk_columns = [row for row in info if row[5]]
+        rowid_alias = pk_columns[0][1] if len(pk_columns) == 1 and pk_columns[0][2].upper() == 'INTEGER' else None
+        columns = [row[1] for row in info if row[1] != rowid_alias]
+        if 'guild_id' in columns:
+            tables.append((name, columns))
+    return tables
+
+
+def rebalance_partitions(db_file: str, source: int, target: int, dry_run: bool = False,
+                         delete_source: bool = False) -> Dict[str, Dict[int, int]]:
+    """
+    Copy every guild's rows from `source` partition files into `target` partition files.
+    Offline only: no bot process may have the source files open. Sources are left in
+    place unless delete_source is set, and each target file is written in one transaction.
+    Returns rows copied per table per target partition.
+    """
+    if source == target:
+        raise ValueError("source and target partition counts are the same")
+    sources = [StorageRouter.partition_file(db_file, index, source) for index in range(source)]
+    targets = [StorageRouter.partition_file(db_file, index, target) for index in range(target)]
+    missing = [path for path in sources if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Missing source partitions: {', '.join(missing)}")
+    existing = [path for path in targets if os.path.exists(path)]
+    if existing and not dry_run:
+        raise FileExistsError(f"Target partitions already exist: {', '.join(existing)}")
+    
+    copied: Dict[str, Dict[int, int]] = {}
+    staging = [path + ".rebalance" for path in targets]
+    out = []
+    try:
+        if not dry_run:
+            for path in staging:
+                conn = sqlite3.connect(path, isolation_level=None)
+                SchemaMigrator().run(conn)
+                conn.execute("BEGIN")
+                out.append(conn)
+        
+        # Copy only what the current schema has: older files can carry extra columns
+        # (users.last_daily) or tables SchemaMigrator no longer creates
+        if out:
+            schema = dict(_guild_tables(out[0]))
+        else:
+            reference = sqlite3.connect(":memory:")
+            with redirect_stdout(io.StringIO()):
+                SchemaMigrator().run(reference)
+            schema = dict(_guild_tables(reference))
+            reference.close()
+        
+        for path in sources:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                for table, columns in _guild_tables(conn):
+                    columns = [column for column in columns if column in schema.get(table, ())]
+                    if 'guild_id' not in columns:
+                        continue
+                    guild_column = columns.index('guild_id')
+                    column_list = ", ".join(f'"{column}"' for column in columns)
+                    insert = (f'INSERT OR REPLACE INTO "{table}" ({column_list}) '
+                              f'VALUES ({", ".join("?" * len(columns))})')
+                    counts = copied.setdefault(table, {index: 0 for index in range(target)})
+                    cursor = conn.execute(f'SELECT {column_list} FROM "{table}"')
+                    while True:
+                        rows = cursor.fetchmany(10000)
+                        if not rows:
+                            break
+                        batches: Dict[int, List[tuple]] = {}
+                        for row in rows:
+                            index = StorageRouter.partition_of(row[guild_column], target)
+                            batches.setdefault(index, []).append(row)
+                        for index, batch in batches.items():
+                            counts[index] += len(batch)
+                            if not dry_run:
+                                out[index].executemany(insert, batch)
+            finally:
+                conn.close()
+        
+        if dry_run:
+            return copied
+        for conn in out:
+            conn.execute("COMMIT")
+            conn.close()
+        out = []
+        if delete_source:
+            for path in sources:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+        # Targets only appear once every one of them has committed
+        for path, staged in zip(targets, staging):
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(path + suffix) and not os.path.exists(path):
+                    os.remove(path + suffix)  # Stale journal of a removed file must not be replayed
+            os.replace(staged, path)
+    finally:
+        for conn in out:
+            conn.close()
+        for staged in staging:
+            if os.path.exists(staged):
+                os.remove(staged)
+    return copied
+
+
+def run_rebalance_cli(argv: List[str]) -> int:
+    """CLI: python bot.py rebalance --from N --to M [--dry-run] [--delete-source]"""
+    parser = argparse.ArgumentParser(prog="bot.py rebalance",
+                                     description="Move guilds between partition files (bot must be stopped)")
+    parser.add_argument("--from", dest="source", type=int, required=True, help="current partition count")
+    parser.add_argument("--to", dest="target", type=int, required=True, help="new partition count")
+    parser.add_argument("--db-file", default=DATABASE_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="count rows per new partition without writing")
+    parser.add_argument("--delete-source", action="store_true", help="remove the old partition files afterwards")
+    args = parser.parse_args(argv)
+    
+    try:
+        copied = rebalance_partitions(args.db_file, args.source, args.target, args.dry_run, args.delete_source)
+    except (ValueError, FileNotFoundError, FileExistsError, sqlite3.Error) as e:
+        print(f"Rebalance failed: {e}")
+        return 1
+    
+    for table, counts in copied.items():
+        print(f"{table}: {sum(counts.values()):,} rows")
+        for index, count in counts.items():
+            print(f"  {StorageRouter.partition_file(args.db_file, index, args.target)}: {count:,}")
+    if args.dry_run:
+        print("Dry run, nothing written")
+    else:
+        print(f"Set DB_PARTITIONS={args.target} before starting the bot")
+    return 0
+
+
+# --- Guild Export ---
+"""
+Streaming export of a guild's economy data
+"""
+class GuildExporter:
+    """
+    Streams a guild's users and ledger rows from a read-only connection into
+    gzip'd NDJSON or CSV files of at most part_size compressed bytes each.
+    Rows are pulled with fetchmany and written one at a time, so memory use
+    doesn't depend on the size of the guild. Both datasets come from one
+    read transaction and therefore one consistent snapshot.
+    """
+    FORMATS = ("ndjson", "csv")
+    DATASETS = {
+        "users": (
+            ("user_id", "balance", "total_winnings", "total_losses", "games_played"),
+            'SELECT user_id, balance, total_winnings, total_losses, games_played '
+            'FROM users WHERE guild_id = ? ORDER BY user_id'
+        ),
+        "ledger": (
+            ("id", "user_id", "game", "rounds", "wins", "bet", "payout", "timestamp"),
+            'SELECT id, user_id, game, rounds, wins, bet, payout, ts '
+            'FROM game_ledger WHERE guild_id = ? ORDER BY id'
+        )
+    }
+    TABLES = {"users": "users", "ledger": "game_ledger"}
+    CHECK_INTERVAL = 64 * 1024  # Uncompressed bytes written between part size checks
+    
+    def __init__(self, db_file: str, guild_id: int, fmt: str = "ndjson",
+                 part_size: int = EXPORT_PART_SIZE, fetch_size: int = EXPORT_FETCH_SIZE):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.db_file = db_file
+        self.guild_id = guild_id
+        self.fmt = fmt
+        self.part_size = part_size
+        self.fetch_size = fetch_size
+    
+    def _rows(self, conn: sqlite3.Connection, sql: str) -> Iterator[tuple]:
+        cursor = conn.execute(sql, (self.guild_id,))
+        while True:
+            rows = cursor.fetchmany(self.fetch_size)
+            if not rows:
+                return
+            yield from rows
+    
+    @staticmethod
+    def _ledger_records(rows: Iterator[tuple]) -> Iterator[tuple]:
+        for entry_id, user_id, game, rounds, wins, bet, payout, ts in rows:
+            yield (entry_id, user_id, GameLedger.NAMES.get(game, str(game)), rounds, wins, bet, payout,
+                   datetime.fromtimestamp(ts, timezone.utc).isoformat())
+    
+    def _lines(self, columns: Tuple[str, ...], records: Iterator[tuple]) -> Iterator[str]:
+        if self.fmt == "ndjson":
+            for record in records:
+                yield json.dumps(dict(zip(columns, record)), separators=(',', ':')) + "\n"
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow(record)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    def _header(self, columns: Tuple[str, ...]) -> str:
+        return ",".join(columns) + "\r\n" if self.fmt == "csv" else ""
+    
+    def _write_parts(self, name: str, columns: Tuple[str, ...], lines: Iterator[str], directory: str) -> List[str]:
+        """Write lines into numbered gzip files, starting a new one whenever part_size is reached"""
+        paths = []
+        raw = part = None
+        
+        def next_part():
+            nonlocal raw, part
+            if part is not None:
+                part.close()
+                raw.close()
+            path = os.path.join(directory, f"guild-{self.guild_id}-{name}-{len(paths) + 1}.{self.fmt}.gz")
+            paths.append(path)
+            raw = open(path, 'wb')
+            part = gzip.GzipFile(fileobj=raw, mode='wb')
+            part.write(self._header(columns).encode())
+        
+        try:
+            next_part()  # An empty dataset still gets a file with just the header
+            unchecked = 0
+            for line in lines:
+                data = line.encode()
+                part.write(data)
+                unchecked += len(data)
+                # Compressed output is buffered, so sync it now and then to measure the file;
+                # a part overshoots part_size by at most one check interval's worth
+                if unchecked >= self.CHECK_INTERVAL:
+                    unchecked = 0
+                    part.flush()
+                    if raw.tell() >= self.part_size:
+                        next_part()
+        finally:
+            part.close()
+            raw.close()
+        return paths
+    
+    def export(self, directory: str) -> Dict[str, List[str]]:
+        """Write every dataset present in the database to directory, returns the files per dataset"""
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, isolation_level=None)
+        try:
+            conn.execute("BEGIN")  # One snapshot for all datasets
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            files = {}
+            for name, (columns, sql) in self.DATASETS.items():
+                if self.TABLES[name] not in tables:
+                    continue
+                records = self._rows(conn, sql)
+                if name == "ledger":
+                    records = self._ledger_records(records)
+                files[name] = self._write_parts(name, columns, self._lines(columns, records), directory)
+            conn.execute("COMMIT")
+            return files
+        finally:
+            conn.close()
+
+
+def run_export_cli(argv: List[str]) -> int:
+    """CLI: python bot.py export --guild ID [--format ndjson|csv] [--output DIR]"""
+    parser = argparse.ArgumentParser(prog="bot.py export", description="Export a guild's users and game ledger")
+    parser.add_argument("--guild", type=int, required=True)
+    parser.add_argument("--format", choices=GuildExporter.FORMATS, default="ndjson")
+    parser.add_argument("--output", default=".", help="directory the files are written to")
+    parser.add_argument("--db-file", default=DATABASE_FILE)
+    parser.add_argument("--partitions", type=int, default=DB_PARTITIONS)
+    parser.add_argument("--part-size", type=int, default=EXPORT_PART_SIZE, help="compressed bytes per file")
+    args = parser.parse_args(argv)
+    
+    db_file = StorageRouter.partition_file(
+        args.db_file, StorageRouter.partition_of(args.guild, args.partitions), args.partitions
+    )
+    if not os.path.exists(db_file):
+        print(f"Export failed: {db_file} does not exist")
+        return 1
+    files = GuildExporter(db_file, args.guild, args.format, args.part_size).export(args.output)
+    for name, paths in files.items():
+        for path in paths:
+            print(f"{name}: {path} ({os.path.getsize(path):,} bytes)")
+    return 0
+
+
+# --- Backups ---
+"""
+Online database snapshots for the Discord gambling bot
+"""
+class BackupManager:
+    """
+    Snapshots one SQLite file with the online backup API on a worker thread,
+    copying step_pages pages per step. The source connection holds a read
+    transaction for the whole copy: under WAL the bot keeps writing, and the
+    copy stays one consistent snapshot instead of restarting every time
+    another connection commits. Each snapshot goes to a temporary file, must
+    pass PRAGMA integrity_check, and is then renamed into place; only the
+    newest `keep` snapshots are kept.
+    """
+    SUFFIX = ".db"
+    TIME_FORMAT = "%Y%m%d-%H%M%S-%f"
+    
+    def __init__(self, db_file: str, directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                 step_pages: int = BACKUP_STEP_PAGES, step_sleep: float = BACKUP_STEP_SLEEP):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.db_file = db_file
+        self.directory = directory
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.last_success = 0.0  # Unix time of the last verified snapshot
+        self._lock = asyncio.Lock()
+    
+    @property
+    def prefix(self) -> str:
+        return os.path.splitext(os.path.basename(self.db_file))[0] + "-"
+    
+    def snapshots(self) -> List[str]:
+        """Existing snapshots of this file, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        stamps = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(self.prefix) and name.endswith(self.SUFFIX)):
+                continue
+            try:
+                datetime.strptime(name[len(self.prefix):-len(self.SUFFIX)], self.TIME_FORMAT)
+            except ValueError:
+                continue  # Another file's snapshot, or not a snapshot at all
+            stamps.append(name)
+        return [os.path.join(self.directory, name) for name in sorted(stamps)]
+    
+    def _copy(self, temp_path: str) -> int:
+        """Copy the database into temp_path, returns the number of backup steps taken"""
+        steps = 0
+        
+        def progress(status, remaining, total):
+            nonlocal steps
+            steps += 1
+        
+        source = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, isolation_level=None)
+        target = sqlite3.connect(temp_path, isolation_level=None)
+        try:
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master").fetchone()  # Pin the snapshot now, not at the first step
+            source.backup(target, pages=self.step_pages, progress=progress, sleep=self.step_sleep)
+            source.execute("COMMIT")
+            
+            result = target.execute("PRAGMA integrity_check").fetchall()
+            if result != [("ok",)]:
+                raise RuntimeError(f"Backup of {self.db_file} failed integrity check: {result[0][0]}")
+            target.execute("PRAGMA journal_mode = DELETE")  # A self-contained file, no -wal beside it
+        finally:
+            source.close()
+            target.close()
+        return steps
+    
+    def backup_sync(self) -> Dict[str, Any]:
+        """Take, verify and rotate in one snapshot; blocking, so run it off the event loop"""
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime(self.TIME_FORMAT)
+        path = os.path.join(self.directory, f"{self.prefix}{stamp}{self.SUFFIX}")
+        temp_path = path + ".tmp"
+        
+        started = time.perf_counter()
+        try:
+            steps = self._copy(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            for leftover in (temp_path, temp_path + "-wal", temp_path + "-shm", temp_path + "-journal"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self.last_success = time.time()
+        
+        removed = []
+        for old in self.snapshots()[:-self.keep]:
+            os.remove(old)
+            removed.append(old)
+        return {
+            "path": path,
+            "bytes": os.path.getsize(path),
+            "steps": steps,
+            "seconds": time.perf_counter() - started,
+            "removed": removed
+        }
+    
+    async def backup(self) -> Dict[str, Any]:
+        """Snapshot on a worker thread; raises RuntimeError if one is already running"""
+        if self._lock.locked():
+            raise RuntimeError(f"A backup of {self.db_file} is already running")
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(None, self.backup_sync)
+
+
+def run_backup_cli(argv: List[str]) -> int:
+    """CLI: python bot.py backup [--output DIR] [--keep N] (safe while the bot is running)"""
+    parser = argparse.ArgumentParser(prog="bot.py backup", description="Take verified snapshots of every partition file")
+    parser.add_argument("--db-file", default=DATABASE_FILE)
+    parser.add_argument("--partitions", type=int, default=DB_PARTITIONS)
+    parser.add_argument("--output", default=BACKUP_DIR, help="directory the snapshots are written to")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="snapshots kept per file")
+    args = parser.parse_args(argv)
+    
+    failed = 0
+    for index in range(args.partitions):
+        db_file = StorageRouter.partition_file(args.db_file, index, args.partitions)
+        if not os.path.exists(db_file):
+            print(f"Skipping {db_file}: does not exist")
+            continue
+        try:
+            result = BackupManager(db_file, args.output, args.keep).backup_sync()
+        except (sqlite3.Error, RuntimeError, OSError) as e:
+            print(f"Backup of {db_file} failed: {e}")
+            failed += 1
+            continue
+        print(f"{db_file} -> {result['path']} ({result['bytes']:,} bytes, {result['steps']} steps, "
+              f"{result['seconds']:.2f}s, {len(result['removed'])} old snapshot(s) removed)")
+    return 1 if failed else 0
+
+
+# --- Storage Interface ---
+"""
+The storage operations Economy and the commands depend on
+"""
+class Storage(Protocol):
+    """
+    Implemented by StorageRouter (SQLite files) and MemoryStorage (dicts with
+    optional checkpoints); create_storage() picks one from STORAGE_ENGINE.
+    A single Database covers everything except the admin tools at the end.
+    """
+    async def start(self): ...
+    async def shutdown(self): ...
+    async def check_writable(self) -> bool: ...
+    def user_lock(self, user_id: int, guild_id: int) -> asyncio.Lock: ...
+    
+    # Balances
+    async def get_user_balance(self, user_id: int, guild_id: int) -> int: ...
+    async def create_user(self, user_id: int, guild_id: int): ...
+    async def update_balance(self, user_id: int, guild_id: int, new_balance: int): ...
+    async def add_to_balance(self, user_id: int, guild_id: int, amount: int) -> int: ...
+    async def subtract_from_balance(self, user_id: int, guild_id: int, amount: int) -> bool: ...
+    async def settle_bet(self, user_id: int, guild_id: int, bet: int, payout: int, games: int = 1,
+                         winnings: Optional[int] = None, losses: Optional[int] = None,
+                         game: Optional[str] = None, wins: Optional[int] = None) -> Optional[int]: ...
+    async def bulk_add_to_balance(self, guild_id: int, user_ids: List[int], amount: int,
+                                  progress: Optional[Callable[[int, int], Any]] = None) -> int: ...
+    async def reset_guild(self, guild_id: int, progress: Optional[Callable[[int, int], Any]] = None) -> int: ...
+    
+    # Statistics
+    async def update_stats(self, user_id: int, guild_id: int, winnings: int = 0, losses: int = 0): ...
+    async def get_user_stats(self, user_id: int, guild_id: int) -> Optional[Dict[str, int]]: ...
+    async def get_game_stats(self, user_id: int, guild_id: int) -> Dict[str, Dict[str, Dict[str, int]]]: ...
+    
+    # Leaderboards
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple[int, int]]: ...
+    def leaderboard_version(self, guild_id: int) -> int: ...
+    async def get_rank(self, user_id: int, guild_id: int) -> Tuple[Optional[Tuple[int, int]], int]: ...
+    async def get_leaderboard_page(self, guild_id: int, page: int,
+                                   page_size: int = LEADERBOARD_SIZE) -> Tuple[List[Tuple[int, int]], int]: ...
+    
+    # Cooldowns and settings
+    async def check_cooldown(self, user_id: int, guild_id: int, command: str) -> float: ...
+    async def set_cooldown(self, user_id: int, guild_id: int, command: str, seconds: float): ...
+    async def acquire_cooldown(self, user_id: int, guild_id: int, command: str,
+                               seconds: Optional[float] = None) -> float: ...
+    def settings(self, guild_id: int) -> GuildSettings: ...
+    async def update_settings(self, guild_id: int, changes: Dict[str, Any]) -> GuildSettings: ...
+    
+    # Admin tools
+    async def export_guild(self, guild_id: int, directory: str, fmt: str = "ndjson",
+                           part_size: int = EXPORT_PART_SIZE) -> Dict[str, List[str]]: ...
+    async def backup(self) -> List[Dict[str, Any]]: ...
+
 
-# --- Database Operations (from database.py) ---
+# --- In-Memory Storage ---
 """
-Database operations for the Discord gambling bot
+Dict-backed storage engine with optional checkpoints to SQLite
 """
-class Database:
-    def __init__(self):
-        self.db_file = DATABASE_FILE
-        self.init_database()
+@instrument_methods("db")
+class MemoryStorage:
+    """
+    Keeps every user row, ranking and game rollup in Python dicts, so no
+    operation waits on disk and each one is atomic on the event loop.
     
-    def init_database(self):
-        """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # Users table for economy data
-        cursor.execute(f'''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER,
-                guild_id INTEGER,
-                balance INTEGER DEFAULT {INITIAL_BALANCE},
-                total_winnings INTEGER DEFAULT 0,
-                total_losses INTEGER DEFAULT 0,
-                games_played INTEGER DEFAULT 0,
-                PRIMARY KEY (user_id, guild_id)
-            )
-        ''')
+    Without a checkpoint file nothing touches the disk, which suits tests and
+    the benchmark. With one, state is loaded from it at start, and the rows
+    changed since the last checkpoint are written back with the new ledger
+    entries in one transaction every interval and at shutdown. The file has
+    the normal schema, so the SQLite engine and the export, backup and
+    migrate tools all work on it.
+    """
+    def __init__(self, checkpoint_file: Optional[str] = MEMORY_CHECKPOINT_FILE,
+                 interval: float = MEMORY_CHECKPOINT_INTERVAL):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.checkpoint_file = checkpoint_file or None
+        self.interval = interval
+        self.pool = ConnectionPool(checkpoint_file) if checkpoint_file else None
+        if self.pool is not None:
+            self.pool.write_sync(SchemaMigrator().run, False, False)
+        self.users: Dict[int, Dict[int, UserRow]] = {}  # guild_id -> user_id -> row
+        self.rankings: Dict[int, GuildRanking] = {}
+        self.leaderboards: Dict[int, GuildLeaderboard] = {}
+        # (user_id, guild_id) -> {(rollup table, bucket, game): [rounds, wins, wagered, paid_out]}
+        self.game_stats: Dict[Tuple[int, int], Dict[tuple, List[int]]] = {}
+        self.cooldowns = CooldownEngine(self.pool)
+        self.guild_config = GuildConfig(self.pool, self.cooldowns)
+        self.user_locks = KeyedLocks()
+        self.backups = BackupManager(checkpoint_file) if checkpoint_file else None
+        self._dirty: set = set()
+        self._ledger: List[tuple] = []
+        self._checkpoint_lock = asyncio.Lock()
+        self._checkpoint_failed = False
+        self._task: Optional[asyncio.Task] = None
+    
+    def user_lock(self, user_id: int, guild_id: int) -> asyncio.Lock:
+        """Lock every balance-changing command takes for its user"""
+        return self.user_locks((user_id, guild_id))
+    
+    async def start(self):
+        """Load the checkpoint and start background work"""
+        if self._task is not None:
+            return
+        if self.pool is not None:
+            await self._load()
+            await self.cooldowns.start()
+        await self.guild_config.start()
+        self._task = asyncio.create_task(self._maintain())
+    
+    async def shutdown(self):
+        """Stop background work and write a final checkpoint"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.guild_config.close()
+        if self.pool is not None:
+            await self.cooldowns.close()
+            await self.checkpoint()
+            await asyncio.get_running_loop().run_in_executor(None, self.pool.close)
+    
+    async def check_writable(self) -> bool:
+        """False while checkpoints are failing, changes are then only held in memory"""
+        return not self._checkpoint_failed
+    
+    async def _load(self):
+        """Fill memory from the checkpoint file"""
+        now = int(time.time())
+        hour = now - now % 3600
+        day = now - now % 86400
         
-        # Cooldowns table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cooldowns (
-                user_id INTEGER,
-                guild_id INTEGER,
-                command TEXT,
-                expires_at TEXT,
-                PRIMARY KEY (user_id, guild_id, command)
-            )
-        ''')
+        def read(conn: sqlite3.Connection):
+            users = conn.execute(
+                'SELECT user_id, guild_id, balance, total_winnings, total_losses, games_played FROM users'
+            ).fetchall()
+            # Only the buckets the stats windows can still reach
+            rollups = [
+                ("game_stats", conn.execute(
+                    'SELECT user_id, guild_id, NULL, game, rounds, wins, wagered, paid_out FROM game_stats'
+                ).fetchall()),
+                ("game_stats_hourly", conn.execute(
+                    '''SELECT user_id, guild_id, bucket, game, rounds, wins, wagered, paid_out
+                       FROM game_stats_hourly WHERE bucket >= ?''', (hour - 23 * 3600,)
+                ).fetchall()),
+                ("game_stats_daily", conn.execute(
+                    '''SELECT user_id, guild_id, bucket, game, rounds, wins, wagered, paid_out
+                       FROM game_stats_daily WHERE bucket >= ?''', (day - 6 * 86400,)
+                ).fetchall())
+            ]
+            return users, rollups
         
-        conn.commit()
-        conn.close()
+        users, rollups = await self.pool.read(read)
+        for user_id, guild_id, *values in users:
+            self.users.setdefault(guild_id, {})[user_id] = UserRow(*values)
+            self._ranking(guild_id).update(user_id, values[0])
+        for table, rows in rollups:
+            for user_id, guild_id, bucket, game, *totals in rows:
+                self.game_stats.setdefault((user_id, guild_id), {})[(table, bucket, game)] = totals
+        print(f"Loaded {len(users):,} users from {self.checkpoint_file}")
+    
+    async def checkpoint(self) -> int:
+        """Write rows changed since the last checkpoint and new ledger entries in one transaction"""
+        if self.pool is None:
+            return 0
+        async with self._checkpoint_lock:
+            dirty, self._dirty = self._dirty, set()
+            entries, self._ledger = self._ledger, []
+            rows = []
+            for user_id, guild_id in dirty:
+                row = self.users[guild_id][user_id]
+                rows.append((user_id, guild_id, row.balance, row.total_winnings, row.total_losses, row.games_played))
+            try:
+                await self.pool.write(self._write_checkpoint, rows, entries)
+            except BaseException:
+                # Retried by the next checkpoint; rows changed meanwhile are already marked again
+                self._dirty |= dirty
+                self._ledger[:0] = entries
+                self._checkpoint_failed = True
+                raise
+            self._checkpoint_failed = False
+            return len(rows)
+    
+    @staticmethod
+    def _write_checkpoint(conn: sqlite3.Connection, rows: List[tuple], entries: List[tuple]):
+        conn.executemany(
+            '''INSERT INTO users (user_id, guild_id, balance, total_winnings, total_losses, games_played)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (user_id, guild_id) DO UPDATE SET
+               balance = excluded.balance,
+               total_winnings = excluded.total_winnings,
+               total_losses = excluded.total_losses,
+               games_played = excluded.games_played''',
+            rows
+        )
+        GameLedger.write(conn, entries)
+    
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self._prune_game_stats()
+                if self.pool is None:
+                    self.cooldowns.expire()  # Normally done by the cooldown snapshot task
+                else:
+                    await self.checkpoint()
+            except Exception as e:
+                print(f"Memory storage checkpoint failed: {e}")
+    
+    def _prune_game_stats(self):
+        """Drop rollup buckets too old for any stats window"""
+        now = int(time.time())
+        oldest = {"game_stats_hourly": now - now % 3600 - 23 * 3600, "game_stats_daily": now - now % 86400 - 6 * 86400}
+        for stats in self.game_stats.values():
+            for key in [key for key in stats if key[0] in oldest and key[1] < oldest[key[0]]]:
+                del stats[key]
+    
+    def _ranking(self, guild_id: int) -> GuildRanking:
+        ranking = self.rankings.get(guild_id)
+        if ranking is None:
+            ranking = self.rankings[guild_id] = GuildRanking()
+        return ranking
+    
+    def _changed(self, user_id: int, guild_id: int, row: UserRow):
+        """Mark a row for the next checkpoint and update the guild's rankings"""
+        self._dirty.add((user_id, guild_id))
+        self._ranking(guild_id).update(user_id, row.balance)
+        board = self.leaderboards.get(guild_id)
+        if board is not None:
+            board.update(user_id, row.balance)
+    
+    def _row(self, user_id: int, guild_id: int, create: bool = True) -> Optional[UserRow]:
+        guild = self.users.get(guild_id)
+        row = guild.get(user_id) if guild is not None else None
+        if row is None and create:
+            row = self.users.setdefault(guild_id, {})[user_id] = UserRow(INITIAL_BALANCE)
+            self._changed(user_id, guild_id, row)
+        return row
+    
+    def _record_game(self, entry: tuple):
+        """Fold a ledger entry into the user's rollups, and keep it for the checkpoint"""
+        user_id, guild_id, game, rounds, wins, bet, payout, ts = entry
+        stats = self.game_stats.setdefault((user_id, guild_id), {})
+        for table, bucket_seconds in GameLedger.ROLLUPS:
+            key = (table, ts - ts % bucket_seconds if bucket_seconds else None, game)
+            total = stats.get(key)
+            if total is None:
+                stats[key] = [rounds, wins, bet, payout]
+            else:
+                total[0] += rounds
+                total[1] += wins
+                total[2] += bet
+                total[3] += payout
+        if self.pool is not None:
+            self._ledger.append(entry)
     
     async def get_user_balance(self, user_id: int, guild_id: int) -> int:
         """Get user's current balance"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT balance FROM users WHERE user_id = ? AND guild_id = ?',
-            (user_id, guild_id)
-        )
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return result[0]
-        else:
-            # Create new user with initial balance
-            await self.create_user(user_id, guild_id)
-            return INITIAL_BALANCE
+        return self._row(user_id, guild_id).balance
     
     async def create_user(self, user_id: int, guild_id: int):
-        """Create a new user in the database"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''INSERT OR IGNORE INTO users (user_id, guild_id, balance) 
-               VALUES (?, ?, ?)''',
-            (user_id, guild_id, INITIAL_BALANCE)
-        )
-        
-        conn.commit()
-        conn.close()
+        """Create a new user with the initial balance"""
+        self._row(user_id, guild_id)
     
     async def update_balance(self, user_id: int, guild_id: int, new_balance: int):
         """Update user's balance"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''UPDATE users SET balance = ? 
-               WHERE user_id = ? AND guild_id = ?''',
-            (new_balance, user_id, guild_id)
-        )
-        
-        conn.commit()
-        conn.close()
+        row = self._row(user_id, guild_id)
+        row.balance = new_balance
+        self._changed(user_id, guild_id, row)
     
-    async def add_to_balance(self, user_id: int, guild_id: int, amount: int):
+    async def add_to_balance(self, user_id: int, guild_id: int, amount: int) -> int:
         """Add amount to user's balance"""
-        current_balance = await self.get_user_balance(user_id, guild_id)
-        new_balance = current_balance + amount
-        await self.update_balance(user_id, guild_id, new_balance)
-        return new_balance
+        row = self._row(user_id, guild_id)
+        row.balance += amount
+        self._changed(user_id, guild_id, row)
+        return row.balance
     
     async def subtract_from_balance(self, user_id: int, guild_id: int, amount: int) -> bool:
         """Subtract amount from user's balance, return False if insufficient funds"""
-        current_balance = await self.get_user_balance(user_id, guild_id)
+        row = self._row(user_id, guild_id, create=False)
+        if row is None or row.balance < amount:
+            return False
+        row.balance -= amount
+        self._changed(user_id, guild_id, row)
+        return True
+    
+    async def settle_bet(self, user_id: int, guild_id: int, bet: int, payout: int, games: int = 1,
+                         winnings: Optional[int] = None, losses: Optional[int] = None,
+                         game: Optional[str] = None, wins: Optional[int] = None) -> Optional[int]:
+        """Settle finished games like Database.settle_bet, returns the new balance or None"""
+        net = payout - bet
+        if winnings is None:
+            winnings = max(net, 0)
+        if losses is None:
+            losses = max(-net, 0)
+        if wins is None:
+            wins = int(net > 0)
         
-        if current_balance >= amount:
-            new_balance = current_balance - amount
-            await self.update_balance(user_id, guild_id, new_balance)
-            return True
-        return False
+        row = self._row(user_id, guild_id)
+        if row.balance < bet:
+            return None
+        row.add(net, winnings, losses, games)
+        self._changed(user_id, guild_id, row)
+        if game:
+            self._record_game(GameLedger.entry(user_id, guild_id, game, games, wins, bet, payout))
+        return row.balance
+    
+    async def bulk_add_to_balance(self, guild_id: int, user_ids: List[int], amount: int,
+                                  progress: Optional[Callable[[int, int], Any]] = None) -> int:
+        """Add amount to many users' balances, creating missing users. Returns the users updated"""
+        return await self._bulk_update(guild_id, user_ids, amount, None, progress)
+    
+    async def reset_guild(self, guild_id: int, progress: Optional[Callable[[int, int], Any]] = None) -> int:
+        """Set every user of a guild back to the initial balance. Returns the users reset"""
+        return await self._bulk_update(guild_id, list(self.users.get(guild_id, {})), None, INITIAL_BALANCE, progress)
+    
+    async def _bulk_update(self, guild_id: int, user_ids: List[int], amount: Optional[int],
+                           absolute: Optional[int], progress: Optional[Callable[[int, int], Any]]) -> int:
+        """Chunked like Database._bulk_update, so games keep running between chunks"""
+        user_ids = list(dict.fromkeys(user_ids))
+        done = 0
+        for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+            chunk = user_ids[start:start + BULK_CHUNK_SIZE]
+            async with self.user_locks.hold((user_id, guild_id) for user_id in chunk):
+                for user_id in chunk:
+                    row = self._row(user_id, guild_id)
+                    row.balance = absolute if absolute is not None else row.balance + amount
+                    self._changed(user_id, guild_id, row)
+            done += len(chunk)
+            if progress is not None:
+                await progress(done, len(user_ids))
+            await asyncio.sleep(0)
+        return done
     
     async def update_stats(self, user_id: int, guild_id: int, winnings: int = 0, losses: int = 0):
         """Update user's gambling statistics"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        row = self._row(user_id, guild_id, create=False)
+        if row is not None:
+            row.add(0, winnings, losses, 1)
+            self._changed(user_id, guild_id, row)
+    
+    async def get_user_stats(self, user_id: int, guild_id: int) -> Optional[Dict[str, int]]:
+        """Get user's complete statistics"""
+        row = self._row(user_id, guild_id, create=False)
+        return row.as_dict() if row is not None else None
+    
+    async def get_game_stats(self, user_id: int, guild_id: int) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Per-game totals and recent activity windows, shaped like GameLedger.fetch_summary"""
+        now = int(time.time())
+        hour = now - now % 3600
+        day = now - now % 86400
+        stats = self.game_stats.get((user_id, guild_id), {})
         
-        cursor.execute(
-            '''UPDATE users SET 
-               total_winnings = total_winnings + ?,
-               total_losses = total_losses + ?,
-               games_played = games_played + 1
-               WHERE user_id = ? AND guild_id = ?''',
-            (winnings, losses, user_id, guild_id)
-        )
+        def collect(table: str, since: Optional[int]) -> Dict[str, Dict[str, int]]:
+            result: Dict[str, Dict[str, int]] = {}
+            for (rollup, bucket, game), totals in stats.items():
+                if rollup != table or (since is not None and bucket < since):
+                    continue
+                summed = result.setdefault(GameLedger.NAMES.get(game, str(game)),
+                                           {'rounds': 0, 'wins': 0, 'wagered': 0, 'paid_out': 0})
+                for field, value in zip(('rounds', 'wins', 'wagered', 'paid_out'), totals):
+                    summed[field] += value
+            return result
         
-        conn.commit()
-        conn.close()
+        return {
+            'games': collect("game_stats", None),
+            'windows': {
+                'hour': collect("game_stats_hourly", hour),
+                'day': collect("game_stats_hourly", hour - 23 * 3600),
+                'week': collect("game_stats_daily", day - 6 * 86400)
+            }
+        }
     
-    async def get_leaderboard(self, guild_id: int, limit: int = 10):
+    def _board(self, guild_id: int) -> GuildLeaderboard:
+        board = self.leaderboards.get(guild_id)
+        if board is None:
+            board = self.leaderboards[guild_id] = GuildLeaderboard()
+        if board.stale:
+            board.load(self._ranking(guild_id).page(0, board.capacity))
+        return board
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Tuple[int, int]]:
         """Get top users by balance for a guild"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT user_id, balance FROM users 
-               WHERE guild_id = ? 
-               ORDER BY balance DESC 
-               LIMIT ?''',
-            (guild_id, limit)
-        )
+        if limit <= LEADERBOARD_TRACKED:
+            return self._board(guild_id).top(limit)
+        return self._ranking(guild_id).page(0, limit)
+    
+    def leaderboard_version(self, guild_id: int) -> int:
+        """Changes whenever the visible top of a guild's leaderboard changes"""
+        board = self.leaderboards.get(guild_id)
+        return board.version if board is not None else 0
+    
+    async def get_rank(self, user_id: int, guild_id: int) -> Tuple[Optional[Tuple[int, int]], int]:
+        """A player's (rank, balance), or None if unranked, and the number of ranked players"""
+        ranking = self._ranking(guild_id)
+        return ranking.rank(user_id), len(ranking)
+    
+    async def get_leaderboard_page(self, guild_id: int, page: int,
+                                   page_size: int = LEADERBOARD_SIZE) -> Tuple[List[Tuple[int, int]], int]:
+        """One leaderboard page (1-based) as (user_id, balance) rows, and the number of ranked players"""
+        ranking = self._ranking(guild_id)
+        return ranking.page((page - 1) * page_size, page_size), len(ranking)
+    
+    def settings(self, guild_id: int) -> GuildSettings:
+        """A guild's current settings"""
+        return self.guild_config.get(guild_id)
+    
+    async def update_settings(self, guild_id: int, changes: Dict[str, Any]) -> GuildSettings:
+        """Change a guild's settings, None values restore defaults; raises ValueError if invalid"""
+        return await self.guild_config.update(guild_id, changes)
+    
+    async def check_cooldown(self, user_id: int, guild_id: int, command: str) -> float:
+        """Get the seconds remaining on a user's cooldown, 0 if none"""
+        return self.cooldowns.remaining(user_id, guild_id, command)
+    
+    async def set_cooldown(self, user_id: int, guild_id: int, command: str, seconds: float):
+        """Put a user on cooldown for a command"""
+        self.cooldowns.start_cooldown(user_id, guild_id, command, seconds)
+    
+    async def acquire_cooldown(self, user_id: int, guild_id: int, command: str,
+                               seconds: Optional[float] = None) -> float:
+        """
+        Check and start a cooldown in one step
+        Returns the seconds remaining if the user is already on cooldown, 0 otherwise
+        """
+        return self.cooldowns.acquire(user_id, guild_id, command, seconds)
+    
+    async def export_guild(self, guild_id: int, directory: str, fmt: str = "ndjson",
+                           part_size: int = EXPORT_PART_SIZE) -> Dict[str, List[str]]:
+        """Checkpoint, then stream the guild's data from the checkpoint file in a worker thread"""
+        if self.pool is None:
+            raise RuntimeError("Exports from the memory engine need a checkpoint file (MEMORY_CHECKPOINT_FILE)")
+        await self.checkpoint()
+        exporter = GuildExporter(self.checkpoint_file, guild_id, fmt, part_size)
+        return await asyncio.get_running_loop().run_in_executor(None, exporter.export, directory)
+    
+    async def backup(self) -> List[Dict[str, Any]]:
+        """Checkpoint, then take a verified snapshot of the checkpoint file"""
+        if self.backups is None:
+            raise RuntimeError("Backups of the memory engine need a checkpoint file (MEMORY_CHECKPOINT_FILE)")
+        await self.checkpoint()
+        return [await self.backups.backup()]
+
+
+def create_storage(engine: str = STORAGE_ENGINE) -> Storage:
+    """The storage engine named by STORAGE_ENGINE"""
+    if engine == "sqlite":
+        return StorageRouter()
+    if engine == "memory":
+        if DB_PARTITIONS > 1 or SHARD_IDS is not None:
+            raise ValueError("The memory engine runs in a single process, use the sqlite engine with "
+                             "DB_PARTITIONS or SHARD_IDS")
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_ENGINE {engine!r}, use 'sqlite' or 'memory'")
+
+
+# --- Random Number Generation ---
+"""
+Pluggable random number generation for the gambling games
+"""
+class BufferedRNG:
+    """
+    Block-buffered source of uniform floats in [0, 1). Blocks are generated
+    ahead of time (from os.urandom, or from a seeded Mersenne Twister), so the
+    hot path is a list index. With background=True a daemon thread keeps
+    RNG_PREFETCH_BLOCKS blocks ready; if consumers outrun it, a block is
+    generated inline.
+    
+    Seeded generators produce the same sequence regardless of block
+    boundaries, which makes sessions replayable bit-for-bit.
+    """
+    _SCALE = 2.0 ** -53
+    
+    def __init__(self, seed: Optional[int] = None, block_size: int = RNG_BLOCK_SIZE,
+                 prefetch: int = RNG_PREFETCH_BLOCKS, background: bool = False):
+        self.seed = seed
+        self.block_size = block_size
+        self.prefetch = prefetch
+        self.draws = 0  # Values handed out so far, the replay position
+        self._source = random.Random(seed) if seed is not None else None
+        self._source_lock = threading.Lock()
+        self._blocks: deque = deque()
+        self._block: List[float] = []
+        self._pos = 0
         
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        self._wanted: Optional[threading.Event] = None
+        if background:
+            self._wanted = threading.Event()
+            self._wanted.set()
+            threading.Thread(target=self._refill_loop, name="rng-refill", daemon=True).start()
     
-    async def get_user_stats(self, user_id: int, guild_id: int):
-        """Get user's complete statistics"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+    def _generate(self) -> List[float]:
+        with self._source_lock:
+            if self._source is not None:
+                source = self._source.random
+                return [source() for _ in range(self.block_size)]
+            # CSPRNG: 53 random bits per float, like random.random()
+            words = struct.unpack(f'<{self.block_size}Q', os.urandom(8 * self.block_size))
+        scale = self._SCALE
+        return [(word >> 11) * scale for word in words]
+    
+    def _refill_loop(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            while len(self._blocks) < self.prefetch:
+                self._blocks.append(self._generate())
+    
+    def _next_block(self):
+        try:
+            self._block = self._blocks.popleft()
+        except IndexError:
+            self._block = self._generate()
+        self._pos = 0
+        if self._wanted is not None and len(self._blocks) < self.prefetch:
+            self._wanted.set()
+    
+    def random(self) -> float:
+        """Next float in [0, 1)"""
+        if self._pos >= len(self._block):
+            self._next_block()
+        value = self._block[self._pos]
+        self._pos += 1
+        self.draws += 1
+        return value
+    
+    def randbelow(self, n: int) -> int:
+        """Next integer in [0, n)"""
+        return int(self.random() * n)
+    
+    def choice(self, seq):
+        return seq[self.randbelow(len(seq))]
+
+
+class RNGProvider:
+    """
+    Hands out the generator a game should draw from. In "system" mode every
+    guild shares one CSPRNG-backed buffer refilled in the background; in
+    "seeded" mode each guild gets its own deterministic stream derived from
+    the seed, so a recorded session can be replayed by re-running its
+    commands against a fresh provider with the same seed.
+    """
+    MODES = ("system", "seeded")
+    
+    def __init__(self, mode: str = RNG_MODE, seed: int = RNG_SEED):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown RNG mode: {mode}")
+        self.mode = mode
+        self.seed = seed
+        self._shared: Optional[BufferedRNG] = None
+        self._guilds: Dict[int, BufferedRNG] = {}
+    
+    @staticmethod
+    def guild_seed(seed: int, guild_id: int) -> int:
+        return (seed << 64) ^ guild_id
+    
+    def for_guild(self, guild_id: int) -> BufferedRNG:
+        if self.mode == "system":
+            if self._shared is None:
+                self._shared = BufferedRNG(background=True)
+            return self._shared
         
-        cursor.execute(
-            '''SELECT balance, total_winnings, total_losses, games_played 
-               FROM users WHERE user_id = ? AND guild_id = ?''',
-            (user_id, guild_id)
-        )
+        rng = self._guilds.get(guild_id)
+        if rng is None:
+            rng = self._guilds[guild_id] = BufferedRNG(seed=self.guild_seed(self.seed, guild_id))
+        return rng
+    
+    def position(self, guild_id: int) -> int:
+        """Draws consumed by a guild's stream (seeded mode), for dispute records"""
+        rng = self._guilds.get(guild_id)
+        return rng.draws if rng is not None else 0
+    
+    def reset(self, guild_id: int):
+        """Restart a guild's seeded stream from the beginning"""
+        self._guilds.pop(guild_id, None)
+
+
+# --- Slots Engine ---
+"""
+Precompiled slot machine tables for the Discord gambling bot
+"""
+class SlotsEngine:
+    """
+    Compiles the symbol weights and multipliers once: symbols become integer
+    codes drawn from a Vose alias table (one uniform draw per symbol), and
+    every possible payline is classified up front in an outcome lookup table.
+    Also exposes the exact probability of each outcome and the expected payout.
+    """
+    NO_WIN, DOUBLE, TRIPLE, JACKPOT = 0, 1, 2, 3
+    OUTCOMES = ("none", "double", "triple", "jackpot")
+    MAX_TABLE_SIZE = 1_000_000
+    
+    def __init__(self, symbols: Dict[str, int] = SLOTS_SYMBOLS, multipliers: Dict[str, float] = SLOTS_MULTIPLIERS,
+                 reels: int = SLOTS_REELS, rows: int = SLOTS_ROWS, paylines: List[tuple] = SLOTS_PAYLINES,
+                 jackpot_symbol: str = SLOTS_JACKPOT_SYMBOL):
+        if any(len(line) != reels or not all(0 <= row < rows for row in line) for line in paylines):
+            raise ValueError(f"Every payline needs one row index (0-{rows - 1}) per reel ({reels} reels)")
+        if len(symbols) ** reels > self.MAX_TABLE_SIZE:
+            raise ValueError(f"{len(symbols)} symbols on {reels} reels is too many outcomes to tabulate")
         
-        result = cursor.fetchone()
-        conn.close()
+        self.symbols = list(symbols.keys())
+        self.weights = list(symbols.values())
+        self.reels = reels
+        self.rows = rows
+        self.paylines = [tuple(line) for line in paylines]
+        self.jackpot_code = self.symbols.index(jackpot_symbol) if jackpot_symbol in symbols else -1
+        self.multipliers = (0.0, multipliers["double"], multipliers["triple"], multipliers["jackpot"])
         
-        if result:
-            return {
-                'balance': result[0],
-                'total_winnings': result[1],
-                'total_losses': result[2],
-                'games_played': result[3]
-            }
-        return None
+        self._prob, self._alias = self._build_alias(self.weights)
+        self._place = [len(self.symbols) ** reel for reel in range(reels)]
+        self.outcome_table = bytearray(len(self.symbols) ** reels)
+        for codes in itertools.product(range(len(self.symbols)), repeat=reels):
+            self.outcome_table[self.line_index(codes)] = self.classify(codes)
+    
+    @staticmethod
+    def _build_alias(weights: List[int]) -> Tuple[List[float], List[int]]:
+        """Vose's alias method: O(1) weighted sampling from a single uniform draw"""
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        return prob, alias
+    
+    def classify(self, codes) -> int:
+        """Outcome of one payline of symbol codes"""
+        distinct = len(set(codes))
+        if distinct == 1:
+            return self.JACKPOT if codes[0] == self.jackpot_code else self.TRIPLE
+        if distinct < len(codes):
+            return self.DOUBLE
+        return self.NO_WIN
+    
+    def line_index(self, codes) -> int:
+        return sum(code * place for code, place in zip(codes, self._place))
+    
+    def draw(self, rng) -> int:
+        """Draw one symbol code; rng needs a random() method"""
+        u = rng.random() * len(self._prob)
+        column = int(u)
+        return column if u - column < self._prob[column] else self._alias[column]
+    
+    def spin(self, rng) -> Tuple[List[List[int]], List[int]]:
+        """Spin every reel, returns (grid[reel][row], outcome per payline)"""
+        grid = [[self.draw(rng) for _ in range(self.rows)] for _ in range(self.reels)]
+        outcomes = [
+            self.outcome_table[self.line_index([grid[reel][row] for reel, row in enumerate(line)])]
+            for line in self.paylines
+        ]
+        return grid, outcomes
+    
+    def line_payout(self, outcome: int, bet_amount: int) -> int:
+        """Coins paid by one payline"""
+        return int(bet_amount * self.multipliers[outcome] / len(self.paylines))
     
+    def probabilities(self) -> Dict[str, float]:
+        """Exact probability of each outcome on a single payline"""
+        total = sum(self.weights)
+        p = [w / total for w in self.weights]
+        result = [0.0] * len(self.OUTCOMES)
+        for codes in itertools.product(range(len(self.symbols)), repeat=self.reels):
+            result[self.outcome_table[self.line_index(codes)]] += math.prod(p[code] for code in codes)
+        return dict(zip(self.OUTCOMES, result))
     
+    def expected_payout(self, bet_amount: int) -> float:
+        """Exact expected payout of one spin across all paylines"""
+        probabilities = self.probabilities()
+        per_line = sum(probabilities[name] * self.line_payout(outcome, bet_amount)
+                       for outcome, name in enumerate(self.OUTCOMES))
+        return per_line * len(self.paylines)
+
 
 # --- Gambling Games Implementation (from games.py) ---
 """
 Gambling games implementation for the Discord bot
 """
 class GamblingGames:
+    slots_engine = SlotsEngine()  # Compiled once from SLOTS_SYMBOLS / SLOTS_MULTIPLIERS
+    
+    def __init__(self, rng: Optional[RNGProvider] = None,
+                 settings: Optional[Callable[[int], GuildSettings]] = None):
+        self.rng = rng or RNGProvider()
+        self.settings = settings or (lambda guild_id: DEFAULT_GUILD_SETTINGS)
+        self._slots_engines: Dict[int, Tuple[int, SlotsEngine]] = {}
+    
+    def _slots_engine(self, guild_id: int) -> SlotsEngine:
+        """Engine for a guild's slots multipliers, recompiled when its settings version changes"""
+        settings = self.settings(guild_id)
+        if settings.slots_multipliers == SLOTS_MULTIPLIERS:
+            return self.slots_engine
+        cached = self._slots_engines.get(guild_id)
+        if cached is None or cached[0] != settings.version:
+            cached = self._slots_engines[guild_id] = (settings.version, SlotsEngine(multipliers=settings.slots_multipliers))
+        return cached[1]
+    
+    FLIP_CHOICES = ('heads', 'tails')
     
     @staticmethod
-    def coin_flip(bet_amount: int, user_choice: str) -> Tuple[bool, int, str]:
+    def flip_choice_error(user_choice: str) -> Optional[str]:
+        """Why a coin flip call is invalid, None if it's fine"""
+        if user_choice.lower() not in GamblingGames.FLIP_CHOICES:
+            return "Invalid choice! Use 'heads' or 'tails'"
+        return None
+    
+    @staticmethod
+    def dice_target_error(target_number: Optional[int]) -> Optional[str]:
+        """Why a dice target is invalid, None if it's fine (None means the default 6)"""
+        if target_number is not None and not 1 <= target_number <= 6:
+            return "Invalid target! Choose a number between 1 and 6"
+        return None
+    
+    def coin_flip(self, bet_amount: int, user_choice: str, guild_id: int = 0) -> Tuple[bool, int, str]:
         """
-        Coin flip game
+        Coin flip game, raises ValueError for an invalid choice
         Returns: (won, payout, result_message)
         """
-        choices = ['heads', 'tails']
-        result = random.choice(choices)
-        
+        error = self.flip_choice_error(user_choice)
+        if error:
+            raise ValueError(error)
         user_choice = user_choice.lower()
-        if user_choice not in choices:
-            return False, 0, "Invalid choice! Use 'heads' or 'tails'"
         
+        result = self.rng.for_guild(guild_id).choice(self.FLIP_CHOICES)
         won = user_choice == result
-        payout = int(bet_amount * COIN_FLIP_MULTIPLIER) if won else 0
+        payout = int(bet_amount * self.settings(guild_id).flip_multiplier) if won else 0
         
         result_message = f"🪙 The coin landed on **{result}**! "
         if won:
@@ -242,24 +3681,23 @@ class GamblingGames:
         
         return won, payout, result_message
     
-    @staticmethod
-    def dice_roll(bet_amount: int, target_number: int = 6) -> Tuple[bool, int, str]:
+    def dice_roll(self, bet_amount: int, target_number: int = 6, guild_id: int = 0) -> Tuple[bool, int, str]:
         """
-        Dice roll game - win by rolling a 6, or specify target
+        Dice roll game - win by rolling a 6, or specify target (ValueError if out of range)
         Returns: (won, payout, result_message)
         """
+        error = self.dice_target_error(target_number)
+        if error:
+            raise ValueError(error)
         if target_number is None: # Ensure target_number is not None if default is used
             target_number = 6
         
-        if target_number < 1 or target_number > 6:
-            return False, 0, "Invalid target! Choose a number between 1 and 6"
-        
-        roll = random.randint(1, 6)
+        roll = self.rng.for_guild(guild_id).randbelow(6) + 1
         won = roll == target_number
         
         # Adjust payout based on target difficulty
         if target_number == 6:
-            payout = int(bet_amount * DICE_WIN_MULTIPLIER) if won else 0
+            payout = int(bet_amount * self.settings(guild_id).dice_multiplier) if won else 0
         else:
             # Standard 1/6 chance, so 6x multiplier for fair odds
             payout = int(bet_amount * 2) if won else 0 # Using the same multiplier as default for simplicity
@@ -273,122 +3711,420 @@ class GamblingGames:
         return won, payout, result_message
     
     @staticmethod
-    def _get_weighted_symbol() -> str:
-        """Get a random symbol based on weights"""
-        symbols = list(SLOTS_SYMBOLS.keys())
-        weights = list(SLOTS_SYMBOLS.values())
-        return random.choices(symbols, weights=weights, k=1)[0]
+    def _slots_headline(outcome: int, symbol: str) -> str:
+        if outcome == SlotsEngine.JACKPOT:
+            return "🔥 **JACKPOT!** 🔥"
+        if outcome == SlotsEngine.TRIPLE:
+            return f"🎉 **TRIPLE {symbol}!**"
+        return "✨ **DOUBLE MATCH!**"
     
-    @staticmethod
-    def slots(bet_amount: int) -> Tuple[bool, int, str]:
+    def slots(self, bet_amount: int, guild_id: int = 0) -> Tuple[bool, int, str]:
         """
         Slot machine game
         Returns: (won, payout, result_message)
         """
-        # Generate three symbols
-        symbols = [
-            GamblingGames._get_weighted_symbol(),
-            GamblingGames._get_weighted_symbol(),
-            GamblingGames._get_weighted_symbol()
-        ]
-        
-        result_message = f"🎰 **{symbols[0]} | {symbols[1]} | {symbols[2]}**\n\n"
-        
-        # Check for wins
-        won = False
-        payout = 0
+        engine = self._slots_engine(guild_id)
+        grid, outcomes = engine.spin(self.rng.for_guild(guild_id))
         
-        # Check for jackpot (three 7s)
-        if symbols[0] == symbols[1] == symbols[2] == "7️⃣":
-            won = True
-            payout = int(bet_amount * SLOTS_MULTIPLIERS["jackpot"])
-            result_message += f"🔥 **JACKPOT!** 🔥 You won **{payout}** coins!"
+        rows = [" | ".join(engine.symbols[grid[reel][row]] for reel in range(engine.reels)) for row in range(engine.rows)]
+        result_message = "\n".join(f"🎰 **{row}**" for row in rows) + "\n\n"
         
-        # Check for triple (three of any symbol)
-        elif symbols[0] == symbols[1] == symbols[2]:
-            won = True
-            payout = int(bet_amount * SLOTS_MULTIPLIERS["triple"])
-            result_message += f"🎉 **TRIPLE {symbols[0]}!** You won **{payout}** coins!"
+        payout = sum(engine.line_payout(outcome, bet_amount) for outcome in outcomes)
+        won = payout > 0
         
-        # Check for double (any two matching)
-        elif symbols[0] == symbols[1] or symbols[1] == symbols[2] or symbols[0] == symbols[2]:
-            won = True
-            payout = int(bet_amount * SLOTS_MULTIPLIERS["double"])
-            result_message += f"✨ **DOUBLE MATCH!** You won **{payout}** coins!"
+        if len(engine.paylines) == 1:
+            outcome = outcomes[0]
+            if outcome == SlotsEngine.NO_WIN:
+                result_message += f"💸 No match! You lost **{bet_amount}** coins!"
+            else:
+                first_symbol = engine.symbols[grid[0][engine.paylines[0][0]]]
+                result_message += f"{GamblingGames._slots_headline(outcome, first_symbol)} You won **{payout}** coins!"
+            return won, payout, result_message
         
-        # No win
+        for number, (line, outcome) in enumerate(zip(engine.paylines, outcomes), 1):
+            if outcome != SlotsEngine.NO_WIN:
+                first_symbol = engine.symbols[grid[0][line[0]]]
+                result_message += f"Line {number}: {GamblingGames._slots_headline(outcome, first_symbol)}\n"
+        if won:
+            result_message += f"You won **{payout}** coins!"
         else:
             result_message += f"💸 No match! You lost **{bet_amount}** coins!"
-        
         return won, payout, result_message
     
     @staticmethod
-    def get_game_help() -> str:
-        """Return help text for all games"""
-        help_text = """
+    def _batch_summary(bet_amount: int, payouts: List[int]) -> str:
+        wins = sum(1 for payout in payouts if payout > 0)
+        net = sum(payouts) - bet_amount * len(payouts)
+        return (f"Won **{wins}** of **{len(payouts)}** rounds\n"
+                f"Total bet **{bet_amount * len(payouts)}**, total payout **{sum(payouts)}**\n"
+                f"Net result: **{net:+}** coins {'🎉' if net > 0 else '💸'}")
+    
+    def coin_flip_batch(self, bet_amount: int, user_choice: str, rounds: int,
+                        guild_id: int = 0) -> Tuple[List[int], str]:
+        """
+        Play several coin flips in one call, raises ValueError for an invalid choice
+        Returns: (payout per round, summary_message)
+        """
+        error = self.flip_choice_error(user_choice)
+        if error:
+            raise ValueError(error)
+        user_choice = user_choice.lower()
+        
+        rng = self.rng.for_guild(guild_id)
+        win_payout = int(bet_amount * self.settings(guild_id).flip_multiplier)
+        results = [rng.choice(self.FLIP_CHOICES) for _ in range(rounds)]
+        payouts = [win_payout if result == user_choice else 0 for result in results]
+        
+        heads = results.count('heads')
+        summary = f"🪙 **{heads}** heads, **{rounds - heads}** tails, you called **{user_choice}**\n"
+        return payouts, summary + self._batch_summary(bet_amount, payouts)
+    
+    def dice_roll_batch(self, bet_amount: int, target_number: int, rounds: int,
+                        guild_id: int = 0) -> Tuple[List[int], str]:
+        """
+        Roll the dice several times in one call, raises ValueError if the target is out of range
+        Returns: (payout per round, summary_message)
+        """
+        error = self.dice_target_error(target_number)
+        if error:
+            raise ValueError(error)
+        if target_number is None:
+            target_number = 6
+        
+        rng = self.rng.for_guild(guild_id)
+        multiplier = self.settings(guild_id).dice_multiplier if target_number == 6 else 2
+        win_payout = int(bet_amount * multiplier)
+        rolls = [rng.randbelow(6) + 1 for _ in range(rounds)]
+        payouts = [win_payout if roll == target_number else 0 for roll in rolls]
+        
+        faces = " ".join(f"{face}×{rolls.count(face)}" for face in range(1, 7) if face in rolls)
+        summary = f"🎲 Rolls: {faces}, your target was **{target_number}**\n"
+        return payouts, summary + self._batch_summary(bet_amount, payouts)
+    
+    def slots_batch(self, bet_amount: int, rounds: int, guild_id: int = 0) -> Tuple[List[int], str]:
+        """
+        Spin the slot machine several times in one call
+        Returns: (payout per round, summary_message)
+        """
+        engine = self._slots_engine(guild_id)
+        rng = self.rng.for_guild(guild_id)
+        counts = [0] * len(SlotsEngine.OUTCOMES)
+        payouts = []
+        for _ in range(rounds):
+            _, outcomes = engine.spin(rng)
+            payouts.append(sum(engine.line_payout(outcome, bet_amount) for outcome in outcomes))
+            counts[max(outcomes)] += 1
+        
+        summary = (f"🎰 🔥 Jackpots: **{counts[SlotsEngine.JACKPOT]}** | 🎉 Triples: **{counts[SlotsEngine.TRIPLE]}** | "
+                   f"✨ Doubles: **{counts[SlotsEngine.DOUBLE]}** | 💸 No match: **{counts[SlotsEngine.NO_WIN]}**\n")
+        return payouts, summary + self._batch_summary(bet_amount, payouts)
+    
+    def get_game_help(self, guild_id: int = 0) -> str:
+        """Return help text for all games, with the guild's multipliers"""
+        settings = self.settings(guild_id)
+        help_text = f"""
 🎮 **Available Gambling Games:**
 
-**🪙 Coin Flip** - `!flip <amount> <heads/tails>`
-• Win multiplier: 1.5x
+**🪙 Coin Flip** - `!flip <amount> <heads/tails> [xN]`
+• Win multiplier: {settings.flip_multiplier:g}x
 • 50% chance to win
 
-**🎲 Dice Roll** - `!dice <amount> [target_number]`
-• Default target: 6 (2x multiplier)
+**🎲 Dice Roll** - `!dice <amount> [target_number] [xN]`
+• Default target: 6 ({settings.dice_multiplier:g}x multiplier)
 • Custom target: 2x multiplier (for any target 1-6)
 • 1/6 chance to win
 
-**🎰 Slots** - `!slots <amount>`
-• Triple 7s (Jackpot): 2.5x multiplier
-• Triple any symbol: 2.2x multiplier
-• Double match: 1.8x multiplier
+**🎰 Slots** - `!slots <amount> [xN]`
+• Triple 7s (Jackpot): {settings.slots_jackpot:g}x multiplier
+• Triple any symbol: {settings.slots_triple:g}x multiplier
+• Double match: {settings.slots_double:g}x multiplier
 • Various win chances based on symbol rarity
 
+Add `xN` (up to {MAX_BULK_ROUNDS}) to play N rounds at once, e.g. `!slots 50 x10`
+
 **💰 Economy Commands:**
 • `!balance` - Check your balance
-• `!leaderboard` - View top players
+• `!leaderboard [page]` - View top players
+• `!rank [user]` - See your leaderboard position
 • `!stats` - View your statistics
         """
         return help_text.strip()
 
 
+# --- RTP Simulator ---
+"""
+Monte Carlo return-to-player simulator for the gambling games
+"""
+class RTPSimulator:
+    """
+    Reproduces the rules of GamblingGames.coin_flip, dice_roll and slots with
+    NumPy-batched RNG across a process pool, and reports return-to-player,
+    house edge, variance and a 95% confidence interval per game.
+    """
+    GAMES = ("flip", "dice", "slots")
+    
+    def __init__(self, bet: int = SIMULATION_BET, workers: Optional[int] = None, seed: Optional[int] = None):
+        if np is None:
+            raise RuntimeError("The RTP simulator needs NumPy (pip install numpy)")
+        self.bet = bet
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+    
+    @staticmethod
+    def _payouts(game: str, rng, rounds: int, bet: int):
+        """Payouts of a batch of rounds, following the rules in GamblingGames"""
+        if game == "flip":
+            # The player's pick doesn't matter, both sides are equally likely
+            won = rng.integers(0, 2, rounds, dtype=np.int8) == 0
+            return np.where(won, int(bet * COIN_FLIP_MULTIPLIER), 0)
+        
+        if game == "dice":
+            # Every target has the same odds; the default target 6 uses DICE_WIN_MULTIPLIER
+            won = rng.integers(1, 7, rounds, dtype=np.int8) == 6
+            return np.where(won, int(bet * DICE_WIN_MULTIPLIER), 0)
+        
+        if game == "slots":
+            # Draw whole grids, then classify every payline through the engine's outcome table
+            engine = GamblingGames.slots_engine
+            cumulative = np.cumsum(engine.weights, dtype=np.float64)
+            grid = np.searchsorted(cumulative, rng.random((rounds, engine.reels, engine.rows)) * cumulative[-1],
+                                   side='right')
+            table = np.frombuffer(bytes(engine.outcome_table), dtype=np.uint8)
+            line_payouts = np.array([engine.line_payout(outcome, bet) for outcome in range(len(SlotsEngine.OUTCOMES))],
+                                    dtype=np.int64)
+            
+            payouts = np.zeros(rounds, dtype=np.int64)
+            for line in engine.paylines:
+                index = np.zeros(rounds, dtype=np.int64)
+                for reel, row in enumerate(line):
+                    index += grid[:, reel, row] * len(engine.symbols) ** reel
+                payouts += line_payouts[table[index]]
+            return payouts
+        
+        raise ValueError(f"Unknown game: {game}")
+    
+    @staticmethod
+    def _simulate_chunk(game: str, rounds: int, bet: int, seed) -> Tuple[int, int, int, int]:
+        """Worker entry point, returns (rounds, total payout, sum of squared payouts, wins)"""
+        rng = np.random.default_rng(seed)
+        total = squares = wins = 0
+        done = 0
+        while done < rounds:
+            batch = min(SIMULATION_CHUNK, rounds - done)
+            payouts = RTPSimulator._payouts(game, rng, batch, bet).astype(np.int64)
+            total += int(payouts.sum())
+            squares += int(np.dot(payouts, payouts))
+            wins += int(np.count_nonzero(payouts))
+            done += batch
+        return rounds, total, squares, wins
+    
+    def exact_rtp(self, game: str) -> float:
+        """Analytic return-to-player for comparison with the simulation"""
+        if game == "flip":
+            return 0.5 * int(self.bet * COIN_FLIP_MULTIPLIER) / self.bet
+        if game == "dice":
+            return int(self.bet * DICE_WIN_MULTIPLIER) / 6 / self.bet
+        if game == "slots":
+            return GamblingGames.slots_engine.expected_payout(self.bet) / self.bet
+        raise ValueError(f"Unknown game: {game}")
+    
+    def run(self, game: str, rounds: int = SIMULATION_ROUNDS) -> Dict[str, float]:
+        """Simulate one game and summarize the results"""
+        workers = max(1, min(self.workers, rounds // SIMULATION_CHUNK or 1))
+        shares = [rounds // workers + (1 if i < rounds % workers else 0) for i in range(workers)]
+        seeds = np.random.SeedSequence(self.seed).spawn(workers)
+        
+        started = time.perf_counter()
+        if workers == 1:
+            results = [self._simulate_chunk(game, shares[0], self.bet, seeds[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self._simulate_chunk, [game] * workers, shares,
+                                        [self.bet] * workers, seeds))
+        elapsed = time.perf_counter() - started
+        
+        n = sum(r[0] for r in results)
+        total = sum(r[1] for r in results)
+        squares = sum(r[2] for r in results)
+        wins = sum(r[3] for r in results)
+        
+        # Work in units of the bet: RTP is the mean payout per coin wagered
+        rtp = total / (n * self.bet)
+        variance = squares / (n * self.bet ** 2) - rtp ** 2
+        margin = 1.96 * math.sqrt(max(variance, 0.0) / n)
+        return {
+            'game': game,
+            'rounds': n,
+            'rtp': rtp,
+            'exact_rtp': self.exact_rtp(game),
+            'house_edge': 1 - rtp,
+            'variance': variance,
+            'ci_low': rtp - margin,
+            'ci_high': rtp + margin,
+            'win_rate': wins / n,
+            'rounds_per_second': n / elapsed if elapsed > 0 else float('inf')
+        }
+    
+    @staticmethod
+    def format_report(results: List[Dict[str, float]]) -> str:
+        lines = [f"{'game':<6} {'rounds':>12} {'RTP':>8} {'exact':>8} {'edge':>8} {'variance':>9} {'95% CI':>19} {'win rate':>9} {'rounds/s':>12}"]
+        for r in results:
+            lines.append(
+                f"{r['game']:<6} {r['rounds']:>12,} {r['rtp']:>8.4%} {r['exact_rtp']:>8.4%} {r['house_edge']:>8.4%} {r['variance']:>9.4f} "
+                f"{r['ci_low']:>9.4%}-{r['ci_high']:<9.4%} {r['win_rate']:>9.4%} {r['rounds_per_second']:>12,.0f}"
+            )
+        return "\n".join(lines)
+
+
+def run_simulation_cli(argv: List[str]) -> int:
+    """CLI: python bot.py simulate [--games ...] [--rounds N] [--check]"""
+    parser = argparse.ArgumentParser(prog="bot.py simulate", description="Monte Carlo RTP simulation of the casino games")
+    parser.add_argument("--games", nargs="+", choices=RTPSimulator.GAMES, default=list(RTPSimulator.GAMES))
+    parser.add_argument("--rounds", type=int, default=SIMULATION_ROUNDS, help="rounds per game")
+    parser.add_argument("--bet", type=int, default=SIMULATION_BET)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--check", action="store_true",
+                        help="exit with status 1 unless every game keeps a house edge at 95%% confidence")
+    args = parser.parse_args(argv)
+    
+    simulator = RTPSimulator(bet=args.bet, workers=args.workers, seed=args.seed)
+    results = [simulator.run(game, args.rounds) for game in args.games]
+    print(simulator.format_report(results))
+    
+    if args.check:
+        flipped = [r['game'] for r in results if r['ci_high'] >= 1]
+        if flipped:
+            print(f"House edge not established for: {', '.join(flipped)}")
+            return 1
+    return 0
+
+
+# --- User Name Resolution ---
+"""
+Cached, concurrent user name lookups for the Discord gambling bot
+"""
+class UserNameResolver:
+    """
+    Resolves display names by checking the guild member cache, then a TTL cache
+    of previously resolved names, and only then fetching the remaining users
+    from the API concurrently with bounded parallelism.
+    """
+    def __init__(self, max_size: int = NAME_CACHE_SIZE, ttl: float = NAME_CACHE_TTL,
+                 concurrency: int = NAME_FETCH_CONCURRENCY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._names: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _remember(self, user_id: int, name: str):
+        self._names[user_id] = (name, time.monotonic() + self.ttl)
+        self._names.move_to_end(user_id)
+        if len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+    
+    def _cached(self, user_id: int) -> Optional[str]:
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._names[user_id]
+            return None
+        return entry[0]
+    
+    async def _fetch(self, bot_instance, user_id: int) -> Optional[str]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            try:
+                user = await bot_instance.fetch_user(user_id)
+            except Exception:
+                return None
+        self._remember(user_id, user.display_name)
+        return user.display_name
+    
+    async def resolve(self, guild: discord.Guild, bot_instance, user_ids: List[int]) -> Dict[int, str]:
+        """Map user ids to display names, users that can't be found are left out"""
+        names: Dict[int, str] = {}
+        missing: List[int] = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member is not None:
+                names[user_id] = member.display_name
+                continue
+            
+            name = self._cached(user_id)
+            if name is None:
+                user = bot_instance.get_user(user_id)
+                if user is not None:
+                    name = user.display_name
+                    self._remember(user_id, name)
+            if name is not None:
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+        
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(bot_instance, user_id) for user_id in missing))
+            for user_id, name in zip(missing, fetched):
+                if name is not None:
+                    names[user_id] = name
+        return names
+
+
 # --- Economy System (from economy.py) ---
 """
 Economy system for the Discord gambling bot
 """
 class Economy:
-    def __init__(self, db: Database):
+    def __init__(self, db: Storage):
         self.db = db
+        self._leaderboard_embeds: Dict[int, Tuple[tuple, float, discord.Embed]] = {}  # guild_id -> (version, expiry, embed)
+        self.names = UserNameResolver()
     
-    async def check_valid_bet(self, user_id: int, guild_id: int, bet_amount: int) -> tuple[bool, str]:
+    async def check_valid_bet(self, user_id: int, guild_id: int, bet_amount: int, rounds: int = 1) -> tuple[bool, str]:
         """
-        Validate if a bet is valid
+        Validate if a bet is valid (for every round when playing several at once)
         Returns: (is_valid, error_message)
         """
         # Check bet amount limits
-        if bet_amount < MIN_BET:
-            return False, f"Minimum bet is **{MIN_BET}** coins!"
+        settings = self.db.settings(guild_id)
+        if bet_amount < settings.min_bet:
+            return False, f"Minimum bet is **{settings.min_bet}** coins!"
         
-        if bet_amount > MAX_BET:
-            return False, f"Maximum bet is **{MAX_BET}** coins!"
+        if bet_amount > settings.max_bet:
+            return False, f"Maximum bet is **{settings.max_bet}** coins!"
         
         # Check if user has sufficient balance
         balance = await self.db.get_user_balance(user_id, guild_id)
-        if balance < bet_amount:
-            return False, f"Insufficient funds! You have **{balance}** coins but need **{bet_amount}**!"
+        if balance < bet_amount * rounds:
+            return False, f"Insufficient funds! You have **{balance}** coins but need **{bet_amount * rounds}**!"
         
         return True, ""
     
     async def process_game_result(self, user_id: int, guild_id: int, bet_amount: int, 
-                                won: bool, payout: int) -> None:
-        """Process the result of a gambling game"""
-        if won:
-            # Add winnings to balance
-            new_balance = await self.db.add_to_balance(user_id, guild_id, payout - bet_amount)
-            await self.db.update_stats(user_id, guild_id, winnings=payout - bet_amount)
-        else:
-            # Subtract bet from balance
-            await self.db.subtract_from_balance(user_id, guild_id, bet_amount)
-            await self.db.update_stats(user_id, guild_id, losses=bet_amount)
+                                won: bool, payout: int, game: Optional[str] = None) -> Optional[int]:
+        """
+        Process the result of a gambling game
+        Returns the new balance, or None if the user no longer covers the bet
+        """
+        # A lost game pays nothing, so settlement only needs the payout
+        return await self.db.settle_bet(user_id, guild_id, bet_amount, payout if won else 0, game=game)
+    
+    async def process_batch_result(self, user_id: int, guild_id: int, bet_amount: int,
+                                   payouts: List[int], game: Optional[str] = None) -> Optional[int]:
+        """
+        Settle several rounds of one game in a single transaction
+        Returns the new balance, or None if the user can't cover every round
+        """
+        winnings = sum(payout - bet_amount for payout in payouts if payout > bet_amount)
+        losses = sum(bet_amount - payout for payout in payouts if payout < bet_amount)
+        wins = sum(1 for payout in payouts if payout > bet_amount)
+        return await self.db.settle_bet(
+            user_id, guild_id, bet_amount * len(payouts), sum(payouts),
+            games=len(payouts), winnings=winnings, losses=losses, game=game, wins=wins
+        )
     
     async def get_balance_embed(self, user: discord.User, guild_id: int) -> discord.Embed:
         """Create an embed showing user's balance"""
@@ -433,18 +4169,45 @@ class Economy:
         embed.add_field(name="💎 Total Winnings", value=f"{stats['total_winnings']} coins", inline=True)
         embed.add_field(name="🎯 Success Rate", value=f"{win_rate:.1f}%", inline=True)
         
+        game_stats = await self.db.get_game_stats(user.id, guild_id)
+        game_labels = {"flip": "🪙 Coin Flip", "dice": "🎲 Dice", "slots": "🎰 Slots"}
+        for game, label in game_labels.items():
+            totals = game_stats['games'].get(game)
+            if totals:
+                embed.add_field(name=label, value=self._format_game_totals(totals), inline=True)
+        
+        window_labels = (("hour", "⏱️ This Hour"), ("day", "📅 Last 24 Hours"), ("week", "🗓️ Last 7 Days"))
+        for window, label in window_labels:
+            per_game = game_stats['windows'][window]
+            totals = {field: sum(values[field] for values in per_game.values())
+                      for field in ('rounds', 'wins', 'wagered', 'paid_out')}
+            embed.add_field(name=label, value=self._format_game_totals(totals) if totals['rounds'] else "No games",
+                            inline=True)
+        
         embed.set_thumbnail(url=user.avatar.url if user.avatar else user.default_avatar.url)
         embed.set_footer(text=f"Statistics for {user.display_name}")
         
         return embed
     
+    @staticmethod
+    def _format_game_totals(totals: Dict[str, int]) -> str:
+        net = totals['paid_out'] - totals['wagered']
+        return f"{totals['rounds']} played · {totals['wins']} won\n{net:+} coins"
+    
     async def get_leaderboard_embed(self, guild: discord.Guild, bot_instance) -> discord.Embed: # Renamed 'bot' to 'bot_instance' to avoid conflict
         """Create an embed showing the server leaderboard"""
-        leaderboard = await self.db.get_leaderboard(guild.id, 10)
+        leaderboard = await self.db.get_leaderboard(guild.id, LEADERBOARD_SIZE)
+        
+        # Rendering is only redone when the top players changed, or when the names in it
+        # are older than the resolver would trust them
+        version = (self.db.leaderboard_version(guild.id), guild.name)
+        cached = self._leaderboard_embeds.get(guild.id)
+        if cached is not None and cached[0] == version and cached[1] > time.monotonic():
+            return cached[2]
         
         embed = discord.Embed(
             title=f"🏆 {guild.name} Leaderboard",
-            description="Top 10 richest players",
+            description=f"Top {LEADERBOARD_SIZE} richest players",
             color=0xffd700
         )
         
@@ -452,20 +4215,65 @@ class Economy:
             embed.add_field(name="No Data", value="No players found!", inline=False)
             return embed
         
+        names = await self.names.resolve(guild, bot_instance, [user_id for user_id, _ in leaderboard])
+        embed.add_field(name="Rankings", value=self._format_rankings(names, leaderboard, 1), inline=False)
+        embed.set_footer(text=f"Leaderboard for {guild.name}")
+        
+        # A name that couldn't be fetched is retried next time instead of being frozen in the cache
+        if len(names) == len(leaderboard):
+            self._leaderboard_embeds[guild.id] = (version, time.monotonic() + self.names.ttl, embed)
+        return embed
+    
+    @staticmethod
+    def _format_rankings(names: Dict[int, str], rows: List[Tuple[int, int]], first_rank: int) -> str:
         leaderboard_text = ""
-        for i, (user_id, balance) in enumerate(leaderboard, 1):
-            try:
-                user = await bot_instance.fetch_user(user_id) # Use bot_instance here
-                username = user.display_name
-            except:
-                username = f"Unknown User ({user_id})"
-            
+        for i, (user_id, balance) in enumerate(rows, first_rank):
+            username = names.get(user_id, f"Unknown User ({user_id})")
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
             leaderboard_text += f"{medal} **{username}** - {balance} coins\n"
+        return leaderboard_text
+    
+    async def get_leaderboard_page_embed(self, guild: discord.Guild, bot_instance, page: int) -> discord.Embed:
+        """Create an embed showing any page of the server leaderboard"""
+        rows, total = await self.db.get_leaderboard_page(guild.id, page, LEADERBOARD_SIZE)
+        pages = max(1, math.ceil(total / LEADERBOARD_SIZE))
         
-        embed.add_field(name="Rankings", value=leaderboard_text, inline=False)
-        embed.set_footer(text=f"Leaderboard for {guild.name}")
+        embed = discord.Embed(
+            title=f"🏆 {guild.name} Leaderboard",
+            description=f"Page {page} of {pages}",
+            color=0xffd700
+        )
+        if not rows:
+            embed.add_field(name="No Data", value=f"There are only {pages} page(s)!", inline=False)
+            return embed
         
+        first_rank = (page - 1) * LEADERBOARD_SIZE + 1
+        names = await self.names.resolve(guild, bot_instance, [user_id for user_id, _ in rows])
+        leaderboard_text = self._format_rankings(names, rows, first_rank)
+        embed.add_field(name=f"Rankings #{first_rank}-{first_rank + len(rows) - 1}", value=leaderboard_text, inline=False)
+        embed.set_footer(text=f"{total:,} players ranked · {BOT_PREFIX}leaderboard <page>")
+        return embed
+    
+    async def get_rank_embed(self, user: discord.User, guild_id: int) -> discord.Embed:
+        """Create an embed showing a user's position on the leaderboard"""
+        position, total = await self.db.get_rank(user.id, guild_id)
+        if position is None:
+            return discord.Embed(
+                title="🏅 Rank",
+                description=f"**{user.display_name}** isn't on the leaderboard yet",
+                color=0xff0000
+            )
+        
+        rank, balance = position
+        embed = discord.Embed(
+            title="🏅 Rank",
+            description=f"**{user.display_name}** is **#{rank:,}** of {total:,} players",
+            color=0xffd700
+        )
+        embed.add_field(name="💰 Balance", value=f"{balance} coins", inline=True)
+        embed.add_field(name="📊 Top", value=f"{rank / total * 100:.1f}%", inline=True)
+        embed.add_field(name="📄 Leaderboard Page", value=str((rank - 1) // LEADERBOARD_SIZE + 1), inline=True)
+        embed.set_thumbnail(url=user.avatar.url if user.avatar else user.default_avatar.url)
         return embed
     
     def format_number(self, number: int) -> str:
@@ -473,17 +4281,325 @@ class Economy:
         return f"{number:,}"
 
 
+# --- Health Server ---
+"""
+Health checks and metrics over HTTP, served from the bot's event loop
+"""
+class HealthServer:
+    """
+    /healthz  the process is up
+    /readyz   the gateway is connected and the database takes writes
+    /metrics  Prometheus text format
+    """
+    def __init__(self, bot_instance, database, host: str = HTTP_HOST, port: int = HTTP_PORT):
+        self.bot = bot_instance
+        self.db = database
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        
+        self.app = web.Application()
+        self.app.router.add_get('/', self.home)
+        self.app.router.add_get('/healthz', self.healthz)
+        self.app.router.add_get('/readyz', self.readyz)
+        self.app.router.add_get('/metrics', self.metrics)
+    
+    async def home(self, request: web.Request) -> web.Response:
+        return web.Response(text="bot is alive")
+    
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+    
+    async def readyz(self, request: web.Request) -> web.Response:
+        gateway = self.bot.is_ready() and not self.bot.is_closed()
+        database = await self.db.check_writable()
+        body = f"gateway: {'ok' if gateway else 'down'}\ndatabase: {'ok' if database else 'down'}\n"
+        return web.Response(text=body, status=200 if gateway and database else 503)
+    
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+    
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Health server listening on {self.host}:{self.port}")
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# --- Outbound Dispatcher ---
+"""
+Per-channel reply queues that respect Discord's rate limits
+"""
+class RateBucket:
+    """Token bucket mirroring a per-channel rate limit, corrected by 429 responses"""
+    def __init__(self, rate: int = DISPATCH_RATE, per: float = DISPATCH_PER):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+    
+    def delay(self) -> float:
+        """Seconds until a message may be sent, 0 if one may go now"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+    
+    def until_full(self) -> float:
+        """Seconds until the bucket is back to its full allowance"""
+        now = time.monotonic()
+        self._refill(now)
+        return max(self.blocked_until - now, (self.rate - self.tokens) * self.per / self.rate)
+    
+    def take(self):
+        self.tokens -= 1
+    
+    def penalize(self, retry_after: float):
+        """Discord said we're limited: stop until it says otherwise"""
+        self.tokens = 0.0
+        self.blocked_until = time.monotonic() + retry_after
+
+
+class OutboundMessage:
+    __slots__ = ('send', 'content', 'embed', 'author', 'coalesce', 'future')
+    
+    def __init__(self, send: Callable, content: Optional[str], embed: Optional[discord.Embed],
+                 author: Optional[str], coalesce: bool, future: asyncio.Future):
+        self.send = send
+        self.content = content
+        self.embed = embed
+        self.author = author
+        self.coalesce = coalesce
+        self.future = future
+
+
+class ChannelQueue:
+    __slots__ = ('messages', 'bucket', 'wakeup', 'task')
+    
+    def __init__(self, rate: int, per: float):
+        self.messages: deque = deque()
+        self.bucket = RateBucket(rate, per)
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class OutboundDispatcher:
+    """
+    Queues replies per channel and sends them no faster than the channel's
+    rate limit allows. When a channel is backed up, consecutive game results
+    waiting in its queue go out as one combined embed instead of one message
+    each. Sending goes through the destination's send() (a Context or
+    Messageable), so tests can pass any object with an async send().
+    A channel's worker exits once its queue is empty and its bucket refilled.
+    """
+    def __init__(self, rate: int = DISPATCH_RATE, per: float = DISPATCH_PER,
+                 coalesce_max: int = DISPATCH_COALESCE_MAX):
+        self.rate = rate
+        self.per = per
+        self.coalesce_max = coalesce_max
+        self._channels: Dict[int, ChannelQueue] = {}
+        self._pending: set = set()
+        self.sent = 0
+        self.coalesced = 0
+    
+    @property
+    def depth(self) -> int:
+        """Messages waiting to be sent"""
+        return sum(len(channel.messages) for channel in self._channels.values())
+    
+    def post(self, destination, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+             coalesce: bool = False) -> asyncio.Future:
+        """
+        Queue a message; the returned future resolves to the sent message.
+        coalesce marks game results that may be merged with others under pressure.
+        """
+        channel = getattr(destination, 'channel', destination)
+        author = getattr(getattr(destination, 'author', None), 'display_name', None)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        
+        queue = self._channels.get(channel.id)
+        if queue is None:
+            queue = self._channels[channel.id] = ChannelQueue(self.rate, self.per)
+        queue.messages.append(OutboundMessage(destination.send, content, embed, author, coalesce, future))
+        queue.wakeup.set()
+        if queue.task is None:
+            queue.task = asyncio.create_task(self._run(channel.id, queue))
+        return future
+    
+    async def _run(self, key: int, queue: ChannelQueue):
+        try:
+            while True:
+                if not queue.messages:
+                    # Stay around until the bucket refills, so a quick follow-up can't skip the limit
+                    idle = queue.bucket.until_full()
+                    if idle <= 0:
+                        break
+                    queue.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(queue.wakeup.wait(), timeout=idle)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                delay = queue.bucket.delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                
+                batch = [queue.messages.popleft()]
+                # Only merge when the remaining allowance can't cover the backlog
+                if batch[0].coalesce and len(queue.messages) + 1 > queue.bucket.tokens:
+                    while (queue.messages and queue.messages[0].coalesce
+                           and len(batch) < self.coalesce_max):
+                        batch.append(queue.messages.popleft())
+                queue.bucket.take()
+                
+                try:
+                    message = await self._deliver(batch)
+                except (discord.RateLimited, discord.HTTPException) as e:
+                    retry_after = self._retry_after(e)
+                    if retry_after is None:
+                        self._fail(batch, e)
+                        continue
+                    queue.bucket.penalize(retry_after)
+                    queue.messages.extendleft(reversed(batch))
+                    continue
+                except Exception as e:
+                    self._fail(batch, e)
+                    continue
+                
+                self.sent += 1
+                if len(batch) > 1:
+                    self.coalesced += len(batch)
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_result(message)
+        finally:
+            del self._channels[key]
+            for item in queue.messages:
+                item.future.cancel()
+    
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """Seconds to back off for a rate limit error, None for any other error"""
+        if isinstance(error, discord.RateLimited):
+            return error.retry_after
+        if error.status != 429:
+            return None
+        headers = getattr(error.response, 'headers', None) or {}
+        try:
+            return float(headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return self.per / self.rate
+    
+    @staticmethod
+    def _fail(batch: List[OutboundMessage], error: Exception):
+        print(f"Failed to send message: {error}")
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(error)
+                item.future.exception()  # Fire-and-forget posts must not log "never retrieved"
+    
+    async def _deliver(self, batch: List[OutboundMessage]):
+        if len(batch) == 1:
+            item = batch[0]
+            return await item.send(content=item.content, embed=item.embed)
+        return await batch[0].send(embed=self._combine(batch))
+    
+    @staticmethod
+    def _combine(batch: List[OutboundMessage]) -> discord.Embed:
+        """One embed with a field per game result"""
+        embed = discord.Embed(title="🎲 Recent Results", color=0x0099ff)
+        for item in batch:
+            result = item.embed
+            lines = [result.description or item.content or ""]
+            lines += [f"{field.name}: {field.value}" for field in result.fields]
+            name = f"{result.title} · {item.author}" if item.author else str(result.title)
+            embed.add_field(name=name[:256], value="\n".join(lines)[:1024] or "\u200b", inline=False)
+        embed.set_footer(text=f"{len(batch)} results combined to keep up with the channel")
+        return embed
+    
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait until every queued message is sent"""
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=timeout)
+    
+    async def close(self, timeout: float = DISPATCH_DRAIN_TIMEOUT):
+        """Send what's queued within the timeout, then drop the rest"""
+        await self.drain(timeout)
+        tasks = [queue.task for queue in self._channels.values() if queue.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 # --- Main Bot Logic (from main.py) ---
 
 # Bot setup
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents, help_command=None)
+class CasinoBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        """Start database background work and the health server once the event loop is running"""
+        await db.start()
+        await health_server.start()
+    
+    async def close(self):
+        """Send queued replies and flush pending settlements before disconnecting"""
+        await dispatcher.close()
+        await health_server.stop()
+        await db.shutdown()
+        await super().close()
+
+# Components, built by create_bot() when the bot starts. Importing bot.py
+# (the offline tools, the simulator's worker processes) must not open the database.
+bot: Optional[CasinoBot] = None
+db: Optional[Storage] = None
+games: Optional[GamblingGames] = None
+economy: Optional[Economy] = None
+health_server: Optional[HealthServer] = None
+dispatcher: Optional[OutboundDispatcher] = None
 
-# Initialize components
-db = Database()
-games = GamblingGames()
-economy = Economy(db)
+def _sqlite_partitions() -> Iterable[Tuple[int, Database]]:
+    """Partitions behind the per-partition gauges, none for the memory engine"""
+    return db.databases.items() if isinstance(db, StorageRouter) else ()
+
+# Runtime gauges, evaluated on every scrape
+metrics.gauge("casino_outbound_queue_depth", "Replies waiting for a channel's rate limit",
+              collect=lambda: dispatcher.depth)
+metrics.counter("casino_outbound_messages_total", "Replies sent, and game results merged into combined embeds", ("kind",),
+                collect=lambda: {("sent",): dispatcher.sent, ("coalesced",): dispatcher.coalesced})
+metrics.gauge("casino_gateway_latency_seconds", "Discord gateway heartbeat latency", collect=lambda: bot.latency)
+metrics.gauge("casino_guilds", "Guilds the bot is in", collect=lambda: len(bot.guilds))
+metrics.gauge("casino_user_cache_hit_ratio", "User row cache hit ratio", ("partition",),
+              collect=lambda: {(str(i),): d.cache.hit_rate for i, d in _sqlite_partitions()})
+metrics.gauge("casino_user_cache_entries", "User rows cached", ("partition",),
+              collect=lambda: {(str(i),): len(d.cache) for i, d in _sqlite_partitions()})
+metrics.counter("casino_user_cache_events_total", "User row cache lookups and evictions", ("partition", "event"),
+                collect=lambda: {key: value for i, d in _sqlite_partitions() for key, value in (
+                    ((str(i), "hit"), d.cache.hits), ((str(i), "miss"), d.cache.misses),
+                    ((str(i), "eviction"), d.cache.evictions))})
+metrics.gauge("casino_settlement_queue_depth", "Settlements waiting for commit", ("partition",),
+              collect=lambda: {(str(i),): d.settlements.depth if d.settlements is not None else 0
+                               for i, d in _sqlite_partitions()})
+metrics.gauge("casino_last_backup_timestamp_seconds", "Unix time of the last verified backup, 0 if none yet", ("partition",),
+              collect=lambda: {(str(i),): d.backups.last_success for i, d in _sqlite_partitions()})
+metrics.gauge("casino_db_pending_calls", "Database calls queued or running", ("partition", "kind"),
+              collect=lambda: {key: value for i, d in _sqlite_partitions() for key, value in (
+                  ((str(i), "read"), d.pool.pending_reads), ((str(i), "write"), d.pool.pending_writes))})
 
 def has_admin_role():
     async def predicate(ctx):
@@ -497,7 +4613,6 @@ def has_admin_role():
         raise CheckFailure(f"You need the required admin role to use this command.")
     return commands.check(predicate)
 
-@bot.event
 async def on_ready():
     """Bot startup event"""
     print(f'{bot.user} has connected to Discord!')
@@ -507,14 +4622,26 @@ async def on_ready():
     activity = discord.Game(name=f"{BOT_PREFIX}help | Virtual Casino")
     await bot.change_presence(activity=activity)
 
-@bot.event
 async def on_guild_join(guild):
     """Event when bot joins a new guild"""
     print(f'Joined new guild: {guild.name} (ID: {guild.id})')
 
-@bot.event
+async def start_command_timer(ctx):
+    ctx.perf_started = time.perf_counter()
+
+async def stop_command_timer(ctx):
+    started = getattr(ctx, 'perf_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        latency.record(f"command.{ctx.command.qualified_name}", elapsed)
+        COMMAND_SECONDS.observe(elapsed, ctx.command.qualified_name)
+
+async def on_command_completion(ctx):
+    COMMANDS_TOTAL.inc(ctx.command.qualified_name, "ok")
+
 async def on_command_error(ctx, error):
     """Global error handler"""
+    COMMANDS_TOTAL.inc(ctx.command.qualified_name if ctx.command else "unknown", "error")
     if isinstance(error, commands.CommandOnCooldown):
         embed = discord.Embed(
             title="⏰ Cooldown Active",
@@ -536,13 +4663,21 @@ async def on_command_error(ctx, error):
             color=0xff0000
         )
         await ctx.send(embed=embed)
+    elif isinstance(error, CheckFailure):
+        # Raised by has_admin_role() on every admin command
+        embed = discord.Embed(
+            title="❌ Permission Denied",
+            description=str(error),
+            color=0xff0000
+        )
+        await ctx.send(embed=embed)
     else:
         print(f"Unhandled error: {error}")
 
 # Utility function for cooldown checking (kept as a global function for simplicity, could be a method of a Cogs class)
-async def check_and_set_cooldown(ctx, command_name: str, cooldown_seconds: int) -> bool:
-    """Check if user is on cooldown and set new cooldown if not"""
-    remaining = await db.check_cooldown(ctx.author.id, ctx.guild.id, command_name)
+async def check_and_set_cooldown(ctx, command_name: str, cooldown_seconds: Optional[int] = None) -> bool:
+    """Check if user is on cooldown and set new cooldown if not (defaults to the guild's policy)"""
+    remaining = await db.acquire_cooldown(ctx.author.id, ctx.guild.id, command_name, cooldown_seconds)
     
     if remaining > 0:
         embed = discord.Embed(
@@ -553,131 +4688,228 @@ async def check_and_set_cooldown(ctx, command_name: str, cooldown_seconds: int)
         await ctx.send(embed=embed)
         return False
     
-    await db.set_cooldown(ctx.author.id, ctx.guild.id, command_name, cooldown_seconds)
     return True
 
 # Economy Commands
-@bot.command(name='balance', aliases=['bal', 'money'])
+@commands.command(name='balance', aliases=['bal', 'money'])
 async def balance(ctx, user: discord.User | None = None):
     """Check your or another user's balance"""
     target_user = user or ctx.author
     embed = await economy.get_balance_embed(target_user, ctx.guild.id)
     await ctx.send(embed=embed)
 
-@bot.command(name='stats', aliases=['statistics'])
+@commands.command(name='stats', aliases=['statistics'])
 async def stats(ctx, user: discord.User | None = None):
     """View gambling statistics"""
     target_user = user or ctx.author
     embed = await economy.get_stats_embed(target_user, ctx.guild.id)
     await ctx.send(embed=embed)
 
-@bot.command(name='leaderboard', aliases=['top', 'rich'])
-async def leaderboard(ctx):
+@commands.command(name='leaderboard', aliases=['top', 'rich'])
+async def leaderboard(ctx, page: int = 1):
     """View the server leaderboard"""
-    embed = await economy.get_leaderboard_embed(ctx.guild, bot) # Pass 'bot' instance
+    if page < 1:
+        await ctx.send("❌ Page must be 1 or higher!")
+        return
+    if page == 1:
+        embed = await economy.get_leaderboard_embed(ctx.guild, ctx.bot) # Pass 'bot' instance
+    else:
+        embed = await economy.get_leaderboard_page_embed(ctx.guild, ctx.bot, page)
     await ctx.send(embed=embed)
 
-# Gambling Commands
-@bot.command(name='flip', aliases=['coinflip', 'coin'])
-@commands.cooldown(1, GAMBLING_COOLDOWN, commands.BucketType.user)
-async def coin_flip(ctx, amount: int, choice: str):
-    """
-    Flip a coin and bet on the outcome
-    Usage: !flip <amount> <heads/tails>
-    """
-    # Validate bet
-    is_valid, error_msg = await economy.check_valid_bet(ctx.author.id, ctx.guild.id, amount)
-    if not is_valid:
-        embed = discord.Embed(title="❌ Invalid Bet", description=error_msg, color=0xff0000)
+@commands.command(name='rank', aliases=['position'])
+async def rank(ctx, user: discord.User | None = None):
+    """Show your (or another user's) position on the server leaderboard"""
+    target_user = user or ctx.author
+    embed = await economy.get_rank_embed(target_user, ctx.guild.id)
+    await ctx.send(embed=embed)
+
+class BulkRounds(commands.Converter):
+    """Parses the optional round count of bulk play, written as x<N> (e.g. x10)"""
+    async def convert(self, ctx, argument: str) -> int:
+        if argument[:1].lower() != 'x' or not argument[1:].isdigit():
+            raise commands.BadArgument(f"Rounds must look like x10, got {argument!r}")
+        rounds = int(argument[1:])
+        if not 1 <= rounds <= MAX_BULK_ROUNDS:
+            raise commands.BadArgument(f"Rounds must be between 1 and {MAX_BULK_ROUNDS}")
+        return rounds
+
+async def send_bulk_result(ctx, title: str, amount: int, payouts: List[int], summary: str, game: str):
+    """Settle a bulk play in one transaction and send a single summary embed"""
+    new_balance = await economy.process_batch_result(ctx.author.id, ctx.guild.id, amount, payouts, game)
+    if new_balance is None:
+        embed = discord.Embed(title="❌ Invalid Bet", description="Insufficient funds!", color=0xff0000)
         await ctx.send(embed=embed)
         return
     
-    # Play the game
-    won, payout, result_message = games.coin_flip(amount, choice)
-    
-    # Process the result
-    await economy.process_game_result(ctx.author.id, ctx.guild.id, amount, won, payout)
-    
-    # Send result
+    net = sum(payouts) - amount * len(payouts)
     embed = discord.Embed(
-        title="🪙 Coin Flip Result",
-        description=result_message,
-        color=0x00ff00 if won else 0xff0000
+        title=f"{title} ×{len(payouts)}",
+        description=summary,
+        color=0x00ff00 if net > 0 else 0xff0000
     )
-    
-    new_balance = await db.get_user_balance(ctx.author.id, ctx.guild.id)
     embed.add_field(name="💰 New Balance", value=f"{new_balance} coins", inline=False)
-    
-    await ctx.send(embed=embed)
+    dispatcher.post(ctx, embed=embed, coalesce=True)
 
-@bot.command(name='dice', aliases=['roll'])
-@commands.cooldown(1, GAMBLING_COOLDOWN, commands.BucketType.user)
-async def dice_roll(ctx, amount: int, target: int = 6):
+# Gambling Commands
+@commands.command(name='flip', aliases=['coinflip', 'coin'])
+async def coin_flip(ctx, amount: int, choice: str, rounds: BulkRounds = 1):
     """
-    Roll a dice and bet on the outcome
-    Usage: !dice <amount> [target_number]
+    Flip a coin and bet on the outcome
+    Usage: !flip <amount> <heads/tails> [xN]
     """
-    # Validate bet
-    is_valid, error_msg = await economy.check_valid_bet(ctx.author.id, ctx.guild.id, amount)
-    if not is_valid:
+    # A typo must not be settled as a lost bet
+    error_msg = GamblingGames.flip_choice_error(choice)
+    if error_msg:
         embed = discord.Embed(title="❌ Invalid Bet", description=error_msg, color=0xff0000)
         await ctx.send(embed=embed)
         return
     
-    # Play the game
-    won, payout, result_message = games.dice_roll(amount, target)
-    
-    # Process the result
-    await economy.process_game_result(ctx.author.id, ctx.guild.id, amount, won, payout)
-    
-    # Send result
-    embed = discord.Embed(
-        title="🎲 Dice Roll Result",
-        description=result_message,
-        color=0x00ff00 if won else 0xff0000
-    )
-    
-    new_balance = await db.get_user_balance(ctx.author.id, ctx.guild.id)
-    embed.add_field(name="💰 New Balance", value=f"{new_balance} coins", inline=False)
-    
-    await ctx.send(embed=embed)
+    # One game at a time per user, from the funds check to settlement
+    async with db.user_lock(ctx.author.id, ctx.guild.id):
+        # Validate bet
+        is_valid, error_msg = await economy.check_valid_bet(ctx.author.id, ctx.guild.id, amount, rounds)
+        if not is_valid:
+            embed = discord.Embed(title="❌ Invalid Bet", description=error_msg, color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        
+        # Only a bet that is actually played starts the cooldown
+        if not await check_and_set_cooldown(ctx, "flip"):
+            return
+        
+        # Play the game
+        if rounds > 1:
+            payouts, summary = games.coin_flip_batch(amount, choice, rounds, ctx.guild.id)
+            await send_bulk_result(ctx, "🪙 Coin Flip", amount, payouts, summary, "flip")
+            return
+        
+        won, payout, result_message = games.coin_flip(amount, choice, ctx.guild.id)
+        
+        # Process the result
+        new_balance = await economy.process_game_result(ctx.author.id, ctx.guild.id, amount, won, payout, "flip")
+        if new_balance is None:
+            embed = discord.Embed(title="❌ Invalid Bet", description="Insufficient funds!", color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        
+        # Send result
+        embed = discord.Embed(
+            title="🪙 Coin Flip Result",
+            description=result_message,
+            color=0x00ff00 if won else 0xff0000
+        )
+        
+        embed.add_field(name="💰 New Balance", value=f"{new_balance} coins", inline=False)
+        
+        # Queued per channel; may be merged with other results when the channel is busy
+        dispatcher.post(ctx, embed=embed, coalesce=True)
 
-@bot.command(name='slots', aliases=['slot', 'spin'])
-@commands.cooldown(1, GAMBLING_COOLDOWN, commands.BucketType.user)
-async def slots(ctx, amount: int):
+@commands.command(name='dice', aliases=['roll'])
+async def dice_roll(ctx, amount: int, target: Optional[int] = 6, rounds: BulkRounds = 1):
     """
-    Play the slot machine
-    Usage: !slots <amount>
+    Roll a dice and bet on the outcome
+    Usage: !dice <amount> [target_number] [xN]
     """
-    # Validate bet
-    is_valid, error_msg = await economy.check_valid_bet(ctx.author.id, ctx.guild.id, amount)
-    if not is_valid:
+    # An out of range target must not be settled as a lost bet
+    error_msg = GamblingGames.dice_target_error(target)
+    if error_msg:
         embed = discord.Embed(title="❌ Invalid Bet", description=error_msg, color=0xff0000)
         await ctx.send(embed=embed)
         return
     
-    # Play the game
-    won, payout, result_message = games.slots(amount)
-    
-    # Process the result
-    await economy.process_game_result(ctx.author.id, ctx.guild.id, amount, won, payout)
-    
-    # Send result
-    embed = discord.Embed(
-        title="🎰 Slot Machine Result",
-        description=result_message,
-        color=0x00ff00 if won else 0xff0000
-    )
-    
-    new_balance = await db.get_user_balance(ctx.author.id, ctx.guild.id)
-    embed.add_field(name="💰 New Balance", value=f"{new_balance} coins", inline=False)
-    
-    await ctx.send(embed=embed)
+    # One game at a time per user, from the funds check to settlement
+    async with db.user_lock(ctx.author.id, ctx.guild.id):
+        # Validate bet
+        is_valid, error_msg = await economy.check_valid_bet(ctx.author.id, ctx.guild.id, amount, rounds)
+        if not is_valid:
+            embed = discord.Embed(title="❌ Invalid Bet", description=error_msg, color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        
+        # Only a bet that is actually played starts the cooldown
+        if not await check_and_set_cooldown(ctx, "dice"):
+            return
+        
+        # Play the game
+        if rounds > 1:
+            payouts, summary = games.dice_roll_batch(amount, target, rounds, ctx.guild.id)
+            await send_bulk_result(ctx, "🎲 Dice Roll", amount, payouts, summary, "dice")
+            return
+        
+        won, payout, result_message = games.dice_roll(amount, target, ctx.guild.id)
+        
+        # Process the result
+        new_balance = await economy.process_game_result(ctx.author.id, ctx.guild.id, amount, won, payout, "dice")
+        if new_balance is None:
+            embed = discord.Embed(title="❌ Invalid Bet", description="Insufficient funds!", color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        
+        # Send result
+        embed = discord.Embed(
+            title="🎲 Dice Roll Result",
+            description=result_message,
+            color=0x00ff00 if won else 0xff0000
+        )
+        
+        embed.add_field(name="💰 New Balance", value=f"{new_balance} coins", inline=False)
+        
+        # Queued per channel; may be merged with other results when the channel is busy
+        dispatcher.post(ctx, embed=embed, coalesce=True)
+
+@commands.command(name='slots', aliases=['slot', 'spin'])
+async def slots(ctx, amount: int, rounds: BulkRounds = 1):
+    """
+    Play the slot machine
+    Usage: !slots <amount> [xN]
+    """
+    # One game at a time per user, from the funds check to settlement
+    async with db.user_lock(ctx.author.id, ctx.guild.id):
+        # Validate bet
+        is_valid, error_msg = await economy.check_valid_bet(ctx.author.id, ctx.guild.id, amount, rounds)
+        if not is_valid:
+            embed = discord.Embed(title="❌ Invalid Bet", description=error_msg, color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        
+        # Only a bet that is actually played starts the cooldown
+        if not await check_and_set_cooldown(ctx, "slots"):
+            return
+        
+        # Play the game
+        if rounds > 1:
+            payouts, summary = games.slots_batch(amount, rounds, ctx.guild.id)
+            await send_bulk_result(ctx, "🎰 Slot Machine", amount, payouts, summary, "slots")
+            return
+        
+        won, payout, result_message = games.slots(amount, ctx.guild.id)
+        
+        # Process the result
+        new_balance = await economy.process_game_result(ctx.author.id, ctx.guild.id, amount, won, payout, "slots")
+        if new_balance is None:
+            embed = discord.Embed(title="❌ Invalid Bet", description="Insufficient funds!", color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        
+        # Send result
+        embed = discord.Embed(
+            title="🎰 Slot Machine Result",
+            description=result_message,
+            color=0x00ff00 if won else 0xff0000
+        )
+        
+        embed.add_field(name="💰 New Balance", value=f"{new_balance} coins", inline=False)
+        
+        # Queued per channel; may be merged with other results when the channel is busy
+        dispatcher.post(ctx, embed=embed, coalesce=True)
 
 # Help and Information Commands
-@bot.command(name='help', aliases=['commands'])
+
+@commands.command(name='help', aliases=['commands'])
 async def help_command(ctx):
     """Show all available commands"""
+    settings = db.settings(ctx.guild.id)
     embed = discord.Embed(
         title="🎰 Casino Bot Commands",
         description="Here are all available commands organized by category:",
@@ -687,9 +4919,11 @@ async def help_command(ctx):
     # Gambling Games
     embed.add_field(
         name="🎮 Gambling Games",
-        value=f"`{BOT_PREFIX}flip <amount> <heads/tails>` - Coin flip (1.5x win)\n"
-              f"`{BOT_PREFIX}dice <amount> [target]` - Dice roll 2x\n"
-              f"`{BOT_PREFIX}slots <amount>` - Slot machine jackpot 2.5x ,triple 2.2x, double 1.8x",
+        value=f"`{BOT_PREFIX}flip <amount> <heads/tails> [xN]` - Coin flip ({settings.flip_multiplier:g}x win)\n"
+              f"`{BOT_PREFIX}dice <amount> [target] [xN]` - Dice roll {settings.dice_multiplier:g}x\n"
+              f"`{BOT_PREFIX}slots <amount> [xN]` - Slot machine jackpot {settings.slots_jackpot:g}x ,"
+              f"triple {settings.slots_triple:g}x, double {settings.slots_double:g}x\n"
+              f"Add `xN` to play up to {MAX_BULK_ROUNDS} rounds at once",
         inline=False
     )
     
@@ -698,7 +4932,8 @@ async def help_command(ctx):
         name="💰 Economy",
         value=f"`{BOT_PREFIX}balance [user]` - Check balance\n"
               f"`{BOT_PREFIX}stats [user]` - View gambling statistics\n"
-              f"`{BOT_PREFIX}leaderboard` - View top players",
+              f"`{BOT_PREFIX}leaderboard [page]` - View top players\n"
+              f"`{BOT_PREFIX}rank [user]` - See your leaderboard position",
         inline=False
     )
     
@@ -716,29 +4951,32 @@ async def help_command(ctx):
         embed.add_field(
             name="⚙️ Admin Commands",
             value=f"`{BOT_PREFIX}give <user> <amount>` - Give coins to user\n"
-                  f"`{BOT_PREFIX}reset <user>` - Reset user's balance",
+                  f"`{BOT_PREFIX}reset <user>` - Reset user's balance\n"
+                  f"`{BOT_PREFIX}perf [minutes]` - Slowest commands and queries",
             inline=False
         )
     
-    embed.set_footer(text=f"Bet limits: {MIN_BET}-{MAX_BET} coins | Cooldown: {GAMBLING_COOLDOWN}s between games")
+    cooldown = max(settings.cooldown(command) for command in COOLDOWN_POLICIES)
+    embed.set_footer(text=f"Bet limits: {settings.min_bet}-{settings.max_bet} coins | Cooldown: {cooldown:g}s between games")
     
     await ctx.send(embed=embed)
 
-@bot.command(name='games', aliases=['gamelist'])
+@commands.command(name='games', aliases=['gamelist'])
 async def game_list(ctx):
     """Show all available games and their rules"""
-    help_text = games.get_game_help()
+    help_text = games.get_game_help(ctx.guild.id)
+    settings = db.settings(ctx.guild.id)
     
     embed = discord.Embed(
         title="🎮 Casino Games & Commands",
         description=help_text,
         color=0x0099ff
     )
-    embed.set_footer(text=f"Minimum bet: {MIN_BET} | Maximum bet: {MAX_BET}")
+    embed.set_footer(text=f"Minimum bet: {settings.min_bet} | Maximum bet: {settings.max_bet}")
     
     await ctx.send(embed=embed)
 
-@bot.command(name='info', aliases=['about'])
+@commands.command(name='info', aliases=['about'])
 async def bot_info(ctx):
     """Show bot information"""
     embed = discord.Embed(
@@ -770,7 +5008,7 @@ async def bot_info(ctx):
     await ctx.send(embed=embed)
 
 # Admin Commands (Optional)
-@bot.command(name='give', hidden=True)
+@commands.command(name='give', hidden=True)
 @has_admin_role()
 async def give_money(ctx, user: discord.User, amount: int):
     """Give money to a user (Admin only)"""
@@ -778,7 +5016,8 @@ async def give_money(ctx, user: discord.User, amount: int):
         await ctx.send("❌ Amount must be positive!")
         return
     
-    new_balance = await db.add_to_balance(user.id, ctx.guild.id, amount)
+    async with db.user_lock(user.id, ctx.guild.id):
+        new_balance = await db.add_to_balance(user.id, ctx.guild.id, amount)
     
     embed = discord.Embed(
         title="💰 Money Given",
@@ -787,11 +5026,12 @@ async def give_money(ctx, user: discord.User, amount: int):
     )
     await ctx.send(embed=embed)
 
-@bot.command(name='reset', hidden=True)
+@commands.command(name='reset', hidden=True)
 @has_admin_role()
 async def reset_user(ctx, user: discord.User):
     """Reset a user's balance and stats (Admin only)"""
-    await db.update_balance(user.id, ctx.guild.id, INITIAL_BALANCE)  # Reset to initial balance
+    async with db.user_lock(user.id, ctx.guild.id):
+        await db.update_balance(user.id, ctx.guild.id, INITIAL_BALANCE)  # Reset to initial balance
     
     embed = discord.Embed(
         title="🔄 User Reset",
@@ -800,50 +5040,560 @@ async def reset_user(ctx, user: discord.User):
     )
     await ctx.send(embed=embed)
 
-# Error handlers for specific commands
-@give_money.error
-async def give_money_error(ctx, error):
-    if isinstance(error, CheckFailure):
+class BulkProgress:
+    """Progress callback for bulk admin operations, edits one status message at a limited rate"""
+    def __init__(self, message, action: str):
+        self.message = message
+        self.action = action
+        self.done = 0  # Users in committed chunks
+        self.total: Optional[int] = None
+        self._last_edit = time.monotonic()
+    
+    async def __call__(self, done: int, total: int):
+        self.done, self.total = done, total
+        now = time.monotonic()
+        if done < total and now - self._last_edit < BULK_PROGRESS_INTERVAL:
+            return
+        self._last_edit = now
+        await self.message.edit(content=f"⏳ {self.action}: {done:,}/{total:,} users")
+    
+    async def failed(self, error: Exception):
+        """Replace the progress message with the error and how many users were already updated"""
+        of_total = f"/{self.total:,}" if self.total is not None else ""
         embed = discord.Embed(
-            title="❌ Permission Denied",
-            description=str(error),
+            title=f"❌ {self.action} Failed",
+            description=f"{error}\n**{self.done:,}**{of_total} users were updated before the error and keep the change",
             color=0xff0000
         )
-        await ctx.send(embed=embed)
-    elif isinstance(error, commands.MissingRequiredArgument):
-        # your existing error handling here
-        pass
+        await self.message.edit(content=None, embed=embed)
 
-@reset_user.error
-async def reset_user_error(ctx, error):
-    if isinstance(error, CheckFailure):
+@commands.command(name='giverole', hidden=True)
+@has_admin_role()
+async def give_role(ctx, role: discord.Role, amount: int):
+    """Give money to every member of a role (Admin only, needs the members intent)"""
+    if amount <= 0:
+        await ctx.send("❌ Amount must be positive!")
+        return
+    
+    if not ctx.bot.intents.members:
         embed = discord.Embed(
-            title="❌ Permission Denied",
-            description=str(error),
+            title="❌ Members Intent Disabled",
+            description="giverole needs the member list. Set `MEMBERS_INTENT=1` and enable "
+                        "\"Server Members Intent\" for the bot in the Developer Portal.",
             color=0xff0000
         )
         await ctx.send(embed=embed)
-    elif isinstance(error, commands.MissingRequiredArgument):
-        # your existing error handling here
-        pass
+        return
+    
+    # role.members only sees cached members, so load the whole member list first
+    if not ctx.guild.chunked:
+        await ctx.guild.chunk()
+    user_ids = [member.id for member in role.members if not member.bot]
+    if not user_ids:
+        await ctx.send(f"❌ No members found with the **{role.name}** role!")
+        return
+    
+    status = await ctx.send(f"⏳ Giving {amount} coins to {len(user_ids):,} users...")
+    started = time.perf_counter()
+    progress = BulkProgress(status, "Giving")
+    try:
+        count = await db.bulk_add_to_balance(ctx.guild.id, user_ids, amount, progress)
+    except sqlite3.Error as e:
+        await progress.failed(e)
+        return
+    
+    embed = discord.Embed(
+        title="💰 Money Given",
+        description=f"Given **{amount}** coins to **{count:,}** members of **{role.name}**\n"
+                    f"Total paid out: **{amount * count:,}** coins",
+        color=0x00ff00
+    )
+    embed.set_footer(text=f"Completed in {time.perf_counter() - started:.1f}s")
+    await status.edit(content=None, embed=embed)
 
-# Run the bot
-# IMPORTANT: Replace "YOUR_BOT_TOKEN_HERE" with your actual Discord bot token.
-# The token provided in the original context is likely a placeholder or expired.
+@commands.command(name='givemany', hidden=True)
+@has_admin_role()
+async def give_many(ctx, users: commands.Greedy[discord.User], amount: int):
+    """Give money to a list of users (Admin only)"""
+    if amount <= 0:
+        await ctx.send("❌ Amount must be positive!")
+        return
+    if not users:
+        await ctx.send("❌ Mention at least one user!")
+        return
+    
+    status = await ctx.send(f"⏳ Giving {amount} coins to {len(users):,} users...")
+    progress = BulkProgress(status, "Giving")
+    try:
+        count = await db.bulk_add_to_balance(ctx.guild.id, [user.id for user in users], amount, progress)
+    except sqlite3.Error as e:
+        await progress.failed(e)
+        return
+    
+    embed = discord.Embed(
+        title="💰 Money Given",
+        description=f"Given **{amount}** coins to **{count:,}** users\nTotal paid out: **{amount * count:,}** coins",
+        color=0x00ff00
+    )
+    await status.edit(content=None, embed=embed)
 
-t= os.getenv("key")
+@commands.command(name='resetall', hidden=True)
+@has_admin_role()
+async def reset_all(ctx, confirm: str = ""):
+    """Reset every balance in the server (Admin only)"""
+    if confirm.lower() != "confirm":
+        await ctx.send(f"⚠️ This resets every balance in the server to {INITIAL_BALANCE} coins. "
+                       f"Run `{BOT_PREFIX}resetall confirm` to continue.")
+        return
+    
+    status = await ctx.send("⏳ Resetting server balances...")
+    started = time.perf_counter()
+    progress = BulkProgress(status, "Resetting")
+    try:
+        count = await db.reset_guild(ctx.guild.id, progress)
+    except sqlite3.Error as e:
+        await progress.failed(e)
+        return
+    
+    embed = discord.Embed(
+        title="🔄 Server Reset",
+        description=f"Reset **{count:,}** users to {INITIAL_BALANCE} coins",
+        color=0x00ff00
+    )
+    embed.set_footer(text=f"Completed in {time.perf_counter() - started:.1f}s")
+    await status.edit(content=None, embed=embed)
+
+@commands.command(name='perf', hidden=True)
+@has_admin_role()
+async def perf(ctx, minutes: int = 10):
+    """Show the slowest commands and database calls of the last N minutes (Admin only)"""
+    minutes = max(1, min(minutes, PERF_WINDOW_MINUTES))
+    rows = latency.summary(minutes)
+    
+    embed = discord.Embed(
+        title="⏱️ Performance",
+        description=f"Top offenders by total time over the last {minutes} minute(s)",
+        color=0x0099ff
+    )
+    if not rows:
+        embed.add_field(name="No Data", value="Nothing recorded yet", inline=False)
+    
+    for row in rows[:10]:
+        embed.add_field(
+            name=row['name'],
+            value=f"{row['count']} calls, total {row['total'] * 1000:.0f} ms\n"
+                  f"p50 {row['p50'] * 1000:.1f} | p95 {row['p95'] * 1000:.1f} | "
+                  f"p99 {row['p99'] * 1000:.1f} | max {row['max'] * 1000:.1f} ms",
+            inline=False
+        )
+    
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    recent = [entry for entry in list(slow_queries) if entry[0] >= cutoff]
+    if recent:
+        lines = [f"`{elapsed * 1000:.0f} ms` {description[:150]}" for _, elapsed, description in recent[-5:]]
+        embed.add_field(name=f"🐢 Slow queries ({len(recent)})", value="\n".join(lines)[:1024], inline=False)
+    
+    await ctx.send(embed=embed)
+
+@commands.command(name='export', hidden=True)
+@has_admin_role()
+async def export_guild(ctx, fmt: str = "ndjson"):
+    """Export this server's balances and game history as gzip'd NDJSON or CSV (Admin only)"""
+    fmt = fmt.lower()
+    if fmt not in GuildExporter.FORMATS:
+        await ctx.send(f"❌ Format must be one of: {', '.join(GuildExporter.FORMATS)}")
+        return
+    
+    status = await ctx.send("📦 Exporting server data...")
+    with tempfile.TemporaryDirectory(prefix="casino-export-") as directory:
+        try:
+            files = await db.export_guild(ctx.guild.id, directory, fmt)
+        except (sqlite3.Error, RuntimeError, OSError) as e:
+            await status.edit(content=f"❌ Export failed: {e}")
+            return
+        paths = [path for dataset in files.values() for path in dataset]
+        # One file per message keeps every upload under the size limit
+        for path in paths:
+            await ctx.send(file=discord.File(path, filename=os.path.basename(path)))
+    
+    embed = discord.Embed(
+        title="📦 Export Complete",
+        description=f"Sent {len(paths)} file(s) in {fmt.upper()} format",
+        color=0x00ff00
+    )
+    for dataset, dataset_paths in files.items():
+        embed.add_field(name=dataset.title(), value=f"{len(dataset_paths)} file(s)", inline=True)
+    await status.edit(content=None, embed=embed)
+
+@commands.command(name='config', hidden=True)
+@has_admin_role()
+async def guild_config(ctx, setting: Optional[str] = None, value: Optional[str] = None):
+    """
+    Show or change this server's settings (Admin only)
+    Usage: !config | !config <setting> <value> | !config <setting> default | !config reset
+    """
+    if setting is not None:
+        setting = setting.lower()
+        try:
+            if setting == "reset":
+                settings = await db.update_settings(ctx.guild.id, {name: None for name in GuildSettings.FIELDS})
+            elif value is None:
+                await ctx.send(f"❌ Usage: `{BOT_PREFIX}config <setting> <value>` or `{BOT_PREFIX}config <setting> default`")
+                return
+            elif value.lower() == "default":
+                settings = await db.update_settings(ctx.guild.id, {setting: None})
+            else:
+                settings = await db.update_settings(ctx.guild.id, {setting: GuildSettings.parse(setting, value)})
+        except ValueError as e:
+            embed = discord.Embed(title="❌ Invalid Setting", description=str(e), color=0xff0000)
+            await ctx.send(embed=embed)
+            return
+        title = "⚙️ Settings Updated"
+    else:
+        settings = db.settings(ctx.guild.id)
+        title = "⚙️ Server Settings"
+    
+    lines = []
+    for name in GuildSettings.FIELDS:
+        marker = " *(custom)*" if name in settings.overrides else ""
+        lines.append(f"`{name}` = **{getattr(settings, name)}**{marker}")
+    embed = discord.Embed(title=title, description="\n".join(lines), color=0x00ff00)
+    embed.set_footer(text=f"Version {settings.version} | {BOT_PREFIX}config <setting> <value|default>")
+    await ctx.send(embed=embed)
+
+@commands.command(name='backup', hidden=True)
+@has_admin_role()
+async def backup_database(ctx):
+    """Take a verified snapshot of the database now (Admin only)"""
+    status = await ctx.send("💾 Backing up the database...")
+    try:
+        results = await db.backup()
+    except (sqlite3.Error, RuntimeError, OSError) as e:
+        embed = discord.Embed(title="❌ Backup Failed", description=str(e), color=0xff0000)
+        await status.edit(content=None, embed=embed)
+        return
+    
+    embed = discord.Embed(
+        title="💾 Backup Complete",
+        description=f"{len(results)} snapshot(s) written and verified",
+        color=0x00ff00
+    )
+    for result in results:
+        embed.add_field(
+            name=os.path.basename(result["path"]),
+            value=f"{result['bytes'] / 1024 / 1024:.1f} MiB in {result['seconds']:.1f}s, "
+                  f"{len(result['removed'])} old snapshot(s) removed",
+            inline=False
+        )
+    await status.edit(content=None, embed=embed)
+
+# Commands registered on the bot by create_bot()
+BOT_COMMANDS = (balance, stats, leaderboard, rank, coin_flip, dice_roll, slots, help_command, game_list, bot_info,
+                give_money, reset_user, give_role, give_many, reset_all, perf, export_guild, guild_config,
+                backup_database)
+
+def create_bot() -> CasinoBot:
+    """Build the client with its commands and event handlers, and the components it runs on"""
+    global bot, db, games, economy, health_server, dispatcher
+    intents = discord.Intents.default()
+    intents.message_content = True
+    # Privileged: login fails unless the intent is also enabled for the application in the Developer Portal
+    intents.members = MEMBERS_INTENT
+    # giverole chunks the guild it needs on demand, so large guilds are not all downloaded at login
+    bot = CasinoBot(command_prefix=BOT_PREFIX, intents=intents, help_command=None,
+                    shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, chunk_guilds_at_startup=False)
+    for handler in (on_ready, on_guild_join, on_command_completion, on_command_error):
+        bot.event(handler)
+    bot.before_invoke(start_command_timer)
+    bot.after_invoke(stop_command_timer)
+    for command in BOT_COMMANDS:
+        bot.add_command(command)
+    
+    db = create_storage()
+    games = GamblingGames(settings=db.settings)
+    economy = Economy(db)
+    health_server = HealthServer(bot, db)
+    dispatcher = OutboundDispatcher()
+    return bot
+
+# --- Load Benchmark ---
+"""
+Offline load testing of the command handlers, no Discord connection needed
+"""
+class FakeUser:
+    """Stand-in for discord.User / discord.Member with the attributes the handlers use"""
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = self.display_name = f"player{user_id}"
+        self.avatar = None
+        self.default_avatar = SimpleNamespace(url="https://cdn.discordapp.com/embed/avatars/0.png")
+        self.roles = []
+        self.guild_permissions = SimpleNamespace(administrator=False)
+        self.bot = False
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, members: Dict[int, FakeUser], channel_rate: int = 0):
+        self.id = guild_id
+        self.name = f"Guild {guild_id}"
+        self._members = members
+        # Each guild has one channel; a bucket makes its sends wait like discord.py does on a 429
+        self.channel_limit = RateBucket(channel_rate, DISPATCH_PER) if channel_rate else None
+    
+    def get_member(self, user_id: int) -> Optional[FakeUser]:
+        return self._members.get(user_id)
 
-#flask server
-app = Flask('')
 
-@app.route('/')
+class FakeBot:
+    """Stand-in for the client: knows the benchmark's users and never calls the Discord API"""
+    def __init__(self, members: Dict[int, FakeUser]):
+        self._members = members
+    
+    def get_user(self, user_id: int) -> Optional[FakeUser]:
+        return self._members.get(user_id)
+    
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        user = self._members.get(user_id)
+        if user is None:
+            raise LookupError(f"Unknown user {user_id}")
+        return user
+
+
+class FakeContext:
+    """Minimal commands.Context: records sends instead of talking to Discord"""
+    def __init__(self, author: FakeUser, guild: FakeGuild, command_name: str, send_latency: float = 0.0,
+                 bot: Optional[FakeBot] = None):
+        self.author = author
+        self.guild = guild
+        self.bot = bot
+        self.channel = SimpleNamespace(id=guild.id)
+        self.command = SimpleNamespace(name=command_name, qualified_name=command_name)
+        self.send_latency = send_latency
+        self.sent = 0
+    
+    async def send(self, content=None, **kwargs):
+        limit = self.guild.channel_limit
+        if limit is not None:
+            delay = limit.delay()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = limit.delay()
+            limit.take()
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent += 1
+        return SimpleNamespace(id=0, content=content, embed=kwargs.get('embed'))
+
+
+class LoadBenchmark:
+    """
+    Drives the command handlers against a temporary database with fake
+    users and guilds, then reports throughput and latency percentiles.
+    The module-level db/economy/games are swapped out for the duration, and
+    handlers get a FakeBot, so neither DATABASE_FILE nor the Discord client
+    is touched.
+    """
+    def __init__(self, users: int = 1000, guilds: int = 10, concurrency: int = 50, commands_total: int = 20000,
+                 mix: Dict[str, int] = BENCHMARK_MIX, bet: int = MIN_BET, send_latency: float = 0.0,
+                 channel_rate: int = 0, seed: int = 0, engine: str = "sqlite"):
+        if engine not in ("sqlite", "memory"):
+            raise ValueError(f"Unknown engine {engine!r}")
+        self.users = users
+        self.guilds = guilds
+        self.concurrency = concurrency
+        self.commands_total = commands_total
+        self.mix = mix
+        self.bet = bet
+        self.send_latency = send_latency
+        self.channel_rate = channel_rate
+        self.seed = seed
+        self.engine = engine
+    
+    @contextmanager
+    def _components(self, database):
+        module = globals()
+        saved = {name: module[name] for name in ('db', 'economy', 'games', 'dispatcher')}
+        module['db'] = database
+        module['economy'] = Economy(database)
+        module['games'] = GamblingGames(RNGProvider("seeded", self.seed), settings=database.settings)
+        # The dispatcher assumes the same limit as the simulated channels
+        module['dispatcher'] = OutboundDispatcher(rate=self.channel_rate or 10**9)
+        try:
+            yield
+        finally:
+            module.update(saved)
+    
+    def _handler(self, name: str, ctx: FakeContext):
+        """Coroutine invoking the command callback the way discord.py would"""
+        if name == "flip":
+            return coin_flip.callback(ctx, self.bet, "heads", 1)
+        if name == "dice":
+            return dice_roll.callback(ctx, self.bet, 6, 1)
+        if name == "slots":
+            return slots.callback(ctx, self.bet, 1)
+        if name == "balance":
+            return balance.callback(ctx, None)
+        if name == "stats":
+            return stats.callback(ctx, None)
+        if name == "leaderboard":
+            return leaderboard.callback(ctx)
+        raise ValueError(f"Unknown command: {name}")
+    
+    async def run(self) -> Dict[str, Any]:
+        rng = random.Random(self.seed)
+        members = {user_id: FakeUser(user_id) for user_id in range(1, self.users + 1)}
+        guilds = [FakeGuild(guild_id, members, self.channel_rate) for guild_id in range(1, self.guilds + 1)]
+        client = FakeBot(members)
+        names = list(self.mix)
+        plan = rng.choices(names, weights=[self.mix[name] for name in names], k=self.commands_total)
+        
+        with tempfile.TemporaryDirectory(prefix="casino-bench-") as workdir:
+            if self.engine == "memory":
+                database = MemoryStorage(checkpoint_file=None)
+            else:
+                database = Database(os.path.join(workdir, "bench.db"))
+            for command in COOLDOWN_POLICIES:
+                database.cooldowns.policies[command] = 0  # Measure the handlers, not the rate limits
+            await database.start()
+            
+            # Everyone starts rich enough to keep betting for the whole run
+            for guild in guilds:
+                await database.bulk_add_to_balance(guild.id, list(members), self.bet * self.commands_total)
+            
+            latencies: Dict[str, List[float]] = {name: [] for name in names}
+            errors: Dict[str, int] = {name: 0 for name in names}
+            queue = iter(plan)
+            
+            async def worker():
+                for name in queue:
+                    ctx = FakeContext(members[rng.randint(1, self.users)], rng.choice(guilds), name,
+                                      self.send_latency, client)
+                    started = time.perf_counter()
+                    try:
+                        await self._handler(name, ctx)
+                    except Exception as e:
+                        errors[name] += 1
+                        if errors[name] == 1:
+                            print(f"{name} failed: {e!r}")
+                    latencies[name].append(time.perf_counter() - started)
+            
+            with self._components(database):
+                started = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+                elapsed = time.perf_counter() - started
+                # Replies queued by the dispatcher are delivered after the handlers return
+                outbound = globals()['dispatcher']
+                await outbound.drain()
+                delivered = time.perf_counter() - started
+                await outbound.close()
+                await database.shutdown()
+        
+        def percentiles(samples: List[float]) -> Dict[str, float]:
+            if not samples:
+                return {}
+            ordered = sorted(samples)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+            return {'count': len(ordered), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95),
+                    'p99_ms': pick(0.99), 'max_ms': ordered[-1] * 1000}
+        
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'config': {'engine': self.engine, 'users': self.users, 'guilds': self.guilds, 'concurrency': self.concurrency,
+                       'commands': self.commands_total, 'send_latency_ms': self.send_latency * 1000,
+                       'channel_rate': self.channel_rate, 'write_behind': SETTLEMENT_WRITE_BEHIND},
+            'elapsed_s': elapsed,
+            'delivered_s': delivered,
+            'messages': {'dispatched': outbound.sent, 'coalesced_results': outbound.coalesced},
+            'commands_per_second': self.commands_total / elapsed,
+            'overall': percentiles([sample for samples in latencies.values() for sample in samples]),
+            'commands': {name: percentiles(samples) for name, samples in latencies.items()},
+            'errors': errors
+        }
+    
+    @staticmethod
+    def format_report(result: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> str:
+        lines = [f"{result['config']['commands']:,} commands in {result['elapsed_s']:.2f}s: "
+                 f"{result['commands_per_second']:,.0f} commands/s"]
+        if previous:
+            change = result['commands_per_second'] / previous['commands_per_second'] - 1
+            lines[0] += f" ({change:+.1%} vs {previous.get('label') or previous['timestamp']})"
+        if 'messages' in result:
+            lines.append(f"Replies delivered after {result['delivered_s']:.2f}s: "
+                         f"{result['messages']['dispatched']:,} dispatched, "
+                         f"{result['messages']['coalesced_results']:,} results coalesced")
+        
+        lines.append(f"{'command':<12} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+        rows = [('overall', result['overall'], sum(result['errors'].values()))]
+        rows += [(name, stats, result['errors'][name]) for name, stats in result['commands'].items()]
+        for name, stats, error_count in rows:
+            if not stats:
+                continue
+            lines.append(f"{name:<12} {stats['count']:>7} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+                         f"{stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f} {error_count:>7}")
+        return "\n".join(lines)
+
+
+def run_benchmark_cli(argv: List[str]) -> int:
+    """CLI: python bot.py bench [--users N] [--guilds N] [--concurrency N] [--commands N]"""
+    parser = argparse.ArgumentParser(prog="bot.py bench", description="Offline load test of the command handlers")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50, help="commands in flight at once")
+    parser.add_argument("--commands", type=int, default=20000, help="total commands to run")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="simulated ctx.send latency in ms")
+    parser.add_argument("--channel-rate", type=int, default=0,
+                        help=f"simulated channel limit, messages per {DISPATCH_PER:g}s (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=("sqlite", "memory"), default=STORAGE_ENGINE,
+                        help="storage engine under test (memory runs without disk I/O)")
+    parser.add_argument("--label", default=None, help="name for this run in the results file")
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_FILE, help="JSON file results are appended to")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+    
+    benchmark = LoadBenchmark(users=args.users, guilds=args.guilds, concurrency=args.concurrency,
+                              commands_total=args.commands, send_latency=args.send_latency / 1000,
+                              channel_rate=args.channel_rate, seed=args.seed, engine=args.engine)
+    result = asyncio.run(benchmark.run())
+    result['label'] = args.label
+    
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output, encoding='utf-8') as f:
+            history = json.load(f)
+    # Compare against the last run with the same workload
+    previous = next((run for run in reversed(history) if run['config'] == result['config']), None)
+    print(LoadBenchmark.format_report(result, previous))
+    
+    if not args.no_save:
+        history.append(result)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2)
+        print(f"Saved to {args.output}")
+    return 1 if any(result['errors'].values()) else 0
 
-def home():
-    return "bot is alive"
+# Run the bot
+# IMPORTANT: Replace "YOUR_BOT_TOKEN_HERE" with your actual Discord bot token.
+# The token provided in the original context is likely a placeholder or expired.
 
-def run():
-    app.run(host='0.0.0.0' , port=8080)
+t= os.getenv("key")
 
-Thread(target=run).start()
+def main(argv: List[str]):
+    """Run the bot, or one of the offline tools: python bot.py simulate|bench|rebalance|export|migrate|backup ..."""
+    if argv and argv[0] == "simulate":
+        sys.exit(run_simulation_cli(argv[1:]))
+    if argv and argv[0] == "bench":
+        sys.exit(run_benchmark_cli(argv[1:]))
+    if argv and argv[0] == "rebalance":
+        sys.exit(run_rebalance_cli(argv[1:]))
+    if argv and argv[0] == "export":
+        sys.exit(run_export_cli(argv[1:]))
+    if argv and argv[0] == "migrate":
+        sys.exit(run_migrate_cli(argv[1:]))
+    if argv and argv[0] == "backup":
+        sys.exit(run_backup_cli(argv[1:]))
+    
+    create_bot().run(t)
 
-bot.run(t)
\ No newline at end of file
+if __name__ == "__main__":
+    main(sys.argv[1:])
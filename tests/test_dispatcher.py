@@ -0,0 +1,122 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import bot
+
+
+class FakeChannel:
+    """Destination with an async send() that records what Discord would have received"""
+    def __init__(self, channel_id=1, failures=()):
+        self.id = channel_id
+        self.calls = []
+        self.failures = list(failures)
+
+    async def send(self, content=None, embed=None):
+        self.calls.append((time.monotonic(), content, embed))
+        if self.failures:
+            raise self.failures.pop(0)
+        return SimpleNamespace(id=len(self.calls), content=content, embed=embed)
+
+
+def result(n):
+    return discord.Embed(title=f"Game {n}", description=f"Result {n}")
+
+
+def test_busy_channel_coalesces_game_results():
+    async def scenario():
+        dispatcher = bot.OutboundDispatcher(rate=1, per=0.05, coalesce_max=3)
+        channel = FakeChannel()
+        futures = [dispatcher.post(channel, embed=result(n), coalesce=True) for n in range(6)]
+        messages = await asyncio.gather(*futures)
+
+        assert len(channel.calls) == 2
+        assert dispatcher.sent == 2
+        assert dispatcher.coalesced == 6
+        combined = channel.calls[0][2]
+        assert [field.name for field in combined.fields] == ["Game 0", "Game 1", "Game 2"]
+        assert messages[0] is messages[2] and messages[3] is messages[5]
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_plain_replies_are_never_merged():
+    async def scenario():
+        dispatcher = bot.OutboundDispatcher(rate=1, per=0.01)
+        channel = FakeChannel()
+        await asyncio.gather(*(dispatcher.post(channel, content=f"reply {n}") for n in range(3)))
+
+        assert [call[1] for call in channel.calls] == ["reply 0", "reply 1", "reply 2"]
+        assert dispatcher.coalesced == 0
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("error", [
+    discord.RateLimited(0.2),
+    discord.HTTPException(SimpleNamespace(status=429, headers={'Retry-After': '0.2'}), "Too Many Requests"),
+])
+def test_429_waits_for_retry_after_then_resends(error):
+    async def scenario():
+        dispatcher = bot.OutboundDispatcher(rate=5, per=0.01)
+        channel = FakeChannel(failures=[error])
+        message = await dispatcher.post(channel, content="hello")
+
+        (first, _, _), (second, content, _) = channel.calls
+        assert second - first >= 0.2
+        assert content == "hello" and message.content == "hello"
+        assert dispatcher.sent == 1
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_other_send_errors_fail_only_their_message():
+    async def scenario():
+        dispatcher = bot.OutboundDispatcher(rate=5, per=0.01)
+        error = discord.HTTPException(SimpleNamespace(status=403), "Missing Permissions")
+        channel = FakeChannel(failures=[error])
+        failed = dispatcher.post(channel, content="first")
+        sent = dispatcher.post(channel, content="second")
+
+        with pytest.raises(discord.HTTPException):
+            await failed
+        assert (await sent).content == "second"
+        await dispatcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_drains_queued_messages():
+    async def scenario():
+        dispatcher = bot.OutboundDispatcher(rate=1, per=0.02)
+        channels = [FakeChannel(1), FakeChannel(2)]
+        futures = [dispatcher.post(channel, content=f"reply {n}") for n in range(4) for channel in channels]
+        await dispatcher.close(timeout=5)
+
+        assert all(future.done() and not future.cancelled() for future in futures)
+        assert [len(channel.calls) for channel in channels] == [4, 4]
+        assert dispatcher.depth == 0
+        assert dispatcher._channels == {}
+
+    asyncio.run(scenario())
+
+
+def test_close_drops_what_the_timeout_cannot_cover():
+    async def scenario():
+        dispatcher = bot.OutboundDispatcher(rate=1, per=10)
+        channel = FakeChannel()
+        first = dispatcher.post(channel, content="now")
+        later = dispatcher.post(channel, content="in ten seconds")
+        await dispatcher.close(timeout=0.05)
+
+        assert (await first).content == "now"
+        assert later.cancelled()
+        assert len(channel.calls) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+import bot
+
+
+def play(games, guild_id, rounds):
+    outcomes = []
+    for i in range(rounds):
+        outcomes.append(games.coin_flip(bot.MIN_BET, "heads", guild_id))
+        outcomes.append(games.dice_roll(bot.MIN_BET, i % 6 + 1, guild_id))
+        outcomes.append(games.slots(bot.MIN_BET, guild_id))
+        outcomes.append(games.dice_roll_batch(bot.MIN_BET, 6, 5, guild_id))
+    return outcomes
+
+
+def test_seeded_games_replay_across_a_block_refill():
+    guild_id = 42
+    first = bot.GamblingGames(bot.RNGProvider("seeded", seed=1234))
+    second = bot.GamblingGames(bot.RNGProvider("seeded", seed=1234))
+
+    outcomes = play(first, guild_id, 600)
+    assert first.rng.position(guild_id) > bot.RNG_BLOCK_SIZE
+    assert play(second, guild_id, 600) == outcomes
+
+    # Restarting the stream replays the session on the same provider
+    first.rng.reset(guild_id)
+    assert play(first, guild_id, 600) == outcomes
+
+
+def test_seeded_stream_ignores_block_size_and_prefetch():
+    reference = bot.BufferedRNG(seed=7)
+    expected = [reference.random() for _ in range(100)]
+    for rng in (bot.BufferedRNG(seed=7, block_size=5), bot.BufferedRNG(seed=7, block_size=5, background=True)):
+        assert [rng.random() for _ in range(100)] == expected
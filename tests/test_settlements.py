@@ -0,0 +1,39 @@
+import asyncio
+
+import bot
+
+
+def test_warm_row_bets_do_not_read_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "SETTLEMENT_WRITE_BEHIND", True)
+
+    bet = bot.MIN_BET
+
+    async def scenario():
+        database = bot.Database(str(tmp_path / "casino.db"))
+        economy = bot.Economy(database)
+        await database.start()
+        try:
+            await database.add_to_balance(1, 1, bet * 30)
+            await database.get_user_balance(1, 1)  # Warms the cache
+
+            reads = []
+            read = database.pool.read
+
+            async def counting_read(fn, *args):
+                reads.append(fn)
+                return await read(fn, *args)
+
+            database.pool.read = counting_read
+            for _ in range(20):
+                valid, error = await economy.check_valid_bet(1, 1, bet)
+                assert valid, error
+                await economy.process_game_result(1, 1, bet, False, 0, game="flip")
+                # Each flush drops the projection, like the cooldown gap between real games
+                await database.settlements.flush()
+
+            assert reads == []
+            assert await database.get_user_balance(1, 1) == bet * 10
+        finally:
+            await database.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,24 @@
+import pytest
+
+import bot
+
+pytest.importorskip("numpy")
+
+
+def test_check_passes_with_a_fixed_seed(capsys):
+    assert bot.run_simulation_cli(["--check", "--rounds", "200000", "--seed", "1234", "--workers", "1"]) == 0
+    assert "House edge not established" not in capsys.readouterr().out
+
+
+def test_simulated_rtp_matches_the_exact_rtp():
+    simulator = bot.RTPSimulator(workers=1, seed=1234)
+    for game in simulator.GAMES:
+        result = simulator.run(game, 200_000)
+        assert result['ci_low'] <= result['exact_rtp'] <= result['ci_high'], game
+
+
+def test_check_fails_without_a_house_edge(monkeypatch, capsys):
+    monkeypatch.setattr(bot, "COIN_FLIP_MULTIPLIER", 2.5)
+    assert bot.run_simulation_cli(["--check", "--games", "flip", "--rounds", "200000", "--seed", "1234",
+                                   "--workers", "1"]) == 1
+    assert "House edge not established for: flip" in capsys.readouterr().out